@@ -19,19 +19,26 @@ dbt.adapters.factory.get_adapter = lambda config: config.adapter
 
 from jinjat.core.dbt.config import ConfigInterface, YamlHandler, JINJAT_REQUEST_VAR_NAME, RAW_CODE, COMPILED_CODE, \
     has_jinja, T
-from jinjat.core.models import DbtQueryRequestContext, DbtAdapterExecutionResult, DbtAdapterCompilationResult
+from jinjat.core.models import DbtQueryRequestContext, DbtAdapterExecutionResult, DbtAdapterCompilationResult, \
+    ConnectionPoolConfig, ExecutorConfig, SlowQueryLogConfig, TracingConfig
+import asyncio
 import os
 import threading
 import time
 import uuid
 from collections import OrderedDict
+from contextlib import contextmanager
 from copy import copy
 from functools import lru_cache
 from functools import partial
 from typing import (
     Any,
     Callable,
+    FrozenSet,
+    Iterator,
+    Set,
     Tuple,
+    Union,
 )
 from typing import (
     Dict,
@@ -44,16 +51,37 @@ from dbt.adapters.base import BaseRelation
 from dbt.adapters.factory import Adapter, get_adapter_class_by_name
 from dbt.config.runtime import RuntimeConfig
 from dbt.context.providers import generate_runtime_model_context
-from dbt.contracts.connection import AdapterResponse
-from dbt.contracts.graph.manifest import ManifestNode, MaybeNonSource, MaybeParsedSource
+from dbt.contracts.connection import AdapterResponse, Connection, ConnectionState, Identifier
+from dbt.contracts.graph.manifest import ManifestNode, MaybeNonSource, MaybeParsedSource, Disabled
 from dbt.flags import set_from_args
 from dbt.node_types import NodeType
-from dbt.parser.manifest import ManifestLoader, process_node, MANIFEST_FILE_NAME
+from dbt.contracts.graph.nodes import SeedNode
+from dbt.parser.manifest import ManifestLoader, MANIFEST_FILE_NAME, invalid_target_fail_unless_test
+from dbt.parser.search import FileBlock
 from dbt.parser.sql import SqlBlockParser, SqlMacroParser
 from dbt.task.sql import SqlCompileRunner, SqlExecuteRunner
 from dbt.adapters.factory import register_adapter
+from dbt.clients.jinja import get_environment, get_template, render_template
 
+from jinjat.core.dbt.request_fields import RequestFieldsAnalyzer, RequestField, get_request_key
 from jinjat.core.log_controller import logger
+from jinjat.core.util.admission import AdmissionLimiter
+from jinjat.core.util.cache import LRUCache
+from jinjat.core.util.cancellation import CancellationStats
+from jinjat.core.util.concurrency import SingleFlight
+from jinjat.core.util.executor import BoundedExecutor, ExecutorQueueFull
+from jinjat.core.util.pool import ConnectionPool, PoolTimeout
+from jinjat.core.util.slow_queries import SlowQueryLog
+from jinjat.core.util.sql import get_sqlglot_dialect, get_explain_query, parse_explain_row_estimate, limit_query, \
+    wrap_query
+from jinjat.core.util.tracing import Tracer, Span, trace_span
+
+
+class DetachedSqlBlockParser(SqlBlockParser):
+    """A `SqlBlockParser` which returns the parsed node without adding it to the manifest"""
+
+    def add_result_node(self, block: FileBlock, node: ManifestNode):
+        pass
 
 
 class DbtProject:
@@ -61,6 +89,9 @@ class DbtProject:
     dbt-core. The adapter attribute is the primary interface for the dbt adapter"""
 
     ADAPTER_TTL = 3600
+    COMPILED_SQL_CACHE_SIZE = 1024
+    ROW_COUNT_CACHE_SIZE = 4096
+    LIMITED_SQL_CACHE_SIZE = 1024
 
     def __init__(
             self,
@@ -92,6 +123,33 @@ class DbtProject:
         # Tracks internal state version
         self._version: int = 1
         self.mutex = threading.Lock()
+        self._templates: Dict[str, DbtTemplate] = {}
+        self._request_fields_analyzer: Optional[Tuple[int, RequestFieldsAnalyzer]] = None
+        self.compiled_sql_cache = LRUCache(self.COMPILED_SQL_CACHE_SIZE)
+        self.result_caches: Dict[str, LRUCache] = {}
+        # (version, compiled sql, estimate) -> (row count, is estimated)
+        self.row_count_cache = LRUCache(self.ROW_COUNT_CACHE_SIZE, ttl=60)
+        # (compiled sql, limit, offset) -> compiled sql with the limit and offset applied
+        self.limited_sql_cache = LRUCache(self.LIMITED_SQL_CACHE_SIZE)
+        # limits of the analysis responses, set from the project config of jinjat
+        self.default_limit: Optional[int] = None
+        self.max_limit: Optional[int] = None
+        self.inflight_queries = SingleFlight()
+        self.connection_pool = self._create_connection_pool(ConnectionPoolConfig())
+        # compilation and queries run on separate workers so that slow queries don't hold up compilation
+        self.compile_executor = BoundedExecutor("compile", 4, 100)
+        self.query_executor = BoundedExecutor("query", 10, 100)
+        # cancels the running statements, it has its own worker as the query workers may all be running them
+        self.cancel_executor = BoundedExecutor("cancel", 1)
+        self._pending_cancels: Set[asyncio.Future] = set()
+        # requests in flight of all the analyses, replaced when the analysis routes are created
+        self.admission_limiter = AdmissionLimiter("the project", None)
+        self.cancellations = CancellationStats()
+        self.slow_query_log = SlowQueryLog(0)
+        # traces the analysis requests when tracing is enabled
+        self.tracer: Optional[Tracer] = None
+        # Per-thread parsers used for compilation so that concurrent requests share no mutable state
+        self._local = threading.local()
         # atexit.register(lambda dbt_project: dbt_project.adapter.connections.cleanup_all, self)
 
     def get_adapter(self):
@@ -186,6 +244,11 @@ class DbtProject:
             )
         return self._sql_compiler
 
+    @property
+    def sql_dialect(self) -> Optional[str]:
+        """sqlglot dialect of the adapter, None if sqlglot doesn't support it"""
+        return get_sqlglot_dialect(self.config.credentials.type)
+
     def _verify_connection(self, adapter: Adapter) -> Adapter:
         """Verification for adapter + profile. Used as a passthrough,
         ie: `self.adapter = _verify_connection(get_adapter(...))`
@@ -211,6 +274,168 @@ class DbtProject:
         logger().info("Heartbeat received for %s", self.project_name)
         return True
 
+    async def adapter_probe_pooled(self) -> bool:
+        """`adapter_probe` on a connection of the connection pool, so that it neither blocks the event loop nor
+        opens a connection of its own. False if no connection is available either."""
+
+        def _probe() -> bool:
+            try:
+                # the connection bound by `run_pooled`, `adapter.connection_named` would close it
+                self.adapter.debug_query()
+            except Exception:
+                return False
+            return True
+
+        try:
+            return await self.run_pooled(_probe)
+        except (PoolTimeout, ExecutorQueueFull):
+            return False
+
+    def _get_connection_pool_settings(self, config: ConnectionPoolConfig) -> dict:
+        return dict(validate_connection=partial(self._validate_connection, config.validation_query)
+                    if config.validation_query else None,
+                    min_size=config.min_size or 0, max_size=config.max_size or 1,
+                    idle_timeout=config.idle_timeout, checkout_timeout=config.checkout_timeout,
+                    validation_interval=config.validation_interval or 0)
+
+    def _create_connection_pool(self, config: ConnectionPoolConfig) -> ConnectionPool[Connection]:
+        return ConnectionPool(partial(self.open_connection, "jinjat-pool"), self.close_connection,
+                              **self._get_connection_pool_settings(config))
+
+    def configure_connection_pool(self, config: ConnectionPoolConfig) -> None:
+        """Reconfigures the connection pool with `config` and opens its `min_size` connections, the connections
+        opened before are closed, the checked out ones once they're released."""
+        self.connection_pool.configure(**self._get_connection_pool_settings(config))
+        self.connection_pool.prewarm()
+
+    def configure_slow_query_log(self, config: SlowQueryLogConfig) -> None:
+        """Replaces the slow query log with one that is configured with `config`, the logged entries are dropped"""
+        self.slow_query_log.close()
+        self.slow_query_log = SlowQueryLog.create(config.max_entries or 0, bool(config.file))
+
+    def configure_tracing(self, config: TracingConfig) -> None:
+        """Replaces the tracer with one that is configured with `config`, None if tracing is disabled"""
+        if self.tracer is not None:
+            self.tracer.close()
+        self.tracer = Tracer.create(config.exporter, config.max_spans or 0) if config.enabled else None
+
+    def configure_executors(self, compile_config: ExecutorConfig, query_config: ExecutorConfig) -> None:
+        """Replaces the compile and query executors, the jobs already submitted to the previous ones still run"""
+        self.compile_executor.shutdown()
+        self.query_executor.shutdown()
+        self.compile_executor = BoundedExecutor("compile", compile_config.max_workers or 1, compile_config.max_queue)
+        self.query_executor = BoundedExecutor("query", query_config.max_workers or 1, query_config.max_queue)
+
+    async def compile_async(self, query: Union[str, "DbtTemplate"],
+                            ctx: Optional[DbtQueryRequestContext]) -> DbtAdapterCompilationResult:
+        """`compile_query` on the compile executor"""
+        return await self.compile_executor.run(self.fn_threaded_conn(self.compile_query, query, ctx))
+
+    def _validate_connection(self, validation_query: str, connection: Connection) -> None:
+        with self._bind_thread_connection(connection):
+            self.adapter_execute(validation_query)
+
+    @contextmanager
+    def _bind_thread_connection(self, connection: Connection) -> Iterator[Connection]:
+        """Makes the connection the one that dbt uses on this thread, e.g. in `adapter.execute`"""
+        connections = self.adapter.connections
+        key = connections.get_thread_identifier()
+        with connections.lock:
+            previous = connections.thread_connections.get(key)
+            connections.thread_connections[key] = connection
+        try:
+            yield connection
+        finally:
+            with connections.lock:
+                if previous is None:
+                    connections.thread_connections.pop(key, None)
+                else:
+                    connections.thread_connections[key] = previous
+
+    def release_connection(self, connection: Connection, discard: bool = False) -> None:
+        """Returns a connection checked out with `run_pooled` to the pool"""
+        self.connection_pool.release(connection, discard=discard or connection.state != ConnectionState.OPEN)
+
+    def cancel_statement(self, connection: Connection) -> None:
+        """Cancels the statement running on the connection from another thread. The driver cancels it in place when
+        it can, e.g. psycopg2 and DuckDB, otherwise `adapter.connections.cancel` does which may kill the session."""
+        try:
+            handle = connection.handle
+            if callable(getattr(handle, 'cancel', None)):
+                handle.cancel()
+            elif self.adapter.type() == 'duckdb':
+                # the `cancel` of dbt-duckdb is a no-op, the connection wraps a single DuckDB cursor
+                handle.cursor().interrupt()
+            else:
+                self.adapter.connections.cancel(connection)
+        except Exception as e:
+            logger().warning(f"Unable to cancel the running statement: {e}")
+            self.cancellations.record("failed_cancels")
+            return
+        self.cancellations.record("cancelled_statements")
+
+    async def run_pooled(self, fn: Callable[..., T], *args, keep_connection: bool = False) -> T:
+        """Runs the job in the query executor on a connection that is borrowed from the connection pool, so that the
+        number of open connections doesn't grow with the number of threads. The connection is checked out on
+        the event loop and returned once the job is done, `keep_connection` leaves it checked out for the caller
+        to release with `release_connection` unless the job fails. Cancelling the caller cancels the statement
+        that the job is running, or the job itself if no worker picked it up yet."""
+        connection = await self.connection_pool.acquire_async()
+        lock = threading.Lock()
+        state = {"started": False, "finished": False, "abandoned": False, "kept": False, "cancelled": False}
+
+        def _with_conn() -> Optional[T]:
+            with lock:
+                if state["abandoned"]:
+                    # the caller is gone and the connection is already released
+                    return None
+                state["started"] = True
+            failed = True
+            try:
+                with self._bind_thread_connection(connection):
+                    result = fn(*args)
+                failed = False
+                return result
+            finally:
+                with lock:
+                    state["finished"] = True
+                    state["kept"] = keep_connection and not failed and not state["abandoned"]
+                    # the session of a cancelled statement isn't reused, e.g. DuckDB may interrupt the next statement
+                    discard = state["cancelled"]
+                if not state["kept"]:
+                    self.release_connection(connection, discard=discard)
+
+        job = asyncio.ensure_future(self.query_executor.run(_with_conn))
+        # the caller may be gone by the time the job fails
+        job.add_done_callback(lambda done: done.cancelled() or done.exception())
+        try:
+            # the job isn't cancelled along with the caller as it can't be interrupted while it uses the connection
+            return await asyncio.shield(job)
+        except ExecutorQueueFull:
+            self.release_connection(connection)
+            raise
+        except asyncio.CancelledError:
+            with lock:
+                state["abandoned"] = True
+                release = state["kept"] or not state["started"]
+                state["cancelled"] = state["started"] and not state["finished"]
+            if release:
+                self.release_connection(connection)
+            elif state["cancelled"]:
+                cancel = asyncio.ensure_future(self.cancel_executor.run(self.cancel_statement, connection,
+                                                                        bounded=False))
+                self._pending_cancels.add(cancel)
+                cancel.add_done_callback(self._cancel_done)
+            raise
+
+    def _cancel_done(self, cancel: asyncio.Future) -> None:
+        self._pending_cancels.discard(cancel)
+        error = None if cancel.cancelled() else cancel.exception()
+        if error is not None:
+            # `cancel_statement` records the failures of the driver, this is a failure to run it at all
+            logger().warning(f"Unable to cancel the running statement: {error}")
+            self.cancellations.record("failed_cancels")
+
     def fn_threaded_conn(self, fn: Callable[..., T], *args, **kwargs) -> Callable[..., T]:
         """Used for jobs which are intended to be submitted to a thread pool,
         the 'master' thread should always have an available connection for the duration of
@@ -248,6 +473,17 @@ class DbtProject:
         except Exception as parse_error:
             self.config = _config_pointer
             raise parse_error
+        self._version += 1
+        if reinit:
+            # the pooled connections are opened with the previous adapter and target, the checked out ones are
+            # closed once they're released
+            self.connection_pool.close_all()
+            self.connection_pool.prewarm()
+        self.compiled_sql_cache.clear()
+        self.row_count_cache.clear()
+        self.limited_sql_cache.clear()
+        for result_cache in self.result_caches.values():
+            result_cache.clear()
         self.write_manifest_artifact()
 
     def get_manifest_file_path(self):
@@ -286,12 +522,49 @@ class DbtProject:
         )
 
     def get_server_node(self, sql: str, node_name="name"):
-        """Get a node for SQL execution against adapter"""
-        self._clear_node(node_name)
-        sql_node = self.sql_parser.parse_remote(sql, node_name)
-        process_node(self.config, self.dbt, sql_node)
+        """Get a node for SQL execution against adapter. The node is never added to the shared manifest
+        so concurrent calls don't race with each other"""
+        sql_node = self._get_detached_sql_parser().parse_remote(sql, node_name)
+        self._process_node_dependencies(sql_node)
         return sql_node
 
+    def _get_detached_sql_parser(self) -> DetachedSqlBlockParser:
+        if getattr(self._local, "manifest", None) is not self.dbt:
+            self._local.sql_parser = DetachedSqlBlockParser(self.config, self.dbt, self.config)
+            self._local.manifest = self.dbt
+        return self._local.sql_parser
+
+    def _process_node_dependencies(self, node: ManifestNode) -> None:
+        """Resolves refs and sources of a node that is not in the manifest, the equivalent of
+        `process_node` from `dbt.parser.manifest` without the `manifest.update_node` calls"""
+        if isinstance(node, SeedNode):
+            return
+        for ref in node.refs:
+            target_model = self.dbt.resolve_ref(ref.name, ref.package, ref.version, self.project_name,
+                                                node.package_name)
+            if target_model is None or isinstance(target_model, Disabled):
+                invalid_target_fail_unless_test(
+                    node=node,
+                    target_name=ref.name,
+                    target_kind="node",
+                    target_package=ref.package,
+                    target_version=ref.version,
+                    disabled=isinstance(target_model, Disabled),
+                )
+                continue
+            node.depends_on.nodes.append(target_model.unique_id)
+        for source_name, table_name in node.sources:
+            target_source = self.dbt.resolve_source(source_name, table_name, self.project_name, node.package_name)
+            if target_source is None or isinstance(target_source, Disabled):
+                invalid_target_fail_unless_test(
+                    node=node,
+                    target_name=f"{source_name}.{table_name}",
+                    target_kind="source",
+                    disabled=isinstance(target_source, Disabled),
+                )
+                continue
+            node.depends_on.nodes.append(target_source.unique_id)
+
     @lru_cache(maxsize=10)
     def get_node_by_path(self, path: str):
         """Find an existing node given relative file path."""
@@ -310,11 +583,136 @@ class DbtProject:
         make_schema_fn({'name': '__test_schema_2'})"""
         return partial(self.adapter.execute_macro, macro_name=macro_name, manifest=self.dbt)
 
+    def get_template(self, node: ManifestNode) -> "DbtTemplate":
+        """Get the precompiled template of a manifest node, the template is recompiled lazily
+        when the manifest version changes"""
+        template = self._templates.get(node.unique_id)
+        if template is None:
+            template = self._templates.setdefault(node.unique_id, DbtTemplate(self, node))
+        return template
+
+    def find_request_fields(self, node: ManifestNode) -> Optional[FrozenSet[RequestField]]:
+        """The `jinjat_request` fields the node's template reads, None if the rendered SQL may change
+        regardless of the request, e.g. when it calls `run_query`"""
+        analyzer = self._request_fields_analyzer
+        if analyzer is None or analyzer[0] != self._version:
+            analyzer = (self._version, RequestFieldsAnalyzer(get_environment(node), self.dbt))
+            self._request_fields_analyzer = analyzer
+        return analyzer[1].find_request_fields(getattr(node, RAW_CODE))
+
     def adapter_execute(
             self, sql: str, auto_begin: bool = False, fetch: bool = False
     ) -> Tuple[AdapterResponse, agate.Table]:
         """Wraps adapter.execute. Execute SQL against database"""
-        return self.adapter.execute(sql, auto_begin, fetch)
+        with self._trace_query(sql) as span:
+            response, table = self.adapter.execute(sql, auto_begin, fetch)
+            if span is not None:
+                # e.g. the query id of Snowflake to look the query up in the query history
+                for attribute, value in (("db.response_code", response.code),
+                                         ("db.query_id", getattr(response, "query_id", None))):
+                    if value is not None:
+                        span.set_attribute(attribute, value)
+            return response, table
+
+    @contextmanager
+    def _trace_query(self, sql: str) -> Iterator[Optional[Span]]:
+        """Traces the query as a span of the request and adds the `traceparent` of the span to the query comment of
+        the thread through the query header of the adapter, so that the query in the history of the warehouse can be
+        matched with the trace"""
+        with trace_span("adapter.execute", {"db.system": self.config.credentials.type, "db.statement": sql}) as span:
+            query_header = self.adapter.connections.query_header
+            if span is None or query_header is None:
+                yield span
+                return
+            comment = query_header.comment
+            previous, append = comment.query_comment, comment.append
+            traceparent = f"traceparent={span.traceparent}"
+            comment.set(f"{previous.strip()} {traceparent}" if previous else traceparent, append)
+            try:
+                yield span
+            finally:
+                comment.set(previous, append)
+
+    def open_connection(self, name: str) -> Connection:
+        """Opens a connection that is not part of dbt's thread keyed connection map,
+        the caller owns it and closes it with `close_connection`"""
+        connection_manager = self.adapter.connections
+        connection = Connection(
+            type=Identifier(connection_manager.TYPE),
+            name=name,
+            state=ConnectionState.INIT,
+            transaction_open=False,
+            handle=None,
+            credentials=self.config.credentials,
+        )
+        return connection_manager.open(connection)
+
+    def close_connection(self, connection: Connection) -> None:
+        self.adapter.connections.close(connection)
+
+    def open_cursor(self, raw_sql: str, compiled_sql: str) -> Tuple[Connection, Any]:
+        """Execute already compiled SQL statement on the connection of the thread and return the connection with
+        the DB-API cursor of the adapter so that the result can be fetched in batches rather than loaded
+        into an `agate.Table`. Some adapters share a single cursor per connection, so run it with
+        `run_pooled(..., keep_connection=True)` to use a connection that no one else does until it's released."""
+        logger().debug(f"Executing:\n ${compiled_sql}")
+        connection = self.adapter.connections.get_thread_connection()
+        with self._trace_query(compiled_sql) as span:
+            query_header = self.adapter.connections.query_header
+            # unlike `adapter.execute`, the cursor doesn't add the query comment
+            sql = query_header.add(compiled_sql) if span is not None and query_header is not None else compiled_sql
+            try:
+                cursor = connection.handle.cursor()
+                cursor.execute(sql)
+            except Exception as e:
+                raise ExecuteSqlFailure(raw_sql, compiled_sql, e)
+        return connection, cursor
+
+    def resolve_limit(self, limit: Optional[int]) -> Optional[int]:
+        """The requested limit, or the default limit if there is none, capped at the max limit"""
+        if limit is None:
+            limit = self.default_limit
+        if self.max_limit is not None and (limit is None or limit > self.max_limit):
+            limit = self.max_limit
+        return limit
+
+    def limit_compiled_sql(self, compiled_sql: str, limit: Optional[int], offset: Optional[int] = None) -> str:
+        """Applies the limit and offset to the compiled SQL statement. The SQL is rewritten with sqlglot in the
+        dialect of the adapter, the `limit_query` macro is only called for the dialects or statements that sqlglot
+        can't handle. The rewritten SQL is cached as the same analysis is limited the same way on every request."""
+        if limit is None and not offset:
+            return compiled_sql
+        cache_key = (compiled_sql, limit, offset)
+        limited_sql = self.limited_sql_cache.get(cache_key)
+        if limited_sql is not None:
+            return limited_sql
+        limited_sql = limit_query(compiled_sql, self.sql_dialect, limit, offset)
+        if limited_sql is None:
+            if offset or limit is None:
+                # the macro has no offset
+                limited_sql = wrap_query(compiled_sql, self.sql_dialect, limit=limit, offset=offset)
+            else:
+                limited_sql = self.execute_macro('limit_query', {"sql": compiled_sql, "limit": limit})
+        self.limited_sql_cache.put(cache_key, limited_sql)
+        return limited_sql
+
+    def count_rows(self, raw_sql: str, compiled_sql: str) -> int:
+        """Exact row count of the result of the compiled SQL statement"""
+        count_query = self.execute_macro('get_row_count_query', {"sql": compiled_sql})
+        return int(self.execute_compiled_sql(raw_sql, count_query, True).table.rows[0][0])
+
+    def estimate_row_count(self, compiled_sql: str) -> Optional[int]:
+        """Row count estimated by the query planner, None if the adapter has no estimates or the planner fails"""
+        explain_query = get_explain_query(compiled_sql, self.sql_dialect)
+        if explain_query is None:
+            return None
+        try:
+            _, table = self.adapter_execute(explain_query, fetch=True)
+        except Exception as e:
+            logger().debug(f"Unable to estimate the row count: {e}")
+            return None
+        plan = '\n'.join(str(value) for row in table.rows for value in row if value is not None)
+        return parse_explain_row_estimate(plan, self.sql_dialect)
 
     def execute_macro(
             self,
@@ -326,16 +724,27 @@ class DbtProject:
 
     def execute_sql(self, raw_sql: str, ctx: DbtQueryRequestContext, fetch: bool = True) -> DbtAdapterExecutionResult:
         """Execute dbt SQL statement against database"""
-        # if no jinja chars then these are synonymous
-        compiled_sql = raw_sql
-        if has_jinja(raw_sql):
-            # jinja found, compile it
-            try:
-                compiled_node = self.compile_sql(raw_sql, ctx)
-                compiled_sql = compiled_node.compiled_sql
-            except Exception as e:
-                raise ExecuteSqlFailure(raw_sql, None, e)
-        logger().debug(f"Executing:\n ${raw_sql}")
+        compiled_sql = self.compile_query(raw_sql, ctx).compiled_sql
+        return self.execute_compiled_sql(raw_sql, compiled_sql, fetch)
+
+    def compile_query(self, query: Union[str, "DbtTemplate"],
+                      ctx: Optional[DbtQueryRequestContext]) -> DbtAdapterCompilationResult:
+        """Compile either an ad-hoc dbt SQL statement or a precompiled template,
+        compilation errors are raised as `ExecuteSqlFailure`"""
+        raw_sql = query.raw_sql if isinstance(query, DbtTemplate) else query
+        try:
+            if isinstance(query, DbtTemplate):
+                return query.render(ctx)
+            # if no jinja chars then these are synonymous
+            if not has_jinja(raw_sql):
+                return DbtAdapterCompilationResult(raw_sql, raw_sql, None)
+            return self.compile_sql(raw_sql, ctx)
+        except Exception as e:
+            raise ExecuteSqlFailure(raw_sql, None, e)
+
+    def execute_compiled_sql(self, raw_sql: str, compiled_sql: str, fetch: bool = True) -> DbtAdapterExecutionResult:
+        """Execute already compiled SQL statement against database"""
+        logger().debug(f"Executing:\n ${compiled_sql}")
         try:
             table = self.adapter_execute(compiled_sql, fetch=fetch)
         except Exception as e:
@@ -347,28 +756,15 @@ class DbtProject:
             compiled_sql
         )
 
-    def compile_sql(self, raw_sql: str, ctx: Optional[DbtQueryRequestContext] = None,
-                    retry: int = 3) -> DbtAdapterCompilationResult:
+    def compile_sql(self, raw_sql: str, ctx: Optional[DbtQueryRequestContext] = None) -> DbtAdapterCompilationResult:
         """Creates a node with `get_server_node` method. Compile generated node.
-        Has a retry built in because even uuidv4 cannot gaurantee uniqueness at the speed
-        in which we can call this function concurrently. A retry significantly increases the stability"""
-        temp_node_id = str(uuid.uuid4())
-        try:
-            node = self.compile_node(self.get_server_node(raw_sql, temp_node_id), ctx)
-        except Exception as exc:
-            if retry > 0:
-                return self.compile_sql(raw_sql, ctx, retry - 1)
-            raise exc
-        else:
-            return node
-        finally:
-            self._clear_node(temp_node_id)
+        The node lives only for the duration of the call so it's safe to call this function concurrently"""
+        return self.compile_node(self.get_server_node(raw_sql, str(uuid.uuid4())), ctx)
 
     def compile_node(self, node: ManifestNode, ctx: Optional[DbtQueryRequestContext]) -> DbtAdapterCompilationResult:
         """Compiles existing node."""
-        self.sql_compiler.node = node
         compiler = self.adapter.get_compiler()
-        compiled_node = compiler.compile_node(self.sql_compiler.node,
+        compiled_node = compiler.compile_node(node,
                                               self.dbt,
                                               {JINJAT_REQUEST_VAR_NAME: ctx} if ctx is not None else {},
                                               write=False)
@@ -378,10 +774,6 @@ class DbtProject:
             compiled_node,
         )
 
-    def _clear_node(self, name="name"):
-        """Removes the statically named node created by `execute_sql` and `compile_sql` in `dbt.lib`"""
-        self.dbt.nodes.pop(f"{NodeType.SqlOperation}.{self.project_name}.{name}", None)
-
     def get_relation(self, database: str, schema: str, name: str) -> Optional[BaseRelation]:
         """Wrapper for `adapter.get_relation`"""
         return self.adapter.get_relation(database, schema, name)
@@ -441,6 +833,104 @@ class DbtProject:
         )
 
 
+class DbtTemplate:
+    """The Jinja template of a manifest node that is compiled once per manifest version.
+    Rendering it only evaluates the compiled template with the `jinjat_request` context, skipping the
+    `parse_remote` and `process_node` round trip of `DbtProject.compile_sql`."""
+
+    def __init__(self, project: DbtProject, node: ManifestNode):
+        self.project = project
+        self.unique_id = node.unique_id
+        self._node = node
+        self._version: Optional[int] = None
+        self._template = None
+        self._request_fields: Optional[FrozenSet[RequestField]] = None
+        self._lock = threading.Lock()
+        # dbt macros are bound to the context they are generated with, so each thread renders
+        # with its own context rather than a copy of a shared one
+        self._local = threading.local()
+
+    @property
+    def node(self) -> ManifestNode:
+        return self.prepare()[1]
+
+    @property
+    def raw_sql(self) -> str:
+        return getattr(self.node, RAW_CODE)
+
+    @property
+    def query_params(self) -> Optional[Set[str]]:
+        """Names of the query parameters the template reads, None if it may read any of them"""
+        _, node, _ = self.prepare()
+        if not has_jinja(getattr(node, RAW_CODE)):
+            return set()
+        request_fields = self._request_fields
+        if request_fields is None or () in request_fields or ('query',) in request_fields:
+            return None
+        return {str(path[1]) for path in request_fields if len(path) > 1 and path[0] == 'query'}
+
+    def prepare(self) -> Tuple[int, ManifestNode, Any]:
+        """Compiles the template if the manifest changed since the last compilation"""
+        version = self.project._version
+        if self._version == version:
+            return self._version, self._node, self._template
+        with self._lock:
+            if self._version != version:
+                node = self.project.dbt.nodes.get(self.unique_id, self._node)
+                raw_sql = getattr(node, RAW_CODE)
+                if has_jinja(raw_sql) and not self._has_ephemeral_dependency(node):
+                    self._template = get_template(raw_sql, {}, node)
+                else:
+                    self._template = None
+                self._request_fields = self.project.find_request_fields(node) if has_jinja(raw_sql) else None
+                self._node = node
+                self._version = version
+            return self._version, self._node, self._template
+
+    def _has_ephemeral_dependency(self, node: ManifestNode) -> bool:
+        # ephemeral refs are injected as CTEs by the dbt compiler, the template alone can't render them
+        nodes = self.project.dbt.nodes
+        return any(nodes[dependency].is_ephemeral_model for dependency in node.depends_on.nodes
+                   if dependency in nodes)
+
+    def _get_context(self, version: int, node: ManifestNode) -> Dict[str, Any]:
+        if getattr(self._local, "version", None) != version:
+            self._local.context = self.project.generate_runtime_model_context(node)
+            self._local.version = version
+        return self._local.context
+
+    def render(self, ctx: Optional[DbtQueryRequestContext]) -> DbtAdapterCompilationResult:
+        """Render the template with the given request context. The rendered SQL is cached by the values of
+        the request fields the template reads, so a template that reads nothing from the request
+        is rendered once per manifest version"""
+        version, node, template = self.prepare()
+        raw_sql = getattr(node, RAW_CODE)
+        if not has_jinja(raw_sql):
+            return DbtAdapterCompilationResult(raw_sql, raw_sql, node)
+
+        request_fields = self._request_fields
+        cache_key = None
+        if request_fields is not None:
+            cache_key = (self.unique_id, version, get_request_key(request_fields, ctx))
+            compiled_sql = self.project.compiled_sql_cache.get(cache_key)
+            if compiled_sql is not None:
+                return DbtAdapterCompilationResult(raw_sql, compiled_sql, node)
+
+        if template is None:
+            compiled_sql = self.project.compile_sql(raw_sql, ctx).compiled_sql
+        else:
+            context = self._get_context(version, node)
+            if ctx is not None:
+                context[JINJAT_REQUEST_VAR_NAME] = ctx
+            else:
+                context.pop(JINJAT_REQUEST_VAR_NAME, None)
+            compiled_sql = render_template(template, context, node)
+
+        if cache_key is not None:
+            self.project.compiled_sql_cache.put(cache_key, compiled_sql)
+        return DbtAdapterCompilationResult(raw_sql, compiled_sql, node)
+
+
 class DbtTarget(BaseModel):
     target: Optional[str] = None
     profiles_dir: Optional[str] = None
@@ -510,6 +1000,10 @@ class DbtProjectContainer:
         if project is None:
             return
         project.clear_caches()
+        project.connection_pool.close_all()
+        project.slow_query_log.close()
+        if project.tracer is not None:
+            project.tracer.close()
         project.adapter.connections.cleanup_all()
         self._projects.pop(project_name)
         if self._default_project == project_name:
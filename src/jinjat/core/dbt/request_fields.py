@@ -0,0 +1,145 @@
+import json
+from collections.abc import Mapping
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+import jinja2
+from dbt.contracts.graph.manifest import Manifest
+from dbt.contracts.graph.nodes import Macro
+from jinja2 import meta, nodes
+
+from jinjat.core.dbt.config import JINJAT_REQUEST_VAR_NAME
+
+RequestField = Tuple[str, ...]
+
+# Context members whose output only depends on the manifest and the project config
+DETERMINISTIC_CONTEXT_NAMES = {
+    "ref", "source", "var", "env_var", "config", "this", "target", "model", "graph", "project_name", "schema",
+    "database", "execute", "return", "exceptions", "log", "fromjson", "tojson", "fromyaml", "toyaml", "zip",
+    "set", "set_strict", "is_incremental", "builtins", "loop", "caller", "varargs", "kwargs", "super", "self",
+}
+# Jinja globals whose output changes on every call, the other globals are deterministic
+NON_DETERMINISTIC_GLOBAL_NAMES = {"lipsum"}
+
+
+class RequestFieldsAnalyzer:
+    """Finds the `jinjat_request` fields a template reads by walking its Jinja AST and the AST of the macros
+    it calls. Templates that call anything non-deterministic such as `run_query` or `adapter` can't be analysed
+    and `find_request_fields` returns None for them."""
+
+    def __init__(self, environment: jinja2.Environment, manifest: Manifest):
+        self.environment = environment
+        self.macros_by_name: Dict[str, List[Macro]] = {}
+        self.macros_by_package: Dict[str, Dict[str, List[Macro]]] = {}
+        for macro in manifest.macros.values():
+            self.macros_by_name.setdefault(macro.name, []).append(macro)
+            self.macros_by_package.setdefault(macro.package_name, {}).setdefault(macro.name, []).append(macro)
+        self._macro_fields: Dict[str, Optional[FrozenSet[RequestField]]] = {}
+
+    def find_request_fields(self, source: str) -> Optional[FrozenSet[RequestField]]:
+        """Returns the request field paths read by the template, an empty tuple path means the whole request"""
+        try:
+            ast = self.environment.parse(source)
+        except jinja2.TemplateSyntaxError:
+            return None
+        return self._analyze(ast)
+
+    def _analyze_macro(self, macro: Macro) -> Optional[FrozenSet[RequestField]]:
+        if macro.unique_id not in self._macro_fields:
+            # mark as unknown first so that recursive macros are not cacheable
+            self._macro_fields[macro.unique_id] = None
+            self._macro_fields[macro.unique_id] = self.find_request_fields(macro.macro_sql)
+        return self._macro_fields[macro.unique_id]
+
+    def _analyze_macros(self, macros: List[Macro], fields: Set[RequestField]) -> bool:
+        for macro in macros:
+            macro_fields = self._analyze_macro(macro)
+            if macro_fields is None:
+                return False
+            fields.update(macro_fields)
+        return True
+
+    def _analyze(self, ast: nodes.Template) -> Optional[FrozenSet[RequestField]]:
+        undeclared = meta.find_undeclared_variables(ast)
+        fields: Set[RequestField] = set()
+        for name_node, parents in _iter_names(ast):
+            name = name_node.name
+            if name_node.ctx != "load":
+                continue
+            if name in NON_DETERMINISTIC_GLOBAL_NAMES:
+                # globals are never reported as undeclared
+                return None
+            if name not in undeclared:
+                continue
+            if name == JINJAT_REQUEST_VAR_NAME:
+                fields.add(_get_field_path(name_node, parents))
+            elif name in DETERMINISTIC_CONTEXT_NAMES or name in self.environment.globals:
+                continue
+            elif name in self.macros_by_name:
+                if not self._analyze_macros(self.macros_by_name[name], fields):
+                    return None
+            elif name in self.macros_by_package:
+                parent = parents[-1] if parents else None
+                if not isinstance(parent, nodes.Getattr) or parent.attr not in self.macros_by_package[name]:
+                    return None
+                if not self._analyze_macros(self.macros_by_package[name][parent.attr], fields):
+                    return None
+            else:
+                return None
+        return frozenset(fields)
+
+
+def _iter_names(node: nodes.Node, parents: Tuple[nodes.Node, ...] = ()):
+    if isinstance(node, nodes.Name):
+        yield node, parents
+    for child in node.iter_child_nodes():
+        yield from _iter_names(child, parents + (node,))
+
+
+def _get_field_path(name_node: nodes.Name, parents: Tuple[nodes.Node, ...]) -> RequestField:
+    path = []
+    child = name_node
+    idx = len(parents) - 1
+    while idx >= 0:
+        parent = parents[idx]
+        if isinstance(parent, nodes.Getitem) and parent.node is child and isinstance(parent.arg, nodes.Const):
+            path.append(parent.arg.value)
+        elif isinstance(parent, nodes.Getattr) and parent.node is child:
+            call = parents[idx - 1] if idx > 0 else None
+            if isinstance(call, nodes.Call) and call.node is parent:
+                # `query.get('key', default)` reads a single key, any other method call reads the whole value
+                if parent.attr == "get" and call.args and isinstance(call.args[0], nodes.Const):
+                    path.append(call.args[0].value)
+                    child = call
+                    idx -= 2
+                    continue
+                break
+            path.append(parent.attr)
+        else:
+            break
+        child = parent
+        idx -= 1
+    return tuple(path)
+
+
+def _lookup_field(value, path: RequestField):
+    for part in path:
+        if value is None:
+            return None
+        if isinstance(value, Mapping):
+            value = value.get(part)
+        elif isinstance(value, (list, tuple)) and isinstance(part, int):
+            value = value[part] if -len(value) <= part < len(value) else None
+        else:
+            value = getattr(value, part, None)
+    return value
+
+
+def get_request_key(fields: FrozenSet[RequestField], ctx) -> Tuple[Tuple[RequestField, str], ...]:
+    """Builds a hashable key from the values of the given request fields"""
+    if ctx is None:
+        return ()
+    return tuple(sorted(
+        ((path, json.dumps(_lookup_field(ctx.dict() if path == () else ctx, path), sort_keys=True, default=str))
+         for path in fields),
+        key=repr
+    ))
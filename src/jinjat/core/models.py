@@ -1,6 +1,7 @@
 import json
+import operator
+import sys
 import typing
-from collections import OrderedDict
 from copy import deepcopy
 from typing import (
     Any,
@@ -14,23 +15,116 @@ import jsonref
 from dbt.contracts.connection import AdapterResponse
 from dbt.contracts.graph.manifest import ManifestNode
 from fastapi.openapi.models import Parameter, Schema
-from jsonschema import validate
+from jsonschema import Draft7Validator
 from openapi_schema_pydantic import OpenAPI
 from openapi_schema_pydantic import Operation
 from pydantic import BaseModel, validator
+from starlette import status
 from starlette.requests import Request
 
+from jinjat.core.schema.validator import validate_request_body
+from jinjat.core.util.api import JinjatErrorContainer, JinjatError, JinjatErrorCode
+from jinjat.core.util.tracing import trace_span
+
 LIMIT_QUERY_PARAM = '_limit'
+SHAPE_QUERY_PARAM = '_shape'
+# `objects` is the default, a list with an object per row
+RESPONSE_SHAPES = ['objects', 'columns', 'rows']
 
 
 class CORS(BaseModel):
     allowed_origins: Optional[List[str]]
 
 
+class ConnectionPoolConfig(BaseModel):
+    # connections opened at startup and kept open while idle
+    min_size: Optional[int] = 1
+    max_size: Optional[int] = 10
+    # seconds
+    idle_timeout: Optional[int] = 300
+    checkout_timeout: Optional[int] = 30
+    # runs on the connections that have been idle longer than `validation_interval` seconds before they're used
+    validation_query: Optional[str] = 'select 1'
+    validation_interval: Optional[int] = 30
+
+    @validator('max_size')
+    def validate_max_size(cls, max_size):
+        if max_size is not None and max_size < 1:
+            raise ValueError("`max_size` must be at least 1")
+        return max_size
+
+
+class ExecutorConfig(BaseModel):
+    max_workers: Optional[int] = 4
+    # jobs waiting for a worker, the requests over it are rejected
+    max_queue: Optional[int] = 100
+
+    @validator('max_workers')
+    def validate_max_workers(cls, max_workers):
+        if max_workers is not None and max_workers < 1:
+            raise ValueError("`max_workers` must be at least 1")
+        return max_workers
+
+
+class AdmissionConfig(BaseModel):
+    # requests in flight, the requests over it wait in line
+    max_in_flight: Optional[int]
+    # seconds a request waits in line before it's rejected with 503
+    max_queue_wait: Optional[float]
+    # seconds in the `Retry-After` header of the rejected requests, defaults to `max_queue_wait`
+    retry_after: Optional[int]
+
+
+class SlowQueryLogConfig(BaseModel):
+    # seconds an analysis request takes to be logged
+    threshold: Optional[float] = 1
+    # slowest requests kept for each analysis
+    max_entries: Optional[int] = 20
+    # also appends the slow requests to `slow_queries.jsonl` in `~/.jinjat/logs`
+    file: Optional[bool] = False
+
+
+class LoopMonitorConfig(BaseModel):
+    # seconds the event loop is blocked for to log the stall along with the stack blocking it, disabled when unset
+    threshold: Optional[float] = 0.1
+    # seconds between the heartbeats measuring the lag of the event loop
+    interval: Optional[float] = 0.05
+
+
+class TracingConfig(BaseModel):
+    # traces the analysis requests, continuing the trace of the `traceparent` header of the request
+    enabled: Optional[bool] = False
+    # `memory` keeps the last `max_spans` spans for `/admin/traces`, `file` also appends them to `traces.jsonl` in
+    # `~/.jinjat/logs`
+    exporter: Optional[typing.Literal['memory', 'file']] = 'memory'
+    max_spans: Optional[int] = 10000
+
+
 class JinjatProjectConfig(BaseModel):
     cors: Optional[CORS] = CORS(allowed_origins=["*"])
     max_limit: Optional[int] = 50000
     default_limit: Optional[int] = 500
+    # seconds the total row counts of the paginated analyses are cached for
+    row_count_ttl: Optional[int] = 60
+    connection_pool: Optional[ConnectionPoolConfig] = ConnectionPoolConfig()
+    # workers rendering the SQL of the requests
+    compile_executor: Optional[ExecutorConfig] = ExecutorConfig(max_workers=4)
+    # workers running the queries and fetching their results, the connection pool bounds the concurrent queries
+    query_executor: Optional[ExecutorConfig] = ExecutorConfig(max_workers=10)
+    # limits of all the analysis requests of the project, the analyses can override `max_queue_wait` and
+    # `retry_after` and have their own `max_in_flight`
+    admission: Optional[AdmissionConfig] = AdmissionConfig(max_in_flight=100, max_queue_wait=5)
+    # seconds an analysis request runs before it's cancelled along with its query, the analyses can override it
+    timeout: Optional[float] = 300
+    # allows the `_profile` query parameter which returns the call tree of the request sampled across all the threads
+    # instead of the response, it exposes the internals of the server so only enable it on private deployments
+    profiling: Optional[bool] = False
+    # slowest analysis requests, see `/admin/slow-queries`
+    slow_query_log: Optional[SlowQueryLogConfig] = SlowQueryLogConfig()
+    # stalls of the event loop, e.g. blocking calls in the async routes, see `jinjat_event_loop_*` in `/admin/metrics`
+    loop_monitor: Optional[LoopMonitorConfig] = LoopMonitorConfig()
+    # spans of the analysis requests, the queries are tagged with the `traceparent` of their span in the query comment
+    tracing: Optional[TracingConfig] = TracingConfig()
     refine: Optional[dict]
     openapi: Optional[dict]
 
@@ -73,21 +167,65 @@ class ResponseSchema(BaseModel):
     transform: Optional[str]
 
 
+class CacheConfig(BaseModel):
+    # seconds
+    ttl: Optional[int] = 60
+    max_entries: Optional[int] = 1000
+    # bytes, estimated from the fetched values
+    max_size: Optional[int] = 64 * 1024 * 1024
+    # request headers that are part of the cache key in addition to the compiled SQL
+    vary_on: Optional[List[str]] = []
+
+
+class RowCountConfig(BaseModel):
+    # `estimate` uses the row estimate of the query planner when the adapter has one, `exact` runs a count query
+    mode: Optional[typing.Literal['exact', 'estimate']] = 'exact'
+    # seconds, defaults to `row_count_ttl` of the project
+    ttl: Optional[int]
+
+
+class PaginationConfig(BaseModel):
+    # columns of a unique and non-null sort key of the result
+    key: List[str]
+    order: Optional[typing.Literal['asc', 'desc']] = 'asc'
+
+    @validator('key', pre=True)
+    def validate_key(cls, key):
+        return [key] if isinstance(key, str) else key
+
+
 class JinjatAnalysisConfig(BaseModel):
     cors: Optional[bool]
     openapi: Optional[Operation] = Operation()
     method: Optional[typing.Union[str, list[str]]]
     fetch: Optional[bool] = True
+    cache: Optional[CacheConfig]
+    pagination: Optional[PaginationConfig]
+    row_count: Optional[RowCountConfig]
+    admission: Optional[AdmissionConfig]
+    # seconds, defaults to `timeout` of the project
+    timeout: Optional[float]
+    # seconds, defaults to `slow_query_log.threshold` of the project
+    slow_query_threshold: Optional[float]
 
     request: Optional[RequestSchema] = RequestSchema()
     response: Optional[ResponseSchema] = ResponseSchema()
 
 
-async def generate_dbt_context_from_request(request: Request, openapi: dict = None,
+async def generate_dbt_context_from_request(request: Request, request_validator: Draft7Validator = None,
                                             transform_request: typing.Callable[[dict], dict] = None):
     if request.method in ['PATCH', 'PUT', 'POST']:
-        body = transform_request(await request.json())
-        validate(instance=body, schema=openapi)
+        with trace_span('request.parse'):
+            body = await request.json()
+        if request_validator is not None:
+            # the schema describes the body the client sends, the transform reshapes it for the analysis
+            with trace_span('request.validate'):
+                errors = validate_request_body(request_validator, body)
+            if errors:
+                raise JinjatErrorContainer(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, errors=errors)
+        if transform_request is not None:
+            with trace_span('request.transform'):
+                body = transform_request(body)
     else:
         body = None
     return DbtQueryRequestContext(method=request.method, body=body,
@@ -100,23 +238,119 @@ class DbtAdapterExecutionResult:
 
     def __init__(
             self, adapter_response: AdapterResponse, table: agate.Table, raw_sql: str, compiled_sql: str,
-            total_rows: Optional[int] = None,
+            total_rows: Optional[int] = None, total_rows_estimated: bool = False,
     ) -> None:
         self.adapter_response = adapter_response
         self.table = table
         self.raw_sql = raw_sql
         self.compiled_sql = compiled_sql
         self.total_rows = total_rows
+        self.total_rows_estimated = total_rows_estimated
+
+
+def estimate_table_size(table: agate.Table) -> int:
+    """Approximate memory footprint of the values of the table in bytes"""
+    return sys.getsizeof(table.rows) + sum(sys.getsizeof(value) for row in table.rows for value in row)
+
+
+def _identity(values: typing.Sequence[Any]) -> typing.Sequence[Any]:
+    return values
+
 
+def _to_float(values: typing.Sequence[Any]) -> List[Any]:
+    if None not in values:
+        return list(map(float, values))
+    return [None if value is None else float(value) for value in values]
 
-def _convert_table_to_dict(table: agate.Table, json_columns: List[str]):
-    output = []
-    json_funcs = [(lambda x: json.loads(col.jsonify(x))) if table.column_names[i] in json_columns else col.jsonify
-                  for i, col in enumerate(table.column_types)]
-    for row in table.rows:
-        values = tuple(json_funcs[i](d) for i, d in enumerate(row))
-        output.append(OrderedDict(zip(row.keys(), values)))
-    return output
+
+def _to_isoformat(values: typing.Sequence[Any]) -> List[Any]:
+    return [None if value is None else value.isoformat() for value in values]
+
+
+def _parse_json(values: typing.Sequence[Any]) -> List[Any]:
+    # each value is parsed on its own, joining them into a single array lets malformed values merge across cells
+    loads = json.loads
+    return [loads(value) if isinstance(value, str) else value for value in values]
+
+
+def _get_column_converter(column_type: agate.DataType, is_json: bool) -> typing.Callable:
+    """Returns a function converting all the values of a column with the same result as `column_type.jsonify`"""
+    jsonify = type(column_type).jsonify
+    if jsonify is agate.Number.jsonify:
+        convert = _to_float
+    elif jsonify is agate.Date.jsonify or jsonify is agate.DateTime.jsonify:
+        convert = _to_isoformat
+    elif jsonify is agate.Boolean.jsonify or (isinstance(column_type, agate.Text)
+                                             and jsonify is agate.DataType.jsonify):
+        convert = _identity
+    else:
+        convert = lambda values: [column_type.jsonify(value) for value in values]
+
+    if is_json:
+        return lambda values: _parse_json(convert(values))
+    return convert
+
+
+def _convert_table_to_columns(table: agate.Table, json_columns: List[str]) -> List[List[Any]]:
+    rows = [row.values() for row in table.rows]
+    return [_get_column_converter(column_type, name in json_columns)(list(map(operator.itemgetter(i), rows)))
+            for i, (name, column_type) in enumerate(zip(table.column_names, table.column_types))]
+
+
+def _convert_table_to_dict(table: agate.Table, json_columns: List[str]) -> List[dict]:
+    """Converts the table column by column rather than cell by cell, the rows are then zipped back together"""
+    column_names = table.column_names
+    columns = _convert_table_to_columns(table, json_columns)
+    if not columns:
+        return [{} for _ in table.rows]
+    return [dict(zip(column_names, row)) for row in zip(*columns)]
+
+
+def _get_json_columns(response_schema: Optional[dict]) -> List[str]:
+    if response_schema is not None and response_schema.get('type') == 'object':
+        return [key for (key, value) in response_schema.get('properties', {}).items()
+                if value.get('type') in ['array', 'object']]
+    return []
+
+
+def convert_result_data(result: 'DbtAdapterExecutionResult',
+                        transform_response: typing.Callable[[dict], dict] = None,
+                        response_schema: dict = None) -> Any:
+    """The rows of the result as JSON compatible values, with the response transform applied"""
+    result_dict = _convert_table_to_dict(result.table, _get_json_columns(response_schema))
+    if transform_response is not None:
+        result_dict = transform_response(result_dict)
+    return result_dict
+
+
+def get_response_shape(request: Request) -> str:
+    """Response shape requested via `_shape` query parameter or the `shape` parameter of the `Accept` header,
+    e.g. `Accept: application/json; shape=columns`"""
+    shape = request.query_params.get(SHAPE_QUERY_PARAM)
+    if shape is None:
+        for media_range in request.headers.get('accept', '').split(','):
+            for param in media_range.split(';')[1:]:
+                key, _, value = param.strip().partition('=')
+                if key == 'shape':
+                    shape = value.strip('"')
+    if shape is not None and shape not in RESPONSE_SHAPES:
+        raise JinjatErrorContainer(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            errors=[JinjatError(code=JinjatErrorCode.Unknown,
+                                message=f"Unknown response shape `{shape}`, expected one of {RESPONSE_SHAPES}")])
+    return shape or 'objects'
+
+
+def convert_result_shape(result: 'DbtAdapterExecutionResult', shape: str, response_schema: dict = None) -> dict:
+    """The rows of the result with the column metadata sent once, either column-oriented
+    (`{columns, data: {column: [...]}}`) or as arrays (`{columns, rows: [[...]]}`)"""
+    table = result.table
+    columns = _convert_table_to_columns(table, _get_json_columns(response_schema))
+    if shape == 'columns':
+        data = {"data": dict(zip(table.column_names, columns))}
+    else:
+        data = {"rows": list(zip(*columns)) if columns else [[] for _ in table.rows]}
+    return {"columns": _get_columns(table), **data}
 
 
 class JinjatAdapterResponse(BaseModel):
@@ -130,6 +364,10 @@ class JinjatColumn(BaseModel):
     type: str
 
 
+def _get_columns(table: agate.Table) -> List[JinjatColumn]:
+    return [JinjatColumn(name=column.name, type=column.data_type.__class__.__name__) for column in table.columns]
+
+
 class JinjatExecutionResult(BaseModel):
     """Interface for execution results, this keeps us 1 layer removed from dbt interfaces which may change"""
     request: DbtQueryRequestContext
@@ -144,20 +382,11 @@ class JinjatExecutionResult(BaseModel):
     def from_dbt(ctx: DbtQueryRequestContext, result: DbtAdapterExecutionResult,
                  transform_response: typing.Callable[[dict], dict] = None,
                  response_schema: dict = None) -> 'JinjatExecutionResult':
-        columns = [JinjatColumn(name=column.name, type=column.data_type.__class__.__name__) for column in
-                   result.table.columns]
+        columns = _get_columns(result.table)
         adapter_response = JinjatAdapterResponse(message=result.adapter_response._message,
                                                  code=result.adapter_response.code,
                                                  rows_affected=result.adapter_response.rows_affected)
-        if response_schema is not None and response_schema.get('type') == 'object':
-            json_columns = [key for (key, value) in response_schema.get('properties', {}).items()
-                            if value.get('type') in ['array', 'object']]
-        else:
-            json_columns = []
-
-        result_dict = _convert_table_to_dict(result.table, json_columns)
-        if transform_response is not None:
-            result_dict = transform_response(result_dict)
+        result_dict = convert_result_data(result, transform_response, response_schema)
         return JinjatExecutionResult(request=ctx, adapter_response=adapter_response, columns=columns,
                                      data=result_dict, raw_sql=result.raw_sql,
                                      compiled_sql=result.compiled_sql)
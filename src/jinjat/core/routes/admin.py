@@ -2,8 +2,9 @@ import asyncio
 import json
 import os.path
 from datetime import datetime
-from typing import Optional, Union
+from typing import Optional, Union, Tuple, Any
 
+from dbt.contracts.connection import Connection
 from fastapi import FastAPI
 from pydantic import BaseModel, Field
 from starlette import status
@@ -11,15 +12,21 @@ from starlette.background import BackgroundTasks
 from starlette.requests import Request
 from starlette.responses import Response
 
-from jinjat.core.dbt.dbt_project import DbtProjectContainer, DbtProject
+from jinjat.core.dbt.dbt_project import DbtProjectContainer, DbtProject, DbtTemplate
 from jinjat.core.exceptions import ExecuteSqlFailure
 from jinjat.core.models import JinjatExecutionResult, DbtAdapterExecutionResult, generate_dbt_context_from_request, \
-    DbtQueryRequestContext
+    DbtQueryRequestContext, estimate_table_size, RowCountConfig
 from jinjat.core.util.api import JinjatErrorContainer, JinjatError, JinjatErrorCode, DBT_PROJECT_HEADER, \
-    DBT_PROJECT_NAME, JSONAPIException
+    DBT_PROJECT_NAME, JSONAPIException, ORJSONResponse
+from jinjat.core.util.cache import LRUCache
+from jinjat.core.util.executor import ExecutorQueueFull
 from jinjat.core.util.jmespath import extract_jmespath
+from jinjat.core.util.loop_monitor import loop_monitor
+from jinjat.core.util.metrics import measure_phase, record_query, render_metrics, PROMETHEUS_CONTENT_TYPE
+from jinjat.core.util.pagination import KeysetPage
+from jinjat.core.util.pushdown import QueryPushdown, build_query
 
-app = FastAPI(redoc_url=None, docs_url=None, title="Admin API", version="0.1")
+app = FastAPI(redoc_url=None, docs_url=None, title="Admin API", version="0.1", default_response_class=ORJSONResponse)
 
 
 class JinjatCompileResult(BaseModel):
@@ -58,8 +65,11 @@ async def execute_manifest_query(
     if project is None:
         raise jinjat_project_not_found_error()
 
-    manifest_file = project.dbt.writable_manifest().to_dict()
-    result = extract_jmespath(jmespath, manifest_file, project)
+    def _query_manifest() -> Any:
+        return extract_jmespath(jmespath, project.dbt.writable_manifest().to_dict(), project)
+
+    # serializing the whole manifest takes long enough on large projects to stall the other requests
+    result = await project.compile_executor.run(_query_manifest)
     response.headers[DBT_PROJECT_HEADER] = project.config.version
     response.headers[DBT_PROJECT_NAME] = project.config.project_name
     return result
@@ -82,7 +92,7 @@ async def execute_sql(
         raise jinjat_project_not_found_error()
 
     try:
-        dbt_result = await _execute_jinjat_query(project, project.execute_sql, body.sql, body.request, body.limit)
+        dbt_result = await _execute_jinjat_query(project, body.sql, body.request, body.limit)
     except ExecuteSqlFailure as execution_err:
         raise JinjatErrorContainer(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -93,35 +103,131 @@ async def execute_sql(
             )]
         )
 
-    return JinjatExecutionResult.from_dbt(body.request, dbt_result)
+    # serialized as is rather than validated against the response model
+    return ORJSONResponse(JinjatExecutionResult.from_dbt(body.request, dbt_result))
+
+
+def _get_final_query(project: DbtProject, compiled_sql: str, limit: Optional[int], offset: Optional[int],
+                     page: Optional[KeysetPage], pushdown: Optional[QueryPushdown]) -> str:
+    if page is not None or pushdown is not None:
+        return build_query(compiled_sql, project.sql_dialect, limit, page, pushdown, offset)
+    return project.limit_compiled_sql(compiled_sql, limit, offset)
+
+
+async def _get_row_count(project: DbtProject, raw_sql: str, compiled_sql: str,
+                         row_count: Optional[RowCountConfig]) -> Tuple[int, bool]:
+    """Total row count of the compiled query and whether it's estimated. Counts are cached as users paging
+    through a result count the same query on every page."""
+    estimate = row_count is not None and row_count.mode == 'estimate'
+    count_key = (project._version, compiled_sql, estimate)
+    cached_count = project.row_count_cache.get(count_key)
+    if cached_count is not None:
+        return cached_count
+
+    total_rows = None
+    with measure_phase('count'):
+        if estimate:
+            total_rows = await project.run_pooled(project.estimate_row_count, compiled_sql)
+        if total_rows is not None:
+            count = (total_rows, True)
+        else:
+            count = (await project.run_pooled(project.count_rows, raw_sql, compiled_sql), False)
+    project.row_count_cache.put(count_key, count, ttl=row_count.ttl if row_count is not None else None)
+    return count
 
 
-async def _execute_jinjat_query(project: DbtProject, execute_function, query: str, ctx: DbtQueryRequestContext,
+async def _execute_jinjat_query(project: DbtProject, query: Union[str, DbtTemplate], ctx: DbtQueryRequestContext,
                                 limit: Optional[int], fetch: bool = True,
-                                include_total: bool = False) -> DbtAdapterExecutionResult:
-    if limit is not None:
-        final_query = project.execute_macro('limit_query', {"sql": query, "limit": limit})
-    else:
-        final_query = query
-
-    loop = asyncio.get_running_loop()
-
-    result = await loop.run_in_executor(
-        None, project.fn_threaded_conn(execute_function, final_query, ctx, fetch)
-    )
-    if include_total:
-        if limit is not None and len(result.table.rows) < limit:
-            size = len(result.table.rows)
+                                include_total: bool = False, result_cache: Optional[LRUCache] = None,
+                                cache_key: Tuple = (), coalesce: bool = False,
+                                page: Optional[KeysetPage] = None,
+                                row_count: Optional[RowCountConfig] = None,
+                                pushdown: Optional[QueryPushdown] = None,
+                                offset: Optional[int] = None) -> DbtAdapterExecutionResult:
+    """Compiles and executes the query. When `coalesce` is set, identical queries that are executed concurrently
+    share a single execution, only use it for queries without side effects. `page` selects a page of a keyset
+    paginated query and `pushdown` the filters, sort and fields requested by the client. The total row count
+    is queried concurrently on a separate connection."""
+    with measure_phase('compile'):
+        compiled = await project.compile_async(query, ctx)
+    rewrite_key = (page.cache_key if page is not None else None, pushdown.cache_key if pushdown is not None else None,
+                   offset)
+    if result_cache is not None:
+        cache_key = (project._version, compiled.compiled_sql, limit, fetch, include_total, rewrite_key, *cache_key)
+        cached_result = result_cache.get(cache_key)
+        if cached_result is not None:
+            return cached_result
+
+    def _execute() -> DbtAdapterExecutionResult:
+        with measure_phase('limit-wrap'):
+            final_query = _get_final_query(project, compiled.compiled_sql, limit, offset, page, pushdown)
+        return project.execute_compiled_sql(compiled.raw_sql, final_query, fetch)
+
+    async def _execute_with_total() -> DbtAdapterExecutionResult:
+        execution = project.run_pooled(_execute)
+        if not include_total:
+            return await execution
+        count_sql = pushdown.filter_query(compiled.compiled_sql) if pushdown is not None else compiled.compiled_sql
+        result, (total_rows, estimated) = await asyncio.gather(
+            execution, _get_row_count(project, compiled.raw_sql, count_sql, row_count))
+        is_first_page = not offset and (page is None or (page.cursor is None and not page.offset))
+        if is_first_page and limit is not None and len(result.table.rows) < limit:
+            # the whole result fits in the page
+            total_rows, estimated = len(result.table.rows), False
+        result.total_rows = total_rows
+        result.total_rows_estimated = estimated
+        return result
+
+    with measure_phase('execute'):
+        if coalesce:
+            result = await project.inflight_queries.do(
+                (project._version, compiled.compiled_sql, limit, fetch, include_total, rewrite_key),
+                _execute_with_total)
         else:
-            total_result_query = project.execute_macro('get_row_count_query', {"sql": query})
-            total_result_response = await loop.run_in_executor(
-                None, project.fn_threaded_conn(execute_function, total_result_query, ctx, True))
-            size = int(total_result_response.table.rows[0][0])
-        result.total_rows = size
+            result = await _execute_with_total()
 
+    record_query(result.compiled_sql, result.adapter_response.code if result.adapter_response else None)
+    if result_cache is not None:
+        result_cache.put(cache_key, result, estimate_table_size(result.table))
     return result
 
 
+async def _open_jinjat_cursor(project: DbtProject, query: Union[str, DbtTemplate], ctx: DbtQueryRequestContext,
+                              limit: Optional[int], include_total: bool = False, page: Optional[KeysetPage] = None,
+                              row_count: Optional[RowCountConfig] = None, pushdown: Optional[QueryPushdown] = None,
+                              offset: Optional[int] = None) -> Tuple[Connection, Any, Optional[Tuple[int, bool]]]:
+    """Compiles and executes the query, returning the pooled connection and the DB-API cursor so that
+    the caller can fetch the rows in batches and release the connection, along with the total row count and whether
+    it's estimated. Errors are raised before any rows are fetched."""
+    with measure_phase('compile'):
+        compiled = await project.compile_async(query, ctx)
+
+    def _open_cursor() -> Tuple[Connection, Any]:
+        with measure_phase('limit-wrap'):
+            final_query = _get_final_query(project, compiled.compiled_sql, limit, offset, page, pushdown)
+        record_query(final_query)
+        return project.open_cursor(compiled.raw_sql, final_query)
+
+    opening = project.run_pooled(_open_cursor, keep_connection=True)
+    if not include_total:
+        with measure_phase('execute'):
+            connection, cursor = await opening
+        return connection, cursor, None
+    count_sql = pushdown.filter_query(compiled.compiled_sql) if pushdown is not None else compiled.compiled_sql
+    with measure_phase('execute'):
+        opened, total = await asyncio.gather(opening,
+                                             _get_row_count(project, compiled.raw_sql, count_sql, row_count),
+                                             return_exceptions=True)
+    if isinstance(total, BaseException):
+        if not isinstance(opened, BaseException):
+            project.release_connection(opened[0])
+        raise total
+    if isinstance(opened, BaseException):
+        raise opened
+    connection, cursor = opened
+    return connection, cursor, total
+
+
 @app.post(
     "/compile",
     response_model=JinjatCompileResult
@@ -140,21 +246,19 @@ async def compile_sql(
 
     # Query Compilation
 
-    try:
-        loop = asyncio.get_running_loop()
-
+    def _compile() -> str:
         if body.limit is not None:
             query = project.execute_macro('limit_query', {"sql": body.sql, "limit": body.limit})
         else:
             query = body.sql
+        return project.compile_sql(query, context).compiled_sql
 
+    try:
         context = generate_dbt_context_from_request(request) if body.request is None else body.request
-        compiled_query = (
-            await loop.run_in_executor(
-                None,
-                project.fn_threaded_conn(project.compile_sql, query, context)
-            )
-        ).compiled_sql
+        # the macro renders Jinja as well, so it runs on the compile executor along with the compilation
+        compiled_query = await project.compile_executor.run(project.fn_threaded_conn(_compile))
+    except ExecutorQueueFull:
+        raise
     except Exception as compile_err:
         raise JinjatErrorContainer(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -226,7 +330,6 @@ def refresh_project(
             )]
         )
     else:
-        project._version += 1
         rv = JinjatRefreshProjectResult(
             result=(
                 f"Profile target changed from {old_target} to {new_target}!"
@@ -239,6 +342,32 @@ def refresh_project(
     return rv
 
 
+@app.get("/metrics", response_class=Response)
+async def metrics(request: Request) -> Response:
+    """Request counts, latencies and the state of the executors, connection pools and caches of the projects
+    in the Prometheus text format"""
+    dbt: DbtProjectContainer = request.app.state.dbt_project_container
+    return Response(render_metrics(list(dbt)), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@app.get("/slow-queries")
+async def slow_queries(request: Request, analysis: Optional[str] = None) -> dict:
+    """Slowest requests of the analyses, slowest first, `analysis` filters them by the unique id of the analysis"""
+    dbt: DbtProjectContainer = request.app.state.dbt_project_container
+    entries = [{"project": project.project_name, **entry}
+               for project in dbt for entry in project.slow_query_log.entries(analysis)]
+    return {"result": sorted(entries, key=lambda entry: entry["duration"], reverse=True)}
+
+
+@app.get("/traces")
+async def traces(request: Request, trace_id: Optional[str] = None) -> dict:
+    """Last spans of the traced analysis requests, `trace_id` filters them by their trace"""
+    dbt: DbtProjectContainer = request.app.state.dbt_project_container
+    return {"result": [{"project": project.project_name, **span}
+                       for project in dbt if project.tracer is not None
+                       for span in project.tracer.exporter.spans(trace_id)]}
+
+
 @app.get("/health")
 async def health_check(
         request: Request,
@@ -251,6 +380,7 @@ async def health_check(
     return {
         "result": {
             "status": "ready",
+            "event_loop": loop_monitor.stats(),
             **(
                 {
                     "project_name": project.config.project_name,
@@ -258,7 +388,18 @@ async def health_check(
                     "profile_name": project.config.profile_name,
                     "logs": project.config.log_path,
                     "runner_parse_iteration": project._version,
-                    "adapter_ready": project.adapter_probe(),
+                    "adapter_ready": await project.adapter_probe_pooled(),
+                    "compiled_sql_cache": project.compiled_sql_cache.stats(),
+                    "row_count_cache": project.row_count_cache.stats(),
+                    "coalesced_queries": project.inflight_queries.coalesced,
+                    "connection_pool": project.connection_pool.stats(),
+                    "admission": project.admission_limiter.stats(),
+                    "cancellations": project.cancellations.stats(),
+                    "executors": {
+                        "compile": project.compile_executor.stats(),
+                        "query": project.query_executor.stats(),
+                        "cancel": project.cancel_executor.stats(),
+                    },
                 }
                 if project is not None
                 else {}
@@ -15,67 +15,347 @@ from fastapi import FastAPI
 from fastapi.openapi.constants import METHODS_WITH_BODY
 from fastapi.openapi.models import Schema, Response as APIResponse, Operation, RequestBody, MediaType
 from fastapi.openapi.utils import get_openapi
+from jsonschema import Draft7Validator
+from jsonschema.exceptions import SchemaError
 from openapi_schema_pydantic import Parameter
 from pydantic import ValidationError
 from starlette import status
+from starlette.exceptions import HTTPException
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import Response, StreamingResponse
 
-from jinjat.core.dbt.dbt_project import DbtProject
+from jinjat.core.dbt.dbt_project import DbtProject, DbtTemplate
 from jinjat.core.exceptions import InvalidJinjaConfig, ExecuteSqlFailure
 from jinjat.core.log_controller import logger
 from jinjat.core.models import generate_dbt_context_from_request, JinjatExecutionResult, JinjatAnalysisConfig, \
-    JinjatProjectConfig, RequestSchema
-from jinjat.core.routes.admin import _execute_jinjat_query
+    JinjatProjectConfig, RequestSchema, CacheConfig, DbtQueryRequestContext, convert_result_data, PaginationConfig, \
+    RowCountConfig, AdmissionConfig, convert_result_shape, get_response_shape, SHAPE_QUERY_PARAM, RESPONSE_SHAPES
+from jinjat.core.routes.admin import _execute_jinjat_query, _open_jinjat_cursor
 from jinjat.core.schema.data_type import get_json_schema_from_data_type
+from jinjat.core.schema.validator import get_request_body_validator
 from jinjat.core.util.api import get_human_readable_error, rapidoc_html, register_jsonapi_exception_handlers, \
     CustomButton, unregister_openapi_validators, extract_key_value_pairs, \
-    JinjatErrorContainer, convert_openapi_ref, JinjatError, JinjatErrorCode, QueryError
+    JinjatErrorContainer, convert_openapi_ref, JinjatError, JinjatErrorCode, QueryError, ORJSONResponse, \
+    JSONAPIException
+from jinjat.core.util.admission import Admission, AdmissionLimiter
+from jinjat.core.util.cache import LRUCache
+from jinjat.core.util.cancellation import run_cancellable
 from jinjat.core.util.jmespath import extract_jmespath
+from jinjat.core.util.metrics import RequestMetrics, current_request_metrics, measure_phase, track_request, \
+    count_rows, count_streamed_bytes, SERVER_TIMING_HEADER
+from jinjat.core.util.pagination import KeysetPage, CURSOR_QUERY_PARAM, NEXT_CURSOR_HEADER
+from jinjat.core.util.profiler import SamplingProfiler, PROFILE_QUERY_PARAM
+from jinjat.core.util.pushdown import QueryPushdown, TransformPushdown, SORT_QUERY_PARAM, ORDER_QUERY_PARAM, \
+    FIELDS_QUERY_PARAM
+from jinjat.core.util.arrow import ARROW_FORMATS, import_pyarrow, iterate_record_batches, encode_record_batches
+from jinjat.core.util.streaming import get_stream_format, encode_rows, STREAM_FORMATS, FETCH_BATCH_SIZE, \
+    iterate_in_executor, iterate_row_batches
+from jinjat.core.util.tracing import trace_span, activate_span, end_after_stream, TRACEPARENT_HEADER, \
+    TRACERESPONSE_HEADER
 
 ANALYSIS_FILE_PATH_REGEX = re.compile(r"^analysis\/(.*)\.sql$")
 
 
 async def handle_analysis_api(project: DbtProject,
-                              sql: str,
+                              template: DbtTemplate,
                               openapi_dict: dict,
+                              request_validator: Optional[Draft7Validator],
                               transform_request: Callable[[dict], dict],
                               transform_response: Callable[[dict], dict],
                               fetch: bool,
+                              cache_config: Optional[CacheConfig],
+                              pagination_config: Optional[PaginationConfig],
+                              row_count_config: Optional[RowCountConfig],
+                              transform_pushdown: Optional[TransformPushdown],
                               request: Request,
                               response: Response):
-    context = await generate_dbt_context_from_request(request, openapi_dict, transform_request)
-    limit = request.query_params.get('_limit')
-    end = request.query_params.get('_end')
-    start = request.query_params.get('_start')
+    with trace_span('request.context'):
+        context = await generate_dbt_context_from_request(request, request_validator, transform_request)
+    limit = get_int_query_param(request, '_limit')
+    end = get_int_query_param(request, '_end')
+    start = get_int_query_param(request, '_start')
     if limit is None and (start is not None and end is not None):
-        limit = int(end) - int(start)
+        limit = max(end - start, 0)
+    page = None
+    if pagination_config is not None and fetch:
+        page = KeysetPage(pagination_config, project.sql_dialect, request.query_params.get(CURSOR_QUERY_PARAM),
+                          start)
+    offset = start if page is None else None
+    pushdown = None
+    if fetch:
+        columns = {name: column.data_type for name, column in template.node.columns.items()}
+        pushdown = QueryPushdown.from_request(request, columns, project.sql_dialect, template.query_params)
+        if page is not None and pushdown is not None and pushdown.order_by:
+            raise JinjatErrorContainer(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                errors=[JinjatError(code=JinjatErrorCode.Unknown,
+                                    message=f"`{SORT_QUERY_PARAM}` is not supported, the analysis is paginated by "
+                                            f"{pagination_config.key}")])
+    sql = template.raw_sql
+    stream_format = get_stream_format(request) if fetch else None
+    if stream_format is not None:
+        return await stream_analysis_response(project, template, context, limit, stream_format,
+                                              include_total=end is not None, page=page,
+                                              row_count=row_count_config, pushdown=pushdown,
+                                              offset=offset)
+
+    shape = get_response_shape(request) if fetch else 'objects'
+    if fetch:
+        # exports are streamed, the limits only apply to the responses that are loaded into memory
+        limit = project.resolve_limit(limit)
+    if transform_pushdown is not None and fetch and page is None and shape == 'objects':
+        limit, offset = transform_pushdown.apply_limit(limit, offset)
+        if transform_pushdown.columns is not None:
+            if pushdown is None:
+                pushdown = QueryPushdown([], [], list(transform_pushdown.columns), project.sql_dialect)
+            elif pushdown.columns is None:
+                pushdown.columns = list(transform_pushdown.columns)
+        transform_response = transform_pushdown.transform
+    result_cache = None
+    cache_key = ()
+    if cache_config is not None and fetch and request.method in ['GET', 'HEAD']:
+        result_cache = project.result_caches.get(template.unique_id)
+        cache_key = tuple(request.headers.get(header) for header in cache_config.vary_on)
     try:
-        query_result = await _execute_jinjat_query(project, project.execute_sql, sql, context,
-                                                   limit, fetch, include_total=end is not None)
-        response_schema = openapi_dict.get("responses", {}).get(200, {}).get("content", {}).get("application/json",
-                                                                                                {}).get("schema", {})
-        jinjat_result = JinjatExecutionResult.from_dbt(context, query_result, transform_response, response_schema)
-        if query_result.total_rows is not None:
-            response.headers['x-total-count'] = str(query_result.total_rows)
+        query_result = await _execute_jinjat_query(project, template, context,
+                                                   limit, fetch, include_total=end is not None,
+                                                   result_cache=result_cache, cache_key=cache_key,
+                                                   coalesce=request.method in ['GET', 'HEAD'], page=page,
+                                                   row_count=row_count_config, pushdown=pushdown,
+                                                   offset=offset)
     except ExecuteSqlFailure as execution_err:
         logger().error(
             f"Unable executing query: {execution_err.dbt_exception}\n\n{execution_err.compiled_sql or execution_err.raw_sql}")
-        jinjat_result = JinjatExecutionResult(request=context, compiled_sql=execution_err.compiled_sql, raw_sql=sql,
-                                              error=str(execution_err.dbt_exception))
+        if context.is_debug_enabled():
+            return JinjatExecutionResult(request=context, compiled_sql=execution_err.compiled_sql, raw_sql=sql,
+                                         error=str(execution_err.dbt_exception))
+        raise JinjatErrorContainer(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            errors=[JinjatError(
+                code=JinjatErrorCode.ExecuteSqlFailure,
+                message=str(execution_err.dbt_exception),
+                error=QueryError(sql=sql, compiled_sql=execution_err.compiled_sql)
+            )]
+        )
+
+    response_schema = openapi_dict.get("responses", {}).get(200, {}).get("content", {}).get("application/json",
+                                                                                            {}).get("schema", {})
+    headers = get_total_count_headers(query_result.total_rows, query_result.total_rows_estimated)
+    next_cursor = page.next_cursor(query_result.table, limit) if page is not None else None
+    if next_cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = next_cursor
+        next_url = request.url.remove_query_params('_start') \
+            .include_query_params(**{CURSOR_QUERY_PARAM: next_cursor})
+        headers['link'] = f'<{next_url}>; rel="next"'
+    metrics = current_request_metrics()
+    if metrics is not None and query_result.table is not None:
+        metrics.add_rows(len(query_result.table.rows))
     if context.is_debug_enabled():
-        return jinjat_result
-    elif jinjat_result.error is not None:
+        with measure_phase('convert'):
+            jinjat_result = JinjatExecutionResult.from_dbt(context, query_result, transform_response,
+                                                           response_schema)
+        with measure_phase('serialize'):
+            return ORJSONResponse(jinjat_result, headers=headers)
+    if shape != 'objects':
+        with measure_phase('convert'):
+            content = convert_result_shape(query_result, shape, response_schema)
+        with measure_phase('serialize'):
+            return ORJSONResponse(content, headers=headers, media_type=f"application/json; shape={shape}")
+    # skip the pydantic models, the rows are serialized straight to bytes
+    with measure_phase('convert'):
+        content = convert_result_data(query_result, None, response_schema)
+    if transform_response is not None:
+        with measure_phase('transform'):
+            content = transform_response(content)
+    with measure_phase('serialize'):
+        return ORJSONResponse(content, headers=headers)
+
+
+async def handle_measured_analysis_api(project: DbtProject, package: str, analysis: str,
+                                       slow_query_threshold: Optional[float], handler: Callable, request: Request,
+                                       response: Response):
+    """Records the request, its phases and its errors in the metrics of the analysis and returns the durations of
+    the phases in the `Server-Timing` header, the phases of streamed responses end once the rows start streaming.
+    Requests slower than `slow_query_threshold` seconds are added to the slow query log, streamed responses once
+    they're sent."""
+    metrics = RequestMetrics(package, analysis)
+    request_info = {
+        "method": request.method,
+        "path": request.url.path,
+        "path_params": dict(request.path_params),
+        "query_params": dict(request.query_params.multi_items()),
+    }
+
+    def _finish(status_code: int, error_code: Optional[str] = None) -> None:
+        metrics.finish(status_code, error_code)
+        project.slow_query_log.record(metrics, request_info, status_code, slow_query_threshold)
+
+    with track_request(metrics):
+        try:
+            result = await handler(request, response)
+        except HTTPException as e:
+            errors = e.errors if isinstance(e, JSONAPIException) else None
+            code = getattr(errors[0], 'code', None) if errors else None
+            _finish(e.status_code, code.name if isinstance(code, JinjatErrorCode) else JinjatErrorCode.Unknown.name)
+            raise
+        except Exception:
+            _finish(status.HTTP_500_INTERNAL_SERVER_ERROR, JinjatErrorCode.Unknown.name)
+            raise
+    status_code = result.status_code if isinstance(result, Response) else status.HTTP_200_OK
+    if isinstance(result, Response):
+        result.headers[SERVER_TIMING_HEADER] = metrics.server_timing()
+    if isinstance(result, StreamingResponse):
+        metrics.finish(status_code)
+        result.body_iterator = count_streamed_bytes(
+            result.body_iterator, metrics,
+            lambda: project.slow_query_log.record(metrics, request_info, status_code, slow_query_threshold))
+        return result
+    if isinstance(result, Response):
+        metrics.add_bytes(len(result.body))
+    _finish(status_code)
+    return result
+
+
+async def handle_traced_analysis_api(project: DbtProject, analysis: str, route: str, handler: Callable,
+                                     request: Request, response: Response):
+    """Traces the request as the root span of the spans of its phases and queries when tracing is enabled,
+    continuing the trace of the `traceparent` header. The span of streamed responses ends once they're sent."""
+    tracer = project.tracer
+    span = tracer.start_span(f"{request.method} {route}", request.headers.get(TRACEPARENT_HEADER), {
+        "http.method": request.method,
+        "http.route": route,
+        "http.target": request.url.path,
+        "jinjat.analysis": analysis,
+    }) if tracer is not None else None
+    if span is None:
+        return await handler(request, response)
+
+    with activate_span(span):
+        try:
+            result = await handler(request, response)
+        except HTTPException as e:
+            span.set_attribute("http.status_code", e.status_code)
+            # the client errors aren't errors of the server
+            if e.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR:
+                span.record_error(e)
+            span.end()
+            raise
+        except BaseException as e:
+            span.record_error(e)
+            span.end()
+            raise
+    span.set_attribute("http.status_code",
+                       result.status_code if isinstance(result, Response) else status.HTTP_200_OK)
+    (result if isinstance(result, Response) else response).headers[TRACERESPONSE_HEADER] = span.traceparent
+    if isinstance(result, StreamingResponse):
+        result.body_iterator = end_after_stream(result.body_iterator, span)
+        return result
+    span.end()
+    return result
+
+
+async def handle_profiled_analysis_api(enabled: bool, handler: Callable, request: Request, response: Response):
+    """Runs the handler under the sampling profiler when the `_profile` query parameter is set and returns the
+    call tree rather than the response, the rows of streamed responses are fetched and discarded."""
+    if PROFILE_QUERY_PARAM not in request.query_params:
+        return await handler(request, response)
+    if not enabled:
+        raise JinjatErrorContainer(
+            status_code=status.HTTP_403_FORBIDDEN,
+            errors=[JinjatError(code=JinjatErrorCode.Unknown,
+                                message=f"`{PROFILE_QUERY_PARAM}` requires `profiling` to be enabled "
+                                        f"in jinjat_project.yml")])
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        result = await handler(request, response)
+        if isinstance(result, StreamingResponse):
+            async for _ in result.body_iterator:
+                pass
+    finally:
+        profiler.stop()
+    status_code = result.status_code if isinstance(result, Response) else status.HTTP_200_OK
+    return ORJSONResponse({"status_code": status_code, "profile": profiler.to_dict()})
+
+
+async def handle_admitted_analysis_api(admission: Admission, handler: Callable, request: Request, response: Response):
+    """Runs the handler once the request is admitted, streamed responses leave their slot as soon as the rows
+    start streaming while the pooled connection bounds the concurrent streams."""
+    async with admission.admit():
+        return await handler(request, response)
+
+
+async def handle_cancellable_analysis_api(project: DbtProject, timeout: Optional[float], handler: Callable,
+                                          request: Request, response: Response):
+    """Cancels the handler along with its running statements if it takes longer than `timeout` seconds or the client
+    disconnects, streamed responses can only time out before the rows start streaming."""
+    return await run_cancellable(request, functools.partial(handler, request, response), timeout,
+                                 project.cancellations)
+
+
+async def stream_analysis_response(project: DbtProject, template: DbtTemplate, context: DbtQueryRequestContext,
+                                   limit: Optional[int], stream_format: str,
+                                   include_total: bool, page: Optional[KeysetPage] = None,
+                                   row_count: Optional[RowCountConfig] = None,
+                                   pushdown: Optional[QueryPushdown] = None,
+                                   offset: Optional[int] = None) -> StreamingResponse:
+    """Streams the result as NDJSON, CSV, Arrow IPC or Parquet while it's fetched from the cursor.
+    The response transform is not applied as the rows are never materialized together, neither is
+    the next page cursor returned as the headers are sent before the last row is fetched."""
+    if stream_format in ARROW_FORMATS:
+        import_pyarrow()
+    try:
+        connection, cursor, total = await _open_jinjat_cursor(project, template, context, limit,
+                                                              include_total, page, row_count, pushdown, offset)
+    except ExecuteSqlFailure as execution_err:
+        logger().error(
+            f"Unable executing query: {execution_err.dbt_exception}\n\n{execution_err.compiled_sql or execution_err.raw_sql}")
         raise JinjatErrorContainer(
             status_code=status.HTTP_400_BAD_REQUEST,
             errors=[JinjatError(
                 code=JinjatErrorCode.ExecuteSqlFailure,
-                message=jinjat_result.error,
-                error=QueryError(sql=sql, compiled_sql=jinjat_result.compiled_sql)
+                message=str(execution_err.dbt_exception),
+                error=QueryError(sql=template.raw_sql, compiled_sql=execution_err.compiled_sql)
             )]
         )
+    column_names = [column[0] for column in cursor.description or []]
+    close = functools.partial(project.release_connection, connection)
+    metrics = current_request_metrics()
+    if stream_format in ARROW_FORMATS:
+        batches = iterate_in_executor(
+            count_rows(iterate_record_batches(cursor, column_names, FETCH_BATCH_SIZE), metrics), close,
+            project.query_executor)
+        content = encode_record_batches(stream_format, column_names, batches)
     else:
-        return jinjat_result.data
+        batches = iterate_in_executor(count_rows(iterate_row_batches(cursor), metrics), close,
+                                      project.query_executor)
+        content = encode_rows(stream_format, column_names, batches)
+    headers = get_total_count_headers(*total) if total is not None else None
+    return StreamingResponse(content, media_type=STREAM_FORMATS[stream_format], headers=headers)
+
+
+def get_total_count_headers(total_rows: Optional[int], estimated: bool) -> dict:
+    if total_rows is None:
+        return {}
+    headers = {'x-total-count': str(total_rows)}
+    if estimated:
+        headers['x-total-count-estimated'] = 'true'
+    return headers
+
+
+def get_int_query_param(request: Request, name: str) -> Optional[int]:
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise JinjatErrorContainer(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            errors=[JinjatError(code=JinjatErrorCode.Unknown, message=f"`{name}` must be a non-negative integer")])
+    return number
 
 
 def create_components_from_nodes(project: DbtProject):
@@ -173,7 +453,7 @@ def generate_schema(project: DbtProject, openapi_schema):
     return {**existing_schemas, **component_schemas}
 
 
-async def custom_openapi(project, jinjat_project_config, api, req: Request) -> JSONResponse:
+async def custom_openapi(project, jinjat_project_config, api, req: Request) -> ORJSONResponse:
     extract_path = req.query_params.get("jmespath")
     scheme = req.headers.get('x-forwarded-proto')
     url = str(req.base_url.replace(scheme=scheme or req.url.scheme))
@@ -181,7 +461,7 @@ async def custom_openapi(project, jinjat_project_config, api, req: Request) -> J
 
     if api.openapi_schema:
         api.openapi_schema['servers'] = servers
-        return JSONResponse(extract_jmespath(extract_path, api.openapi_schema, project))
+        return ORJSONResponse(extract_jmespath(extract_path, api.openapi_schema, project))
 
     openapi_schema = get_openapi(title=project.project_name,
                                  version=project.config.version,
@@ -197,7 +477,7 @@ async def custom_openapi(project, jinjat_project_config, api, req: Request) -> J
 
     api.openapi_schema = openapi_schema
 
-    return JSONResponse(extract_jmespath(extract_path, openapi_schema, project))
+    return ORJSONResponse(extract_jmespath(extract_path, openapi_schema, project))
 
 
 def enrich_openapi_schema(project: DbtProject, openapi: Operation, config: JinjatAnalysisConfig, node: AnalysisNode):
@@ -219,9 +499,55 @@ def enrich_openapi_schema(project: DbtProject, openapi: Operation, config: Jinja
     params = (openapi.parameters or [])
     if config.request is not None and config.request.parameters is not None:
         params = params + config.request.parameters
+    if config.fetch:
+        params = params + [Parameter(param_in='query', name=SHAPE_QUERY_PARAM, required=False,
+                                     description="`columns` returns `{columns, data: {column: [...]}}` and `rows` "
+                                                 "returns `{columns, rows: [[...]]}`, sending the column names once. "
+                                                 "The response transform is not applied to them.",
+                                     schema=Schema(type='string', enum=RESPONSE_SHAPES, default='objects')
+                                     .dict(by_alias=True, exclude_none=True))]
+        if openapi.responses is None:
+            openapi.responses = {config.response.status: APIResponse(
+                description=config.response.description, content={"application/json": MediaType(schema=Schema())})}
+        json_response = openapi.responses.get(config.response.status)
+        if json_response is not None and json_response.content is not None:
+            json_response.content.update(get_shaped_response_media_types())
+    if config.fetch and config.pagination is not None:
+        params = params + [Parameter(param_in='query', name=CURSOR_QUERY_PARAM, required=False,
+                                     description=f"Returns the page after the one that returned this cursor in "
+                                                 f"the `{NEXT_CURSOR_HEADER}` header",
+                                     schema=Schema(type='string').dict(by_alias=True, exclude_none=True))]
+    if config.fetch and node.columns:
+        column_names = list(node.columns.keys())
+        if config.pagination is None:
+            params = params + [
+                Parameter(param_in='query', name=SORT_QUERY_PARAM, required=False,
+                          description="Comma separated columns to sort by",
+                          schema=Schema(type='string').dict(by_alias=True, exclude_none=True)),
+                Parameter(param_in='query', name=ORDER_QUERY_PARAM, required=False,
+                          description=f"Comma separated `asc` or `desc` for each column in `{SORT_QUERY_PARAM}`",
+                          schema=Schema(type='string').dict(by_alias=True, exclude_none=True))]
+        params = params + [Parameter(param_in='query', name=FIELDS_QUERY_PARAM, required=False,
+                                     description=f"Comma separated columns to return, one of {column_names}. The "
+                                                 f"columns can also be filtered with `column=value` or with the "
+                                                 f"`_ne`, `_lt`, `_lte`, `_gt`, `_gte` and `_like` suffixes",
+                                     schema=Schema(type='string').dict(by_alias=True, exclude_none=True))]
     openapi.parameters = params
 
 
+def get_shaped_response_media_types() -> dict:
+    columns = Schema(type="array", items=Schema(type="object", properties={"name": Schema(type="string"),
+                                                                          "type": Schema(type="string")}))
+    return {
+        "application/json; shape=columns": MediaType(schema=Schema(type="object", properties={
+            "columns": columns,
+            "data": Schema(type="object", additionalProperties=Schema(type="array", items=Schema()))})),
+        "application/json; shape=rows": MediaType(schema=Schema(type="object", properties={
+            "columns": columns,
+            "rows": Schema(type="array", items=Schema(type="array", items=Schema()))})),
+    }
+
+
 def register_openapi_validators(project: DbtProject):
     original_validators = Schema.__fields__.get("ref").post_validators or []
     Schema.__fields__.get("ref").post_validators = original_validators + [
@@ -242,7 +568,12 @@ def create_analysis_apps(jinjat_project_config: JinjatProjectConfig, project: Db
                              itertools.groupby(sorted(analysis_nodes, key=lambda node: node.package_name),
                                                lambda node: node.package_name))
 
-    api = FastAPI(redoc_url=None, docs_url=None, openapi_url=None)
+    api = FastAPI(redoc_url=None, docs_url=None, openapi_url=None, default_response_class=ORJSONResponse)
+    project.row_count_cache.ttl = jinjat_project_config.row_count_ttl
+    project.default_limit = jinjat_project_config.default_limit
+    project.max_limit = jinjat_project_config.max_limit
+    project_admission = jinjat_project_config.admission or AdmissionConfig()
+    project.admission_limiter = AdmissionLimiter(f"project {project.project_name}", project_admission.max_in_flight)
     register_jsonapi_exception_handlers(api)
     register_openapi_validators(project)
     analysis_lookup = {}
@@ -266,7 +597,9 @@ def create_analysis_apps(jinjat_project_config: JinjatProjectConfig, project: Db
     api.add_api_route("/_analysis/{id}{rest_of_path:path}", endpoint=lookup_by_id, methods=METHODS_WITH_BODY)
 
     for package_name, analyses in nodes_by_packages.items():
-        sub_app = FastAPI(redoc_url=None, docs_url=None, openapi_url=None)
+        sub_app = FastAPI(redoc_url=None, docs_url=None, openapi_url=None, default_response_class=ORJSONResponse)
+        # the errors of the analysis routes are raised in the mounted app, not in `api`
+        register_jsonapi_exception_handlers(sub_app)
 
         sub_app.add_route(f"/{package_name}/docs",
                           functools.partial(rapidoc_html, CustomButton("Admin APIs", "/admin/docs"), package_name),
@@ -339,6 +672,8 @@ def create_analysis_apps(jinjat_project_config: JinjatProjectConfig, project: Db
             transform = None if jinjat_config.response is None else jinjat_config.response.transform
             try:
                 transform_response = compile_transform(transform)
+                transform_pushdown = TransformPushdown.from_expression(
+                    transform, {name: column.data_type for name, column in node.columns.items()})
             except Exception as e:
                 raise InvalidJinjaConfig(node.original_file_path, None,
                                          f"Unable to parse `transform_response` jmespath expression {jinjat_config.response.transform}: {e}")
@@ -354,12 +689,54 @@ def create_analysis_apps(jinjat_project_config: JinjatProjectConfig, project: Db
                     f"Error generating route {node.unique_id}\nOpenAPI schema validation failed: ${e.message}")
                 sys.exit(1)
 
-            endpoint = functools.partial(handle_analysis_api, project, node.raw_code, openapi_dict_resolved,
-                                         transform_request,
-                                         transform_response, fetch_enabled)
-            analysis_lookup[node.unique_id] = endpoint
+            try:
+                request_validator = get_request_body_validator(openapi_dict_resolved)
+            except SchemaError as e:
+                raise InvalidJinjaConfig(node.patch_path, node.original_file_path,
+                                         f"Invalid `request.body` schema: {e.message}")
+
+            if jinjat_config.pagination is not None and node.columns:
+                unknown_keys = [key for key in jinjat_config.pagination.key if key not in node.columns]
+                if unknown_keys:
+                    raise InvalidJinjaConfig(node.original_file_path, None,
+                                             f"Pagination keys {unknown_keys} are not columns of the analysis")
+
+            template = project.get_template(node)
+            template.prepare()
+            cache_config = jinjat_config.cache
+            if cache_config is not None:
+                project.result_caches[node.unique_id] = LRUCache(cache_config.max_entries, cache_config.max_size,
+                                                                 cache_config.ttl)
+            else:
+                project.result_caches.pop(node.unique_id, None)
+            endpoint = functools.partial(handle_analysis_api, project, template, openapi_dict_resolved,
+                                         request_validator, transform_request,
+                                         transform_response, fetch_enabled, cache_config, jinjat_config.pagination,
+                                         jinjat_config.row_count, transform_pushdown)
+            analysis_admission = jinjat_config.admission or AdmissionConfig()
+            limiters = [project.admission_limiter]
+            if analysis_admission.max_in_flight is not None:
+                limiters.insert(0, AdmissionLimiter(f"analysis {node.name}", analysis_admission.max_in_flight))
+            admission = Admission(limiters,
+                                  analysis_admission.max_queue_wait if analysis_admission.max_queue_wait is not None
+                                  else project_admission.max_queue_wait,
+                                  analysis_admission.retry_after if analysis_admission.retry_after is not None
+                                  else project_admission.retry_after)
+            timeout = jinjat_config.timeout if jinjat_config.timeout is not None else jinjat_project_config.timeout
+            endpoint = functools.partial(handle_cancellable_analysis_api, project, timeout, endpoint)
+            endpoint = functools.partial(handle_admitted_analysis_api, admission, endpoint)
+            endpoint = functools.partial(handle_profiled_analysis_api, bool(jinjat_project_config.profiling),
+                                         endpoint)
+            slow_query_threshold = jinjat_config.slow_query_threshold
+            if slow_query_threshold is None and jinjat_project_config.slow_query_log is not None:
+                slow_query_threshold = jinjat_project_config.slow_query_log.threshold
+            endpoint = functools.partial(handle_measured_analysis_api, project, package_name, node.unique_id,
+                                         slow_query_threshold, endpoint)
             version = project.config.dependencies[package_name].version
             full_path_for_analysis = f'/{package_name}/{version}/{api_path}'
+            endpoint = functools.partial(handle_traced_analysis_api, project, node.unique_id, full_path_for_analysis,
+                                         endpoint)
+            analysis_lookup[node.unique_id] = endpoint
             endpoint.__name__ = f"{','.join(methods)} {full_path_for_analysis}"
 
             sub_app.add_api_route(full_path_for_analysis,
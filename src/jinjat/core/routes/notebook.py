@@ -1,3 +1,4 @@
+import asyncio
 import os
 from pathlib import Path
 
@@ -21,8 +22,9 @@ async def lookup_notebook_by_id(jinjat_project_config: JinjatProjectConfig, proj
     current_project = project.config.dependencies[package_name]
     # TODO: process all analysis_paths
     directory = os.path.join(current_project.project_root, "pages")
-    path = Path(directory).rglob(f'{analysis}.md')
-    found_files = list(path)
+    # walking the directory blocks the event loop on large projects
+    found_files = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: list(Path(directory).rglob(f'{analysis}.md')))
     if len(found_files) == 0:
         raise JinjatErrorContainer(404, [
             JinjatError(code=JinjatErrorCode.ResourceNotFound, message="can't find the notebook")])
@@ -31,7 +33,7 @@ async def lookup_notebook_by_id(jinjat_project_config: JinjatProjectConfig, proj
             JinjatError(code=JinjatErrorCode.AmbiguousResource, message="found multiple notebooks given name.")])
 
     found_file = found_files[0]
-    file_content = found_file.open('r').read()
+    file_content = await asyncio.get_running_loop().run_in_executor(None, found_file.read_text)
     result = file_content
     # result = project.compile_sql(file_content,
     #                              await generate_dbt_context_from_request(request)).compiled_sql
@@ -67,7 +67,7 @@ ADAPTER_TO_DATABASE = {
 
 def get_json_schema_from_data_type(project: DbtProject, data_type: Optional[str]) -> Schema:
     if data_type is not None:
-        type_mapping = ADAPTER_TO_DATABASE.get(project.adapter.type())
+        type_mapping = ADAPTER_TO_DATABASE.get(project.adapter.type(), {})
         python_type = type_mapping.get(data_type.upper())
         if python_type is None:
             python_type = ANSI_SQL_TYPE_PYTHON_TYPE.get(data_type.upper())
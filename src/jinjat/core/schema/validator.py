@@ -1,13 +1,20 @@
-from jsonschema import Draft202012Validator, validators
+from copy import deepcopy
+from typing import List, Optional
+
+from jsonschema import Draft7Validator, validators
+
+from jinjat.core.util.api import JinjatError, JinjatErrorCode
 
 
 def extend_with_default(validator_class):
     validate_properties = validator_class.VALIDATORS["properties"]
 
     def set_defaults(validator, properties, instance, schema):
-        for property, subschema in properties.items():
-            if "default" in subschema:
-                instance.setdefault(property, subschema["default"])
+        if validator.is_type(instance, "object"):
+            for property, subschema in properties.items():
+                if isinstance(subschema, dict) and "default" in subschema:
+                    # the default is shared by the requests, so they each get a copy
+                    instance.setdefault(property, deepcopy(subschema["default"]))
 
         for error in validate_properties(
                 validator, properties, instance, schema,
@@ -19,4 +26,21 @@ def extend_with_default(validator_class):
     )
 
 
-DefaultValidatingValidator = extend_with_default(Draft202012Validator)
+DefaultValidatingValidator = extend_with_default(Draft7Validator)
+
+
+def get_request_body_validator(operation: dict) -> Optional[Draft7Validator]:
+    """Validator of the JSON request body of the resolved OpenAPI operation that fills in the defaults, None if the
+    operation has no body. The schema is checked here, once, rather than on every request."""
+    schema = operation.get("requestBody", {}).get("content", {}).get("application/json", {}).get("schema")
+    if schema is None:
+        return None
+    DefaultValidatingValidator.check_schema(schema)
+    return DefaultValidatingValidator(schema)
+
+
+def validate_request_body(validator: Draft7Validator, body) -> List[JinjatError]:
+    """Fills in the defaults of the body and returns its validation errors"""
+    return [JinjatError(code=JinjatErrorCode.InvalidRequestBody,
+                        message=f"{'.'.join(map(str, error.absolute_path)) or 'body'}: {error.message}")
+            for error in sorted(validator.iter_errors(body), key=lambda error: list(map(str, error.absolute_path)))]
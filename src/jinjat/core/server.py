@@ -18,7 +18,7 @@ from watchdog.events import FileSystemEvent
 from jinjat.core.dbt.dbt_project import DbtProjectContainer, DbtProject, DbtTarget
 from jinjat.core.exceptions import InvalidJinjaConfig
 from jinjat.core.log_controller import logger
-from jinjat.core.models import JinjatProjectConfig
+from jinjat.core.models import JinjatProjectConfig, SlowQueryLogConfig, LoopMonitorConfig, TracingConfig
 from jinjat.core.routes.admin import app as admin_app
 from jinjat.core.routes.analysis import create_analysis_apps
 from jinjat.core.routes.notebook import lookup_notebook_by_id
@@ -26,6 +26,7 @@ from jinjat.core.util import filesystem
 from jinjat.core.util.api import register_jsonapi_exception_handlers, rapidoc_html, CustomButton, DBT_PROJECT_HEADER, \
     DBT_PROJECT_NAME, StaticFilesWithFallbackIndex, extract_host
 from jinjat.core.util.filesystem import get_project_root
+from jinjat.core.util.loop_monitor import loop_monitor
 
 app = FastAPI(redoc_url=None, docs_url=None, openapi_url=None)
 
@@ -48,6 +49,16 @@ async def add_cookie_header_for_cors(request: Request, call_next):
     return response
 
 
+@app.on_event("startup")
+async def start_loop_monitor():
+    loop_monitor.start()
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    loop_monitor.stop()
+
+
 def get_jinjat_project_config(project_root: str) -> JinjatProjectConfig:
     jinjat_config_file_path = os.path.join(project_root, 'jinjat_project.yml')
     if os.path.exists(jinjat_config_file_path):
@@ -113,6 +124,12 @@ def mount_app(app: FastAPI, project: DbtProject, dbt_target: DbtTarget):
     )
     register_jsonapi_exception_handlers(app)
     app.openapi = lambda: custom_openapi(project, config)
+    project.configure_connection_pool(config.connection_pool)
+    project.configure_executors(config.compile_executor, config.query_executor)
+    project.configure_slow_query_log(config.slow_query_log or SlowQueryLogConfig())
+    project.configure_tracing(config.tracing or TracingConfig())
+    loop_monitor_config = config.loop_monitor or LoopMonitorConfig()
+    loop_monitor.configure(loop_monitor_config.threshold, loop_monitor_config.interval)
 
     current_app = generate_app(config, project)
 
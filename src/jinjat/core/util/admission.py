@@ -0,0 +1,106 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, List, Optional
+
+from starlette import status
+
+from jinjat.core.util.api import JinjatErrorContainer, JinjatError, JinjatErrorCode
+from jinjat.core.util.executor import ExecutorQueueFull
+from jinjat.core.util.pool import PoolTimeout
+
+
+def overloaded_error(message: str, retry_after: int) -> JinjatErrorContainer:
+    return JinjatErrorContainer(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        errors=[JinjatError(code=JinjatErrorCode.Overloaded, message=message)],
+        headers={'Retry-After': str(retry_after)})
+
+
+class AdmissionLimiter:
+    """Limits the requests in flight, the requests over `max_in_flight` wait in line for a slot.
+    It's only used on the event loop, a released slot is handed over to the first request in line."""
+
+    def __init__(self, name: str, max_in_flight: Optional[int]):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self._waiters: Deque[asyncio.Future] = deque()
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    async def acquire(self, timeout: Optional[float]) -> bool:
+        """Takes a slot, waiting at most `timeout` seconds for one, False if there is none"""
+        if self.max_in_flight is None or (self.in_flight < self.max_in_flight and not self._waiters):
+            self.in_flight += 1
+            return True
+        if timeout is not None and timeout <= 0:
+            self.rejected += 1
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # the slot was handed over to this request
+                self.release()
+            raise
+        finally:
+            self.waiting -= 1
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+        }
+
+
+class Admission:
+    """Admission control of the requests of an analysis. A request takes a slot of the analysis and then one of the
+    project, waiting at most `max_queue_wait` seconds in total, and fails fast with 503 and `Retry-After` if there is
+    none. The requests that run out of connections or executor workers while they're admitted fail the same way."""
+
+    def __init__(self, limiters: List[AdmissionLimiter], max_queue_wait: Optional[float], retry_after: Optional[int]):
+        self.limiters = limiters
+        self.max_queue_wait = max_queue_wait
+        self.retry_after = retry_after if retry_after is not None else max(math.ceil(max_queue_wait or 0), 1)
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        deadline = None if self.max_queue_wait is None else time.monotonic() + self.max_queue_wait
+        acquired = []
+        try:
+            for limiter in self.limiters:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not await limiter.acquire(remaining):
+                    raise overloaded_error(f"Too many requests in flight for {limiter.name}, retry later",
+                                           self.retry_after)
+                acquired.append(limiter)
+            try:
+                yield
+            except (PoolTimeout, ExecutorQueueFull) as e:
+                raise overloaded_error(f"{e}, retry later", self.retry_after)
+        finally:
+            for limiter in acquired:
+                limiter.release()
@@ -1,3 +1,4 @@
+import decimal
 import functools
 import os
 import re
@@ -5,8 +6,9 @@ import traceback
 import typing
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any, List
+from typing import Any, List, Mapping
 
+import orjson
 from fastapi.openapi.models import Schema
 from starlette.exceptions import HTTPException as StarletteHttpException
 from fastapi.exceptions import HTTPException
@@ -42,6 +44,9 @@ class JinjatErrorCode(int, Enum):
     JmesPathParseError = 7
     ResourceNotFound = 8
     AmbiguousResource = 9
+    Overloaded = 10
+    QueryTimeout = 11
+    InvalidRequestBody = 12
 
 
 class QueryError(BaseModel):
@@ -120,7 +125,32 @@ async def elements_html(custom_button: CustomButton, request: Request) -> HTMLRe
     return HTMLResponse(html)
 
 
-class JSONAPIResponse(JSONResponse):
+def _orjson_default(value: Any) -> Any:
+    # datetime, date, time, UUID and enums are serialized natively by orjson
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, BaseModel):
+        # shallow, the nested values are passed back to orjson
+        return dict(value)
+    if isinstance(value, Mapping):
+        return dict(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode(errors='replace')
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+class ORJSONResponse(JSONResponse):
+    """
+    Serializes the content with `orjson`, which is considerably faster than the standard library
+    for large payloads such as query results.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_orjson_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+class JSONAPIResponse(ORJSONResponse):
     """
     Base response class for json:api requests, sets `Content-Type: application/vnd.api+json`.
     For detailed information, see `Starlette responses <https://www.starlette.io/responses/>`_.
@@ -136,7 +166,8 @@ class JSONAPIResponse(JSONResponse):
 class JSONAPIException(HTTPException):
     """ HTTP exception with json:api representation. """
 
-    def __init__(self, status_code: int, detail: str = None, errors: List[BaseModel] = None) -> None:
+    def __init__(self, status_code: int, detail: str = None, errors: List[BaseModel] = None,
+                 headers: typing.Optional[typing.Dict[str, str]] = None) -> None:
         """
         Base json:api exception class.
         :param status_code: HTTP status code
@@ -160,15 +191,17 @@ class JSONAPIException(HTTPException):
                                {'detail': 'bar'},
                                {'detail': 'final'},
                            ]
+        :param headers: Optional, headers of the HTTP response, e.g. `Retry-After`.
         """
-        super().__init__(status_code, detail=detail)
+        super().__init__(status_code, detail=detail, headers=headers)
         self.errors = errors or []
 
 
 class JinjatErrorContainer(JSONAPIException):
-    def __init__(self, status_code: int, errors: List[JinjatError]) -> None:
+    def __init__(self, status_code: int, errors: List[JinjatError],
+                 headers: typing.Optional[typing.Dict[str, str]] = None) -> None:
         message = '\n'.join([error.message for error in errors])
-        super().__init__(status_code, message, errors)
+        super().__init__(status_code, message, errors, headers)
 
 
 def register_jsonapi_exception_handlers(app: Starlette):
@@ -178,11 +211,14 @@ def register_jsonapi_exception_handlers(app: Starlette):
     """
 
     def serialize_error(exc: Exception) -> JSONAPIResponse:
+        headers = None
         if isinstance(exc, JSONAPIException):
+            headers = exc.headers
             status_code = exc.status_code
             message = exc.detail
             errors = exc.errors
         elif isinstance(exc, HTTPException):
+            headers = exc.headers
             status_code = exc.status_code
             message = exc.detail
             errors = [JinjatError(code=JinjatErrorCode.Unknown, message=exc.detail)]
@@ -199,7 +235,7 @@ def register_jsonapi_exception_handlers(app: Starlette):
             'message': message
         }
 
-        return JSONAPIResponse(status_code=status_code, content=error_body)
+        return JSONAPIResponse(status_code=status_code, content=error_body, headers=headers)
 
     async def _serialize_error(request: Request, exc: Exception) -> Response:
         return serialize_error(exc)
@@ -0,0 +1,111 @@
+import io
+from typing import Any, AsyncIterator, Iterator, List
+
+from starlette import status
+
+from jinjat.core.util.api import JinjatErrorContainer, JinjatError, JinjatErrorCode
+
+ARROW_STREAM_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+PARQUET_MEDIA_TYPE = 'application/vnd.apache.parquet'
+ARROW_FORMATS = {'arrow': ARROW_STREAM_MEDIA_TYPE, 'parquet': PARQUET_MEDIA_TYPE}
+
+
+def import_pyarrow():
+    """pyarrow is an optional dependency, install it with `pip install jinjat[arrow]`"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise JinjatErrorContainer(
+            status_code=status.HTTP_406_NOT_ACCEPTABLE,
+            errors=[JinjatError(code=JinjatErrorCode.Unknown,
+                                message="Arrow and Parquet responses require `pyarrow`, "
+                                        "install it with `pip install jinjat[arrow]`")])
+    return pyarrow
+
+
+def iterate_record_batches(cursor: Any, column_names: List[str], batch_size: int) -> Iterator[Any]:
+    """Fetches the result of the cursor as Arrow record batches. Cursors that can return Arrow natively
+    (DuckDB and Snowflake) skip the Python row objects entirely, the rows of other cursors are converted
+    to columns one batch at a time."""
+    pa = import_pyarrow()
+    if hasattr(cursor, 'fetch_record_batch'):
+        # DuckDB
+        reader = cursor.fetch_record_batch(batch_size)
+        is_empty = True
+        for batch in reader:
+            is_empty = False
+            yield batch
+        if is_empty:
+            yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+        return
+    if hasattr(cursor, 'fetch_arrow_batches'):
+        # Snowflake
+        for table in cursor.fetch_arrow_batches():
+            yield from table.to_batches()
+        return
+
+    schema = None
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        columns = list(zip(*rows))
+        if schema is None:
+            batch = pa.record_batch([pa.array(column) for column in columns], names=column_names)
+            schema = batch.schema
+        else:
+            batch = pa.record_batch([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                                    schema=schema)
+        yield batch
+
+
+class _ChunkSink(io.RawIOBase):
+    """A write-only file which hands over the written bytes each time it's drained,
+    used to stream the output of the Arrow writers"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _new_writer(pa, arrow_format: str, sink: _ChunkSink, schema):
+    if arrow_format == 'parquet':
+        return pa.parquet.ParquetWriter(sink, schema)
+    return pa.ipc.new_stream(sink, schema)
+
+
+async def encode_record_batches(arrow_format: str, column_names: List[str],
+                                batches: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+    """Encodes record batches as an Arrow IPC stream or a Parquet file with one row group per batch"""
+    pa = import_pyarrow()
+    sink = _ChunkSink()
+    writer = None
+    async for batch in batches:
+        if writer is None:
+            writer = _new_writer(pa, arrow_format, sink, batch.schema)
+        writer.write_batch(batch)
+        yield sink.drain()
+    if writer is None:
+        # the column types of an empty result are unknown
+        writer = _new_writer(pa, arrow_format, sink, pa.schema([(name, pa.null()) for name in column_names]))
+    writer.close()
+    yield sink.drain()
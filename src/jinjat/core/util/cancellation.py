@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+from jinjat.core.log_controller import logger
+from jinjat.core.util.api import JinjatErrorContainer, JinjatError, JinjatErrorCode
+
+T = TypeVar("T")
+
+# the status nginx logs for the requests that the client closed before the response, no one receives it
+CLIENT_CLOSED_REQUEST = 499
+
+
+def query_timeout_error(timeout: float) -> JinjatErrorContainer:
+    return JinjatErrorContainer(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        errors=[JinjatError(code=JinjatErrorCode.QueryTimeout,
+                            message=f"The query didn't finish within {timeout:g} seconds and was cancelled")])
+
+
+class CancellationStats:
+    """Counts the requests that are cancelled as they time out or the client disconnects and the outcome of
+    cancelling their running statements"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.timeouts = 0
+        self.disconnects = 0
+        self.cancelled_statements = 0
+        self.failed_cancels = 0
+
+    def record(self, event: str) -> None:
+        with self._lock:
+            setattr(self, event, getattr(self, event) + 1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "timeouts": self.timeouts,
+                "disconnects": self.disconnects,
+                "cancelled_statements": self.cancelled_statements,
+                "failed_cancels": self.failed_cancels,
+            }
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # once the body is read, the next message of the request is the disconnect
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+
+async def run_cancellable(request: Request, handler: Callable[[], Awaitable[T]], timeout: Optional[float],
+                          stats: CancellationStats) -> Union[T, Response]:
+    """Runs the handler until it's done, `timeout` seconds pass or the client disconnects. The handler is cancelled
+    in the latter cases, which cancels the statements it's running, and the request fails with 504 or 499."""
+    # the body is read up front as the disconnect is the message that follows it
+    await request.body()
+    task = asyncio.ensure_future(handler())
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait([task, watcher], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if task in done:
+        return task.result()
+
+    task.cancel()
+    # wait for the handler to release what it holds, e.g. the connection of the cancelled statement
+    await asyncio.gather(task, return_exceptions=True)
+    if watcher in done:
+        stats.record("disconnects")
+        logger().debug(f"Cancelled {request.method} {request.url.path} as the client disconnected")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    stats.record("timeouts")
+    logger().warning(f"Cancelled {request.method} {request.url.path} after the timeout of {timeout:g} seconds")
+    raise query_timeout_error(timeout)
@@ -0,0 +1,50 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key, only the first call runs and the others wait for its result.
+    The call runs in its own task so that a cancelled caller doesn't cancel it for the callers waiting on it,
+    it's cancelled once all of them are."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        # callers waiting on the call of each key
+        self._waiters: Dict[Hashable, int] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._calls.get(key) is task:
+                self._waiters[key] -= 1
+                if self._waiters[key] == 0:
+                    # the task may take as long as the statement it cancels to finish, new callers start a new call
+                    # rather than joining the cancelled one
+                    self._calls.pop(key)
+                    self._waiters.pop(key)
+                    task.cancel()
+            raise
+
+    def _forget(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            self._calls.pop(key)
+            self._waiters.pop(key)
+        # mark the exception as retrieved, callers that are still waiting get it re-raised
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self):
+        return len(self._calls)
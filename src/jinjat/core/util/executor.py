@@ -0,0 +1,84 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ExecutorQueueFull(Exception):
+    """The executor already has as many jobs waiting for a worker as its queue holds"""
+
+
+class BoundedExecutor:
+    """A thread pool that rejects the jobs rather than queueing them once `max_queue` jobs are waiting for a worker.
+    It records the queue length, the active workers and how long the jobs wait for a worker."""
+
+    def __init__(self, name: str, max_workers: int, max_queue: Optional[int] = None):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"jinjat-{name}")
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.active = 0
+        self.started = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def run(self, fn: Callable[..., T], *args, bounded: bool = True) -> T:
+        """Runs the blocking function on a worker, `bounded` raises `ExecutorQueueFull` when the queue is full,
+        jobs that are part of one that is already running, e.g. fetching the next batch of rows, aren't bounded"""
+        with self._lock:
+            if bounded and self.max_queue is not None and self.queued >= self.max_queue:
+                self.rejected += 1
+                raise ExecutorQueueFull(f"{self.queued} jobs are waiting for the {self.name} workers")
+            self.queued += 1
+        submitted_at = time.monotonic()
+
+        def _run() -> T:
+            waited = time.monotonic() - submitted_at
+            with self._lock:
+                self.queued -= 1
+                self.active += 1
+                self.started += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+        # the job sees the context variables of the caller, e.g. the metrics of the request
+        future = self._executor.submit(contextvars.copy_context().run, _run)
+        future.add_done_callback(self._dequeue_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def _dequeue_cancelled(self, future: Future) -> None:
+        # the job is cancelled before a worker picks it up when the caller is cancelled
+        if future.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def shutdown(self) -> None:
+        """Stops the workers once they're done with the jobs that are already submitted"""
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "active": self.active,
+                "started": self.started,
+                "rejected": self.rejected,
+                # seconds
+                "average_wait": self.total_wait / self.started if self.started else 0.0,
+                "max_wait": self.max_wait,
+            }
@@ -0,0 +1,28 @@
+import json
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict
+
+
+class JsonlSink:
+    """Appends the entries to a rotating JSON lines file, the file is written on a background thread"""
+
+    def __init__(self, path: Path, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 3):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(str(path), maxBytes=max_bytes, backupCount=backup_count)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        self._queue_handler = QueueHandler(records)
+        self._listener = QueueListener(records, handler)
+        self._listener.start()
+
+    def write(self, entry: Dict[str, Any]) -> None:
+        self._queue_handler.handle(logging.makeLogRecord({"msg": json.dumps(entry, default=str),
+                                                          "levelno": logging.INFO, "levelname": "INFO"}))
+
+    def close(self) -> None:
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
@@ -0,0 +1,103 @@
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Deque, Optional
+
+from jinjat.core.log_controller import logger
+from jinjat.core.util.metrics import EVENT_LOOP_LAG, EVENT_LOOP_STALLS
+
+# innermost frames of the stack recorded for a stall
+STALL_STACK_LIMIT = 30
+
+
+class LoopStallMonitor:
+    """Measures the lag of the event loop with a heartbeat task that sleeps for `interval` seconds. A watchdog thread
+    captures the stack of the event loop thread once a heartbeat is `threshold` seconds late, i.e. the call blocking
+    the loop, and the stall is logged with that stack when the loop gets to run the heartbeat again."""
+
+    def __init__(self, threshold: Optional[float] = 0.1, interval: float = 0.05, max_stalls: int = 20):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.recent_stalls: Deque[dict] = collections.deque(maxlen=max_stalls)
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        # perf_counter of the heartbeat the loop is expected to run next
+        self._beat = 0.0
+        # the heartbeat the stack was captured for and the stack
+        self._stall_stack = (0.0, None)
+
+    def configure(self, threshold: Optional[float], interval: Optional[float]) -> None:
+        self.threshold = threshold
+        self.interval = interval or self.interval
+
+    def start(self) -> None:
+        """Starts monitoring the running event loop, does nothing when there is no threshold"""
+        if self.threshold is None or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.perf_counter() + self.interval
+        self._stop.clear()
+        self._task = asyncio.ensure_future(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="jinjat-loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._stop.set()
+        self._watchdog.join()
+        self._task = self._watchdog = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(now - self._beat, 0.0)
+            beat, self._beat = self._beat, now + self.interval
+            EVENT_LOOP_LAG.observe((), lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                captured_beat, stack = self._stall_stack
+                self._record_stall(lag, stack if captured_beat == beat else None)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            beat = self._beat
+            if time.perf_counter() - beat < self.threshold or self._stall_stack[0] == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._stall_stack = (beat, ''.join(traceback.format_stack(frame, STALL_STACK_LIMIT)))
+
+    def _record_stall(self, lag: float, stack: Optional[str]) -> None:
+        self.stalls += 1
+        EVENT_LOOP_STALLS.inc(())
+        self.recent_stalls.append({
+            "timestamp": datetime.utcnow().isoformat(),
+            # milliseconds
+            "duration": round(lag * 1000, 3),
+            "stack": stack,
+        })
+        logger().warning(f"The event loop was blocked for {lag * 1000:.0f} ms"
+                         + (f", blocked at:\n{stack}" if stack else ""))
+
+    def stats(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "stalls": self.stalls,
+            # milliseconds
+            "max_lag": round(self.max_lag * 1000, 3),
+            "recent_stalls": list(self.recent_stalls),
+        }
+
+
+loop_monitor = LoopStallMonitor()
@@ -0,0 +1,301 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union
+
+from jinjat.core.util.tracing import trace_span
+
+if TYPE_CHECKING:
+    from jinjat.core.dbt.dbt_project import DbtProject
+
+T = TypeVar("T")
+
+# media type of the Prometheus text exposition format, the response adds the charset
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+SERVER_TIMING_HEADER = "Server-Timing"
+# seconds, queries on the warehouse take longer than the usual web requests
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# (sample name suffix, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricFamily:
+    """A metric with its samples, rendered in the Prometheus text format"""
+
+    def __init__(self, name: str, metric_type: str, documentation: str, samples: List[Sample]):
+        self.name = name
+        self.type = metric_type
+        self.documentation = documentation
+        self.samples = samples
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples:
+            label_str = ','.join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+            lines.append(f"{self.name}{suffix}{{{label_str}}} {_format_value(value)}" if label_str
+                         else f"{self.name}{suffix} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self) -> MetricFamily:
+        with self._lock:
+            samples = [('', dict(zip(self.label_names, labels)), value) for labels, value in self._values.items()]
+        return MetricFamily(self.name, 'counter', self.documentation, samples)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str],
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> (count of each bucket and +Inf, sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[labels] = (counts, total + value)
+
+    def collect(self) -> MetricFamily:
+        samples: List[Sample] = []
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            label_dict = dict(zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append(('_bucket', {**label_dict, 'le': _format_value(bound)}, cumulative))
+            samples.append(('_sum', label_dict, total))
+            samples.append(('_count', label_dict, cumulative))
+        return MetricFamily(self.name, 'histogram', self.documentation, samples)
+
+
+ANALYSIS_REQUESTS = Counter("jinjat_analysis_requests_total", "Analysis requests by response status",
+                            ["package", "analysis", "status"])
+ANALYSIS_ERRORS = Counter("jinjat_analysis_errors_total", "Failed analysis requests by Jinjat error code",
+                          ["package", "analysis", "code"])
+ANALYSIS_DURATION = Histogram("jinjat_analysis_request_duration_seconds",
+                              "Time to build the response of the analysis requests", ["package", "analysis"])
+ANALYSIS_PHASE_DURATION = Histogram("jinjat_analysis_phase_duration_seconds",
+                                    "Time spent in the compile, limit-wrap, execute, count, convert, transform and "
+                                    "serialize phases of the analysis requests", ["package", "analysis", "phase"])
+ANALYSIS_ROWS = Counter("jinjat_analysis_rows_total", "Rows returned by the analyses", ["package", "analysis"])
+ANALYSIS_BYTES = Counter("jinjat_analysis_response_bytes_total", "Response body bytes sent by the analyses",
+                         ["package", "analysis"])
+ANALYSIS_METRICS = [ANALYSIS_REQUESTS, ANALYSIS_ERRORS, ANALYSIS_DURATION, ANALYSIS_PHASE_DURATION, ANALYSIS_ROWS,
+                    ANALYSIS_BYTES]
+
+EVENT_LOOP_LAG = Histogram("jinjat_event_loop_lag_seconds", "Delay of the event loop heartbeats beyond their interval",
+                           [], buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+EVENT_LOOP_STALLS = Counter("jinjat_event_loop_stalls_total",
+                            "Heartbeats the event loop delayed beyond the stall threshold", [])
+EVENT_LOOP_METRICS = [EVENT_LOOP_LAG, EVENT_LOOP_STALLS]
+
+
+class RequestMetrics:
+    """Phase durations, rows and bytes of the analysis request that is being handled, see `measure_phase`"""
+
+    def __init__(self, package: str, analysis: str):
+        self.labels = (package, analysis)
+        self.started_at = time.perf_counter()
+        # phases are measured on the event loop and on the executor workers
+        self._lock = threading.Lock()
+        # phase -> seconds, in the order the phases started
+        self.phases: Dict[str, float] = {}
+        self.rows = 0
+        self.bytes = 0
+        # the SQL statement that is executed and the code of the adapter response, see `record_query`
+        self.sql: Optional[str] = None
+        self.adapter_response_code: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def add_phase(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """`Server-Timing` header value with the duration of each phase and the total in milliseconds, the count
+        query runs concurrently with the execute phase"""
+        with self._lock:
+            phases = list(self.phases.items())
+        phases.append(('total', self.duration))
+        return ', '.join(f'{phase};dur={seconds * 1000:.2f}' for phase, seconds in phases)
+
+    def add_rows(self, rows: int) -> None:
+        with self._lock:
+            self.rows += rows
+        ANALYSIS_ROWS.inc(self.labels, rows)
+
+    def add_bytes(self, size: int) -> None:
+        with self._lock:
+            self.bytes += size
+        ANALYSIS_BYTES.inc(self.labels, size)
+
+    def finish(self, status_code: int, error_code: Optional[str] = None) -> None:
+        ANALYSIS_REQUESTS.inc((*self.labels, str(status_code)))
+        if error_code is not None:
+            ANALYSIS_ERRORS.inc((*self.labels, error_code))
+        ANALYSIS_DURATION.observe(self.labels, self.duration)
+        for phase, seconds in self.phases.items():
+            ANALYSIS_PHASE_DURATION.observe((*self.labels, phase), seconds)
+
+
+_request_metrics: "contextvars.ContextVar[Optional[RequestMetrics]]" = \
+    contextvars.ContextVar("jinjat_request_metrics", default=None)
+
+
+def current_request_metrics() -> Optional[RequestMetrics]:
+    return _request_metrics.get()
+
+
+@contextmanager
+def track_request(metrics: RequestMetrics) -> Iterator[RequestMetrics]:
+    """Makes the metrics the ones that `measure_phase` records to in this context"""
+    token = _request_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _request_metrics.reset(token)
+
+
+def record_query(sql: str, adapter_response_code: Optional[str] = None) -> None:
+    """Records the executed SQL statement of the current request, if there is one"""
+    metrics = _request_metrics.get()
+    if metrics is not None:
+        metrics.sql = sql
+        metrics.adapter_response_code = adapter_response_code
+
+
+@contextmanager
+def measure_phase(phase: str) -> Iterator[None]:
+    """Records the duration of the block as the phase of the current request, if there is one, and traces it as
+    a span of the request if it's traced"""
+    metrics = _request_metrics.get()
+    with trace_span(phase):
+        if metrics is None:
+            yield
+            return
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            metrics.add_phase(phase, time.perf_counter() - started_at)
+
+
+def count_rows(batches: Iterator[T], metrics: Optional[RequestMetrics]) -> Iterator[T]:
+    """Counts the rows of the batches that are streamed, as they're fetched"""
+    for batch in batches:
+        if metrics is not None:
+            metrics.add_rows(len(batch))
+        yield batch
+
+
+async def count_streamed_bytes(content: AsyncIterator[Union[str, bytes]], metrics: RequestMetrics,
+                               on_complete: Optional[Callable[[], None]] = None) -> AsyncIterator[Union[str, bytes]]:
+    """Counts the bytes of the streamed response, `on_complete` is called once the whole response is sent"""
+    async for chunk in content:
+        metrics.add_bytes(len(chunk.encode() if isinstance(chunk, str) else chunk))
+        yield chunk
+    if on_complete is not None:
+        on_complete()
+
+
+def _cache_samples(project: str, name: str, stats: dict) -> Tuple[List[Sample], List[Sample], List[Sample]]:
+    labels = {"project": project, "cache": name}
+    lookups = stats["hits"] + stats["misses"]
+    return ([('', labels, stats["hits"])], [('', labels, stats["misses"])],
+            [('', labels, stats["hits"] / lookups if lookups else 0.0)])
+
+
+def collect_project_metrics(projects: List["DbtProject"]) -> List[MetricFamily]:
+    """Gauges and counters of the executors, the connection pool, admission control and the caches of the projects,
+    read from their stats when the metrics are scraped"""
+    families: Dict[str, Tuple[str, str, List[Sample]]] = {}
+
+    def add(name: str, metric_type: str, documentation: str, samples: List[Sample]) -> None:
+        families.setdefault(name, (metric_type, documentation, []))[2].extend(samples)
+
+    for project in projects:
+        name = project.project_name
+        for executor in [project.compile_executor, project.query_executor, project.cancel_executor]:
+            stats = executor.stats()
+            labels = {"project": name, "executor": executor.name}
+            add("jinjat_executor_queued_jobs", "gauge", "Jobs waiting for an executor worker",
+                [('', labels, stats["queued"])])
+            add("jinjat_executor_active_jobs", "gauge", "Jobs running on the executor workers",
+                [('', labels, stats["active"])])
+            add("jinjat_executor_workers", "gauge", "Workers of the executor", [('', labels, stats["max_workers"])])
+            add("jinjat_executor_rejected_jobs_total", "counter", "Jobs rejected as the executor queue was full",
+                [('', labels, stats["rejected"])])
+
+        labels = {"project": name}
+        stats = project.connection_pool.stats()
+        add("jinjat_connection_pool_connections", "gauge", "Open connections of the pool by state",
+            [('', {**labels, "state": "idle"}, stats["idle"]), ('', {**labels, "state": "in_use"}, stats["in_use"])])
+        add("jinjat_connection_pool_waiting", "gauge", "Checkouts waiting for a pooled connection",
+            [('', labels, stats["waiting"])])
+        add("jinjat_connection_pool_timeouts_total", "counter", "Checkouts that timed out waiting for a connection",
+            [('', labels, stats["timeouts"])])
+
+        stats = project.admission_limiter.stats()
+        add("jinjat_admission_in_flight", "gauge", "Analysis requests in flight", [('', labels, stats["in_flight"])])
+        add("jinjat_admission_waiting", "gauge", "Analysis requests waiting to be admitted",
+            [('', labels, stats["waiting"])])
+        add("jinjat_admission_rejected_total", "counter", "Analysis requests rejected by the project limit",
+            [('', labels, stats["rejected"])])
+
+        add("jinjat_cancellations_total", "counter", "Cancelled analysis requests and statements by event",
+            [('', {**labels, "event": event}, count) for event, count in project.cancellations.stats().items()])
+        add("jinjat_coalesced_queries_total", "counter", "Queries that shared the execution of an identical query",
+            [('', labels, project.inflight_queries.coalesced)])
+
+        caches = {"compiled_sql": project.compiled_sql_cache, "row_count": project.row_count_cache,
+                  "limited_sql": project.limited_sql_cache}
+        caches.update({f"result:{unique_id}": cache for unique_id, cache in project.result_caches.items()})
+        for cache_name, cache in caches.items():
+            hits, misses, ratio = _cache_samples(name, cache_name, cache.stats())
+            add("jinjat_cache_hits_total", "counter", "Cache lookups that found an entry", hits)
+            add("jinjat_cache_misses_total", "counter", "Cache lookups that found no entry", misses)
+            add("jinjat_cache_hit_ratio", "gauge", "Share of the cache lookups that found an entry", ratio)
+
+    return [MetricFamily(name, metric_type, documentation, samples)
+            for name, (metric_type, documentation, samples) in families.items()]
+
+
+def render_metrics(projects: List["DbtProject"]) -> str:
+    families = [metric.collect() for metric in ANALYSIS_METRICS + EVENT_LOOP_METRICS] + \
+               collect_project_metrics(projects)
+    return '\n'.join(family.render() for family in families) + '\n'
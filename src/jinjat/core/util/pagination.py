@@ -0,0 +1,130 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+from typing import Any, List, Optional
+
+import agate
+from sqlglot import exp
+from starlette import status
+
+from jinjat.core.models import PaginationConfig
+from jinjat.core.util.api import JinjatErrorContainer, JinjatError, JinjatErrorCode
+from jinjat.core.util.sql import string_literal, ordered
+
+CURSOR_QUERY_PARAM = '_cursor'
+NEXT_CURSOR_HEADER = 'x-next-cursor'
+
+
+def invalid_cursor_error(message: str) -> JinjatErrorContainer:
+    return JinjatErrorContainer(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        errors=[JinjatError(code=JinjatErrorCode.Unknown, message=message)])
+
+
+def _encode_value(value: Any) -> Optional[list]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return ['b', value]
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return ['n', str(value)]
+    if isinstance(value, datetime.datetime):
+        return ['t', value.isoformat()]
+    if isinstance(value, datetime.date):
+        return ['d', value.isoformat()]
+    if isinstance(value, datetime.time):
+        return ['s', value.isoformat()]
+    return ['s', str(value)]
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """Encodes the sort key values of the last row of a page as an opaque, URL safe token"""
+    payload = json.dumps([_encode_value(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, key_size: int) -> List[Optional[list]]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, binascii.Error):
+        raise invalid_cursor_error(f"Invalid `{CURSOR_QUERY_PARAM}`")
+    if not isinstance(values, list) or len(values) != key_size or \
+            any(value is not None and (not isinstance(value, list) or len(value) != 2) for value in values):
+        raise invalid_cursor_error(f"Invalid `{CURSOR_QUERY_PARAM}`")
+    return values
+
+
+def _to_literal(value: Optional[list], dialect: Optional[str]) -> exp.Expression:
+    if value is None:
+        return exp.Null()
+    kind, literal = value
+    if kind == 'b' and isinstance(literal, bool):
+        return exp.Boolean(this=literal)
+    if not isinstance(literal, str):
+        raise invalid_cursor_error(f"Invalid `{CURSOR_QUERY_PARAM}`")
+    if kind == 'n':
+        # the number is rendered as is, make sure that it is one
+        try:
+            is_number = decimal.Decimal(literal).is_finite()
+        except decimal.InvalidOperation:
+            is_number = False
+        if not is_number:
+            raise invalid_cursor_error(f"Invalid `{CURSOR_QUERY_PARAM}`")
+        return exp.Literal.number(literal)
+    if kind == 'd':
+        return exp.cast(string_literal(literal, dialect), 'date')
+    if kind == 't':
+        return exp.cast(string_literal(literal, dialect), 'timestamp')
+    if kind == 's':
+        return string_literal(literal, dialect)
+    raise invalid_cursor_error(f"Invalid `{CURSOR_QUERY_PARAM}`")
+
+
+class KeysetPage:
+    """A page of a keyset (seek) paginated analysis. The rows are ordered by the sort key of the analysis and
+    the page starts after the sort key values in the cursor, so the database can seek to it rather than scanning
+    and skipping the previous pages like `OFFSET` does. `offset` only applies to the first page."""
+
+    def __init__(self, config: PaginationConfig, dialect: Optional[str], cursor: Optional[str] = None,
+                 offset: Optional[int] = None):
+        self.config = config
+        self.dialect = dialect
+        self.cursor = cursor
+        self.offset = offset if cursor is None else None
+        self._values = decode_cursor(cursor, len(config.key)) if cursor is not None else None
+
+    @property
+    def cache_key(self):
+        return self.cursor, self.offset
+
+    def seek_predicate(self) -> Optional[exp.Expression]:
+        """Predicate selecting the rows after the cursor, None for the first page"""
+        if self._values is None:
+            return None
+        values = [_to_literal(value, self.dialect) for value in self._values]
+        keys = [exp.column(exp.to_identifier(key)) for key in self.config.key]
+        compare = exp.LT if self.config.order == 'desc' else exp.GT
+        # (a, b) > (1, 2) is written as `a > 1 OR (a = 1 AND b > 2)` as not all warehouses support row values
+        conditions = []
+        for idx, key in enumerate(keys):
+            equals = [previous_key.eq(value.copy()) for previous_key, value in zip(keys[:idx], values[:idx])]
+            conditions.append(exp.and_(*equals, compare(this=key.copy(), expression=values[idx].copy())))
+        return exp.or_(*conditions)
+
+    def order_by(self) -> List[exp.Ordered]:
+        return [ordered(key, self.config.order == 'desc', self.dialect) for key in self.config.key]
+
+    def next_cursor(self, table: agate.Table, limit: Optional[int]) -> Optional[str]:
+        """Cursor of the next page, None if this is the last page"""
+        if limit is None or len(table.rows) < limit or len(table.rows) == 0:
+            return None
+        last_row = table.rows[-1]
+        try:
+            return encode_cursor([last_row[key] for key in self.config.key])
+        except KeyError as e:
+            raise JinjatErrorContainer(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                errors=[JinjatError(code=JinjatErrorCode.Unknown,
+                                    message=f"Pagination key {e} is not a column of the result")])
@@ -0,0 +1,300 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Generic, Iterator, List, Optional, Tuple, TypeVar
+
+from jinjat.core.log_controller import logger
+
+T = TypeVar("T")
+
+
+class PoolTimeout(Exception):
+    """No connection was released within the checkout timeout"""
+
+
+def _set_waiter_result(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ConnectionPool(Generic[T]):
+    """A bounded pool of connections. Idle connections are reused most recently released first, validated on
+    checkout if they've been idle longer than `validation_interval` and closed once they've been idle longer than
+    `idle_timeout`, keeping at least `min_size` open. Checkouts wait for a connection to be released when `max_size`
+    connections are in use. Connections are opened, validated and closed outside the lock."""
+
+    def __init__(self, open_connection: Callable[[], T], close_connection: Callable[[T], None],
+                 validate_connection: Optional[Callable[[T], None]] = None, min_size: int = 0, max_size: int = 10,
+                 idle_timeout: Optional[float] = 300, checkout_timeout: Optional[float] = 30,
+                 validation_interval: float = 0):
+        self.open_connection = open_connection
+        self.close_connection = close_connection
+        self.validate_connection = validate_connection
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.validation_interval = validation_interval
+
+        self._condition = threading.Condition()
+        # (connection, released at), the most recently released connection is the last one
+        self._idle: Deque[Tuple[T, float]] = deque()
+        # id of the checked out connections -> generation of the pool they're opened in
+        self._in_use: Dict[int, int] = {}
+        # event loops and futures of the `acquire_async` calls waiting for a connection
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+        # connections that are open or being opened
+        self._size = 0
+        self._generation = 0
+
+        self.waiting = 0
+        self.opened = 0
+        self.closed = 0
+        self.invalidated = 0
+        self.timeouts = 0
+
+    def acquire(self, timeout: Optional[float] = None) -> T:
+        """Checks out a connection, waiting at most `timeout` (defaults to `checkout_timeout`) seconds for one"""
+        deadline = self._get_deadline(timeout)
+        while True:
+            with self._condition:
+                reserved = self._try_reserve()
+                while reserved is None:
+                    remaining = self._get_remaining(deadline)
+                    self.waiting += 1
+                    try:
+                        self._condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+                    reserved = self._try_reserve()
+            connection = self._checkout(*reserved)
+            if connection is not None:
+                return connection
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> T:
+        """Like `acquire` but waits for a connection on the event loop rather than blocking a thread, so that the
+        checkouts waiting for a connection don't hold the executor threads the connections are released from"""
+        loop = asyncio.get_running_loop()
+        deadline = self._get_deadline(timeout)
+        while True:
+            while True:
+                with self._condition:
+                    reserved = self._try_reserve()
+                    if reserved is not None:
+                        break
+                    remaining = self._get_remaining(deadline)
+                    waiter = loop.create_future()
+                    self._waiters.append((loop, waiter))
+                    self.waiting += 1
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    pass
+                except asyncio.CancelledError:
+                    with self._condition:
+                        # pass the wake up on if it was for this checkout, the waiter is taken out of the line once
+                        # it's woken up even if the cancellation beats setting its result
+                        if (loop, waiter) not in self._waiters:
+                            self._wake_up()
+                    raise
+                finally:
+                    with self._condition:
+                        self.waiting -= 1
+                        if (loop, waiter) in self._waiters:
+                            self._waiters.remove((loop, waiter))
+            checkout = loop.run_in_executor(None, self._checkout, *reserved)
+            try:
+                connection = await asyncio.shield(checkout)
+            except asyncio.CancelledError:
+                checkout.add_done_callback(self._release_abandoned)
+                raise
+            if connection is not None:
+                return connection
+
+    def _release_abandoned(self, checkout: asyncio.Future) -> None:
+        if not checkout.cancelled() and checkout.exception() is None and checkout.result() is not None:
+            self.release(checkout.result())
+
+    def _get_deadline(self, timeout: Optional[float]) -> Optional[float]:
+        timeout = self.checkout_timeout if timeout is None else timeout
+        return None if timeout is None else time.monotonic() + timeout
+
+    def _get_remaining(self, deadline: Optional[float]) -> Optional[float]:
+        # called with the lock held when there is no connection to check out
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            self.timeouts += 1
+            raise PoolTimeout(f"All {self.max_size} connections are in use")
+        return remaining
+
+    def _try_reserve(self) -> Optional[Tuple[Optional[T], float, int, List[T]]]:
+        """An idle connection or a free slot to open a new one in, along with the expired idle connections, None if
+        all the connections are in use. Closing the expired connections frees their slots, so there is always
+        either an idle connection or a free slot if there are any."""
+        # called with the lock held
+        expired = self._pop_expired()
+        if self._idle:
+            connection, released_at = self._idle.pop()
+            return connection, released_at, self._generation, expired
+        if self._size < self.max_size:
+            self._size += 1
+            return None, 0, self._generation, expired
+        return None
+
+    def _checkout(self, connection: Optional[T], released_at: float, generation: int,
+                  expired: List[T]) -> Optional[T]:
+        """Opens a connection in the reserved slot or validates the reserved idle connection,
+        None if it's invalid and the checkout should be retried"""
+        self._close_all(expired)
+        opened = False
+        if connection is None:
+            try:
+                connection = self.open_connection()
+            except BaseException:
+                self._discard(None)
+                raise
+            opened = True
+        elif self.validate_connection is not None and time.monotonic() - released_at >= self.validation_interval:
+            try:
+                self.validate_connection(connection)
+            except Exception as e:
+                logger().debug(f"Closing the pooled connection as it failed the validation: {e}")
+                with self._condition:
+                    self.invalidated += 1
+                self._discard(connection)
+                return None
+        with self._condition:
+            self._in_use[id(connection)] = generation
+            self.opened += opened
+        return connection
+
+    def _wake_up(self, all_waiters: bool = False) -> None:
+        # called with the lock held after a connection or a slot is freed
+        if all_waiters:
+            self._condition.notify_all()
+        else:
+            self._condition.notify()
+        while self._waiters:
+            loop, waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            loop.call_soon_threadsafe(_set_waiter_result, waiter)
+            if not all_waiters:
+                break
+
+    def release(self, connection: T, discard: bool = False) -> None:
+        """Returns the connection to the pool, `discard` closes it instead, e.g. when it's broken"""
+        with self._condition:
+            checked_out = id(connection) in self._in_use
+            generation = self._in_use.pop(id(connection), None)
+            if checked_out and not discard and generation == self._generation:
+                self._idle.append((connection, time.monotonic()))
+                self._wake_up()
+                return
+        if not checked_out:
+            # e.g. released twice, its slot isn't counted in the size of the pool
+            self._close_all([connection])
+            return
+        self._discard(connection)
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[T]:
+        connection = self.acquire(timeout)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def prewarm(self) -> None:
+        """Opens connections until there are `min_size` of them"""
+        while True:
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self.open_connection()
+            except BaseException:
+                self._discard(None)
+                raise
+            with self._condition:
+                self.opened += 1
+                self._idle.append((connection, time.monotonic()))
+                self._wake_up()
+
+    def close_idle(self) -> None:
+        """Closes the connections that are idle longer than `idle_timeout`"""
+        with self._condition:
+            expired = self._pop_expired()
+        self._close_all(expired)
+
+    def close_all(self) -> None:
+        """Closes the idle connections, the ones that are in use are closed when they're released"""
+        with self._condition:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._generation += 1
+            self._wake_up(all_waiters=True)
+        self._close_all(idle)
+
+    def configure(self, validate_connection: Optional[Callable[[T], None]] = None, min_size: int = 0,
+                  max_size: int = 10, idle_timeout: Optional[float] = 300, checkout_timeout: Optional[float] = 30,
+                  validation_interval: float = 0) -> None:
+        """Applies the settings and closes the connections opened before, see `close_all`. The pool stays the same
+        so that the connections that are checked out are released to it."""
+        with self._condition:
+            self.validate_connection = validate_connection
+            self.min_size = min(min_size, max_size)
+            self.max_size = max_size
+            self.idle_timeout = idle_timeout
+            self.checkout_timeout = checkout_timeout
+            self.validation_interval = validation_interval
+        self.close_all()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self.waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "opened": self.opened,
+                "closed": self.closed,
+                "invalidated": self.invalidated,
+                "timeouts": self.timeouts,
+            }
+
+    def _pop_expired(self) -> List[T]:
+        # called with the lock held, the oldest connections are the first ones
+        if self.idle_timeout is None:
+            return []
+        expired = []
+        expires_before = time.monotonic() - self.idle_timeout
+        while self._idle and self._size > self.min_size and self._idle[0][1] < expires_before:
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+        return expired
+
+    def _discard(self, connection: Optional[T]) -> None:
+        with self._condition:
+            self._size -= 1
+            self._wake_up()
+        if connection is not None:
+            self._close_all([connection])
+
+    def _close_all(self, connections: List[T]) -> None:
+        for connection in connections:
+            try:
+                self.close_connection(connection)
+            except Exception as e:
+                logger().debug(f"Unable to close the pooled connection: {e}")
+        with self._condition:
+            self.closed += len(connections)
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,105 @@
+import os
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Dict, List, Optional
+
+PROFILE_QUERY_PARAM = '_profile'
+# seconds between the samples
+PROFILE_INTERVAL = 0.002
+
+# innermost frames of the threads that are waiting for work rather than doing it, e.g. idle executor workers
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('thread.py', '_worker'),
+}
+
+
+class _CallNode:
+    def __init__(self, name: str):
+        self.name = name
+        self.samples = 0
+        self.children: Dict[str, '_CallNode'] = {}
+
+    def to_dict(self, interval: float) -> dict:
+        return {
+            "name": self.name,
+            "samples": self.samples,
+            # milliseconds
+            "duration": round(self.samples * interval * 1000, 3),
+            "children": [child.to_dict(interval)
+                         for child in sorted(self.children.values(), key=lambda node: -node.samples)],
+        }
+
+
+def _get_frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of all the threads of the process every `interval` seconds from a background thread and
+    aggregates them into a call tree per thread, so that both the event loop and the executor workers that compile
+    and query for the request are covered. The threads serving concurrent requests are sampled as well."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._roots: Dict[str, _CallNode] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+        self._duration = 0.0
+
+    def start(self) -> None:
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="jinjat-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._duration = time.perf_counter() - self._started_at
+
+    def _run(self) -> None:
+        thread_names = {}
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+                if thread_id not in thread_names:
+                    thread_names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                self._add_stack(thread_names.get(thread_id, str(thread_id)), frame)
+
+    def _add_stack(self, thread_name: str, frame: FrameType) -> None:
+        stack: List[FrameType] = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        node = self._roots.setdefault(thread_name, _CallNode(thread_name))
+        node.samples += 1
+        for caller in reversed(stack):
+            name = _get_frame_name(caller)
+            child = node.children.get(name)
+            if child is None:
+                child = node.children[name] = _CallNode(name)
+            child.samples += 1
+            node = child
+
+    def to_dict(self) -> dict:
+        return {
+            # milliseconds
+            "duration": round(self._duration * 1000, 3),
+            "interval": self.interval * 1000,
+            "samples": self.samples,
+            "threads": [root.to_dict(self.interval)
+                        for root in sorted(self._roots.values(), key=lambda node: -node.samples)],
+        }
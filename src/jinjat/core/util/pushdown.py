@@ -0,0 +1,274 @@
+import decimal
+from copy import deepcopy
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import jmespath
+from jmespath.parser import ParsedResult
+from sqlglot import exp
+from sqlglot.errors import ParseError
+from starlette import status
+from starlette.requests import Request
+
+from jinjat.core.util.api import JinjatErrorContainer, JinjatError, JinjatErrorCode
+from jinjat.core.util.pagination import KeysetPage
+from jinjat.core.util.sql import string_literal, wrap_query, ordered
+
+SORT_QUERY_PARAM = '_sort'
+ORDER_QUERY_PARAM = '_order'
+FIELDS_QUERY_PARAM = '_fields'
+
+# `column_gte=1` filters use the suffix as the operator, `column=1` is an equality filter
+FILTER_OPERATORS = {
+    'ne': exp.NEQ,
+    'lt': exp.LT,
+    'lte': exp.LTE,
+    'gt': exp.GT,
+    'gte': exp.GTE,
+    'like': exp.Like,
+}
+LIKE_ESCAPE = '\\'
+# dialects without the `ESCAPE` clause, their LIKE patterns are escaped with a backslash already
+LIKE_ESCAPE_UNSUPPORTED = {'bigquery'}
+TRUE_VALUES = {'true', '1', 't', 'yes'}
+FALSE_VALUES = {'false', '0', 'f', 'no'}
+
+
+def invalid_pushdown_error(message: str) -> JinjatErrorContainer:
+    return JinjatErrorContainer(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        errors=[JinjatError(code=JinjatErrorCode.Unknown, message=message)])
+
+
+def _parse_data_type(data_type: Optional[str], dialect: Optional[str]) -> Optional[exp.DataType]:
+    if not data_type:
+        return None
+    try:
+        return exp.DataType.build(data_type, dialect=dialect or '')
+    except (ParseError, ValueError):
+        return None
+
+
+def _to_literal(column: str, value: str, data_type: Optional[exp.DataType], dialect: Optional[str]) -> exp.Expression:
+    """Literal of the filter value, typed after the declared data type of the column"""
+    if data_type is None or data_type.this in exp.DataType.TEXT_TYPES:
+        return string_literal(value, dialect)
+    if data_type.this in exp.DataType.NUMERIC_TYPES:
+        try:
+            is_number = decimal.Decimal(value).is_finite()
+        except decimal.InvalidOperation:
+            is_number = False
+        if not is_number:
+            raise invalid_pushdown_error(f"`{column}` must be a number")
+        return exp.Literal.number(value)
+    if data_type.this == exp.DataType.Type.BOOLEAN:
+        if value.lower() not in TRUE_VALUES | FALSE_VALUES:
+            raise invalid_pushdown_error(f"`{column}` must be a boolean")
+        return exp.Boolean(this=value.lower() in TRUE_VALUES)
+    return exp.cast(string_literal(value, dialect), data_type.copy())
+
+
+def _like_contains(column: exp.Column, value: str, dialect: Optional[str]) -> exp.Expression:
+    """`column LIKE '%value%'`, the wildcards in the value are matched literally"""
+    for char in [LIKE_ESCAPE, '%', '_']:
+        value = value.replace(char, LIKE_ESCAPE + char)
+    like = exp.Like(this=column, expression=string_literal(f'%{value}%', dialect))
+    if dialect in LIKE_ESCAPE_UNSUPPORTED:
+        return like
+    return exp.Escape(this=like, expression=string_literal(LIKE_ESCAPE, dialect))
+
+
+def _split(value: str) -> List[str]:
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+class QueryPushdown:
+    """Filters, sort and field selection requested by the client which are pushed down into the SQL query
+    so that the warehouse returns only the requested rows and columns. Only the declared columns of the
+    analysis can be used."""
+
+    def __init__(self, filters: List[exp.Expression], order_by: List[exp.Ordered], columns: Optional[List[str]],
+                 dialect: Optional[str]):
+        self.filters = filters
+        self.order_by = order_by
+        self.columns = columns
+        self.dialect = dialect
+
+    @property
+    def cache_key(self) -> Tuple:
+        return (tuple(condition.sql() for condition in self.filters),
+                tuple(ordered.sql() for ordered in self.order_by),
+                tuple(self.columns) if self.columns is not None else None)
+
+    @staticmethod
+    def from_request(request: Request, columns: Dict[str, Optional[str]], dialect: Optional[str],
+                     template_params: Optional[Set[str]]) -> Optional['QueryPushdown']:
+        """Parses `_sort`, `_order`, `_fields` and the column filters from the query parameters. Query parameters
+        that the template reads are not filters, `template_params` is None if the template reads all of them, in
+        which case filters are rejected as they can't be told apart from the template inputs. Returns None if the
+        analysis has no declared columns or nothing is requested."""
+        if not columns:
+            return None
+        query_params = request.query_params
+        conditions: Dict[Tuple[str, str], List[str]] = {}
+        for key, value in query_params.multi_items():
+            if key.startswith('_') or (template_params is not None and key in template_params):
+                continue
+            if key in columns:
+                column, operator = key, 'eq'
+            else:
+                column, _, operator = key.rpartition('_')
+                if column not in columns or operator not in FILTER_OPERATORS:
+                    continue
+            if template_params is None:
+                raise invalid_pushdown_error(f"Can't filter by `{key}`, the analysis reads all the query "
+                                             f"parameters so it may be a parameter of the analysis")
+            conditions.setdefault((column, operator), []).append(value)
+
+        filters = []
+        for (column, operator), values in conditions.items():
+            data_type = _parse_data_type(columns[column], dialect)
+            identifier = exp.column(exp.to_identifier(column))
+            if operator == 'eq':
+                # repeated parameters match any of the values
+                literals = [_to_literal(column, value, data_type, dialect) for value in values]
+                filters.append(identifier.eq(literals[0]) if len(literals) == 1
+                               else exp.In(this=identifier, expressions=literals))
+                continue
+            for value in values:
+                if operator == 'like':
+                    filters.append(_like_contains(identifier.copy(), value, dialect))
+                else:
+                    filters.append(FILTER_OPERATORS[operator](
+                        this=identifier.copy(), expression=_to_literal(column, value, data_type, dialect)))
+
+        order_by = []
+        sort = _split(query_params.get(SORT_QUERY_PARAM, ''))
+        orders = _split(query_params.get(ORDER_QUERY_PARAM, '').lower())
+        for idx, column in enumerate(sort):
+            if column not in columns:
+                raise invalid_pushdown_error(f"Can't sort by `{column}`, it's not a column of the analysis")
+            order = orders[idx] if idx < len(orders) else 'asc'
+            if order not in ['asc', 'desc']:
+                raise invalid_pushdown_error(f"`{ORDER_QUERY_PARAM}` must be either `asc` or `desc`")
+            order_by.append(ordered(column, order == 'desc', dialect))
+
+        selected_columns = None
+        if FIELDS_QUERY_PARAM in query_params:
+            selected_columns = _split(query_params[FIELDS_QUERY_PARAM])
+            unknown_columns = [column for column in selected_columns if column not in columns]
+            if unknown_columns:
+                raise invalid_pushdown_error(f"Fields {unknown_columns} are not columns of the analysis")
+
+        if not filters and not order_by and selected_columns is None:
+            return None
+        return QueryPushdown(filters, order_by, selected_columns, dialect)
+
+    def filter_query(self, compiled_sql: str) -> str:
+        """The compiled SQL with only the filters applied, used to count the rows"""
+        if not self.filters:
+            return compiled_sql
+        return wrap_query(compiled_sql, self.dialect, where=exp.and_(*[f.copy() for f in self.filters]))
+
+
+def build_query(compiled_sql: str, dialect: Optional[str], limit: Optional[int],
+                page: Optional[KeysetPage] = None, pushdown: Optional[QueryPushdown] = None,
+                offset: Optional[int] = None) -> str:
+    """Wraps the compiled SQL with the pushed down filters, sort and field selection and the keyset page.
+    The keyset page defines the order of the rows and the offset, the sort key is always selected along with
+    the fields."""
+    conditions = [condition.copy() for condition in pushdown.filters] if pushdown is not None else []
+    order_by = [ordered.copy() for ordered in pushdown.order_by] if pushdown is not None else []
+    columns = list(pushdown.columns) if pushdown is not None and pushdown.columns is not None else None
+    if page is not None:
+        seek_predicate = page.seek_predicate()
+        if seek_predicate is not None:
+            conditions.append(seek_predicate)
+        order_by = page.order_by()
+        offset = page.offset
+        if columns is not None:
+            columns += [key for key in page.config.key if key not in columns]
+    where = exp.and_(*conditions) if conditions else None
+    return wrap_query(compiled_sql, dialect, where=where, order_by=order_by, limit=limit, offset=offset,
+                      columns=columns)
+
+
+def _get_projected_fields(node: dict) -> Optional[List[str]]:
+    """Fields of the rows that a jmespath projection reads, None if it's not a plain field selection"""
+    if node['type'] == 'field':
+        return [node['value']]
+    if node['type'] == 'multi_select_dict':
+        fields = [pair['children'][0] for pair in node['children']]
+    elif node['type'] == 'multi_select_list':
+        fields = node['children']
+    else:
+        return None
+    if any(field['type'] != 'field' for field in fields):
+        return None
+    return [field['value'] for field in fields]
+
+
+class TransformPushdown:
+    """The part of a `response.transform` jmespath expression that is pushed down into the SQL query. An index or
+    a slice of the rows becomes OFFSET and LIMIT and the fields of a projection the selected columns, `transform`
+    is the rest of the expression that is applied to the rows returned by the query."""
+
+    def __init__(self, offset: int, limit: Optional[int], columns: Optional[List[str]],
+                 transform: Callable[[Any], Any]):
+        self.offset = offset
+        self.limit = limit
+        self.columns = columns
+        self.transform = transform
+
+    @staticmethod
+    def from_expression(expression: Optional[str], columns: Dict[str, Optional[str]]) -> Optional['TransformPushdown']:
+        """Plans `[0]`, `[0].field`, `[1:10]`, `[*].field`, `[*].{alias: field}` and `[*].[field]` like transforms,
+        returns None if nothing of the expression can be pushed down and the whole result is needed."""
+        if not expression:
+            return None
+        parsed = deepcopy(jmespath.compile(expression).parsed)
+        if parsed['type'] == 'subexpression':
+            index, projection = parsed['children']
+        elif parsed['type'] == 'projection':
+            index, projection = parsed['children']
+            if index['type'] == 'identity':
+                index = None
+        elif parsed['type'] == 'index_expression':
+            index, projection = parsed, None
+        else:
+            return None
+
+        offset, limit = 0, None
+        if index is not None:
+            if index['type'] != 'index_expression' or index['children'][0]['type'] != 'identity':
+                return None
+            position = index['children'][1]
+            if position['type'] == 'index' and parsed['type'] != 'projection':
+                if position['value'] < 0:
+                    return None
+                offset, limit = position['value'], 1
+                # the row is the first one returned by the query
+                position['value'] = 0
+            elif position['type'] == 'slice':
+                slice_start, slice_stop, step = position['children']
+                if (slice_start or 0) < 0 or (slice_stop is not None and slice_stop < 0) \
+                        or (step is not None and step < 1):
+                    return None
+                offset = slice_start or 0
+                limit = max(slice_stop - offset, 0) if slice_stop is not None else None
+                position['children'] = [None, None, step]
+            else:
+                return None
+
+        fields = _get_projected_fields(projection) if projection is not None else None
+        if fields is not None and (not columns or any(field not in columns for field in fields)):
+            fields = None
+        if offset == 0 and limit is None and fields is None:
+            return None
+        return TransformPushdown(offset, limit, fields, ParsedResult(expression, parsed).search)
+
+    def apply_limit(self, limit: Optional[int], offset: Optional[int]) -> Tuple[Optional[int], int]:
+        """Limit and offset of the query, the transform selects rows from the ones requested by the client"""
+        stop = self.offset + self.limit if self.limit is not None else None
+        if limit is not None:
+            stop = limit if stop is None else min(stop, limit)
+        return (max(stop - self.offset, 0) if stop is not None else None), (offset or 0) + self.offset
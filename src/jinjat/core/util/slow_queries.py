@@ -0,0 +1,71 @@
+import heapq
+import itertools
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from jinjat.core.log_controller import LOG_PATH
+from jinjat.core.util.jsonl import JsonlSink
+from jinjat.core.util.metrics import RequestMetrics
+
+SLOW_QUERY_LOG_FILE = "slow_queries.jsonl"
+
+
+class SlowQueryLog:
+    """The slowest `max_entries` requests of each analysis that took longer than the threshold of the analysis,
+    along with the executed SQL, the request parameters and the phase durations"""
+
+    def __init__(self, max_entries: int, sink: Optional[JsonlSink] = None):
+        self.max_entries = max_entries
+        self.sink = sink
+        self._lock = threading.Lock()
+        # analysis -> min-heap of (duration, sequence, entry) so that the fastest entry is replaced first
+        self._entries: Dict[str, List[Tuple[float, int, Dict[str, Any]]]] = {}
+        self._sequence = itertools.count()
+        self.logged = 0
+
+    def record(self, metrics: RequestMetrics, request_info: Dict[str, Any], status_code: int,
+               threshold: Optional[float]) -> None:
+        duration = metrics.duration
+        if threshold is None or duration < threshold or self.max_entries <= 0:
+            return
+        package, analysis = metrics.labels
+        entry = {
+            "timestamp": datetime.utcnow().isoformat(),
+            "package": package,
+            "analysis": analysis,
+            **request_info,
+            "status_code": status_code,
+            # milliseconds
+            "duration": round(duration * 1000, 3),
+            "phases": {phase: round(seconds * 1000, 3) for phase, seconds in metrics.phases.items()},
+            "sql": metrics.sql,
+            "rows": metrics.rows,
+            "bytes": metrics.bytes,
+            "adapter_response_code": metrics.adapter_response_code,
+        }
+        with self._lock:
+            self.logged += 1
+            entries = self._entries.setdefault(analysis, [])
+            item = (duration, next(self._sequence), entry)
+            if len(entries) < self.max_entries:
+                heapq.heappush(entries, item)
+            else:
+                heapq.heappushpop(entries, item)
+        if self.sink is not None:
+            self.sink.write(entry)
+
+    def entries(self, analysis: Optional[str] = None) -> List[Dict[str, Any]]:
+        """The logged entries, slowest first"""
+        with self._lock:
+            items = [item for key, entries in self._entries.items() if analysis is None or key == analysis
+                     for item in entries]
+        return [entry for _, _, entry in sorted(items, key=lambda item: item[0], reverse=True)]
+
+    def close(self) -> None:
+        if self.sink is not None:
+            self.sink.close()
+
+    @staticmethod
+    def create(max_entries: int, file: bool) -> 'SlowQueryLog':
+        return SlowQueryLog(max_entries, JsonlSink(LOG_PATH / SLOW_QUERY_LOG_FILE) if file else None)
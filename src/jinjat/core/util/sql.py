@@ -0,0 +1,127 @@
+import re
+from typing import Optional, List
+
+from sqlglot import exp
+from sqlglot.dialects.dialect import Dialect, Dialects
+from sqlglot.errors import SqlglotError
+from sqlglot.tokens import TokenType
+
+# dbt adapter types whose sqlglot dialect has a different name
+ADAPTER_DIALECTS = {
+    'sqlserver': 'tsql',
+    'synapse': 'tsql',
+    'fabric': 'tsql',
+    'athena': 'presto',
+    'glue': 'spark',
+}
+SUPPORTED_DIALECTS = {dialect.value for dialect in Dialects if dialect.value}
+
+# EXPLAIN statement and the pattern matching the estimated row count of the root of the plan
+EXPLAIN_ROW_ESTIMATES = {
+    'postgres': ('EXPLAIN {sql}', re.compile(r'rows=(\d+)')),
+    'redshift': ('EXPLAIN {sql}', re.compile(r'rows=(\d+)')),
+    'duckdb': ('EXPLAIN {sql}', re.compile(r'~([\d,]+) rows|EC: (\d+)')),
+}
+
+# OFFSET and FETCH require an ORDER BY in T-SQL, the `limit_query` macro uses TOP
+LIMIT_UNSUPPORTED_DIALECTS = {'tsql'}
+
+QUERY_PLACEHOLDER = '__jinjat_query__'
+QUERY_ALIAS = '_jinjat_query'
+
+
+def get_sqlglot_dialect(adapter_type: str) -> Optional[str]:
+    """sqlglot dialect of the dbt adapter, None if sqlglot doesn't support it"""
+    dialect = ADAPTER_DIALECTS.get(adapter_type, adapter_type)
+    return dialect if dialect in SUPPORTED_DIALECTS else None
+
+
+def string_literal(value: str, dialect: Optional[str]) -> exp.Literal:
+    """sqlglot only escapes the quotes, backslashes have to be escaped as well for the dialects
+    where they are the escape character"""
+    if '\\' in Dialect.get_or_raise(dialect).tokenizer_class.STRING_ESCAPES:
+        value = value.replace('\\', '\\\\')
+    return exp.Literal.string(value)
+
+
+def ordered(column: str, desc: bool, dialect: Optional[str]) -> exp.Ordered:
+    """Orders by the column in the default NULL ordering of the dialect, so that no
+    `NULLS FIRST/LAST` is rendered as not every warehouse supports it"""
+    null_ordering = Dialect.get_or_raise(dialect).null_ordering
+    nulls_first = null_ordering != 'nulls_are_last' and (null_ordering == 'nulls_are_small') != desc
+    return exp.Ordered(this=exp.column(exp.to_identifier(column)), desc=desc, nulls_first=nulls_first)
+
+
+def wrap_query(sql: str, dialect: Optional[str], where: Optional[exp.Expression] = None,
+               order_by: Optional[List[exp.Ordered]] = None, limit: Optional[int] = None,
+               offset: Optional[int] = None, columns: Optional[List[str]] = None) -> str:
+    """Wraps the compiled SQL in a `SELECT * FROM (sql)` subquery with the given clauses
+    rendered in the dialect of the adapter. The compiled SQL is never parsed."""
+    projection = [exp.column(exp.to_identifier(column)) for column in columns] if columns else ['*']
+    select = exp.select(*projection).from_(exp.alias_(exp.to_table(QUERY_PLACEHOLDER), QUERY_ALIAS, table=True))
+    if where is not None:
+        select = select.where(where)
+    if order_by:
+        select = select.order_by(*order_by)
+    if limit is not None:
+        select = select.limit(limit)
+    if offset:
+        select = select.offset(offset)
+    # new lines as the compiled SQL may end with a comment
+    subquery = f"(\n{sql.strip().rstrip(';')}\n)"
+    return select.sql(dialect=dialect or '').replace(QUERY_PLACEHOLDER, subquery, 1)
+
+
+def _get_limit_clause(dialect: str, limit: Optional[int], offset: Optional[int]) -> Optional[str]:
+    """LIMIT and OFFSET clause of the dialect, None if it's not a clause at the end of the statement, e.g. `TOP`"""
+    select = exp.select('*').from_(QUERY_PLACEHOLDER)
+    if limit is not None:
+        select = select.limit(limit)
+    if offset:
+        select = select.offset(offset)
+    prefix = select.sql(dialect=dialect).partition(QUERY_PLACEHOLDER)
+    if prefix[0] != 'SELECT * FROM ':
+        return None
+    return prefix[2].strip()
+
+
+def limit_query(sql: str, dialect: Optional[str], limit: Optional[int], offset: Optional[int] = None) -> Optional[str]:
+    """Adds LIMIT and OFFSET to the compiled SQL in the dialect of the adapter. The SQL is parsed to find out if it's
+    a query that the clause can be appended to, queries which already have a LIMIT or OFFSET and set operations are
+    wrapped in a subquery instead. The compiled SQL itself is never regenerated from the AST as sqlglot doesn't
+    round trip every function of every dialect. Returns None if sqlglot can't parse the SQL."""
+    if dialect is None or dialect in LIMIT_UNSUPPORTED_DIALECTS:
+        return None
+    sql_dialect = Dialect.get_or_raise(dialect)()
+    try:
+        tokens = sql_dialect.tokenize(sql)
+        expressions = sql_dialect.parser().parse(tokens, sql)
+    except SqlglotError:
+        return None
+    expressions = [expression for expression in expressions if expression is not None]
+    if len(expressions) != 1 or not isinstance(expressions[0], (exp.Select, exp.Union)) \
+            or expressions[0].find(exp.Command) is not None:
+        return None
+    query = expressions[0]
+    if isinstance(query, exp.Select) and not query.args.get('limit') and not query.args.get('offset'):
+        clause = _get_limit_clause(dialect, limit, offset)
+        # cut the trailing semicolons and comments
+        statement_end = max(token.end for token in tokens if token.token_type != TokenType.SEMICOLON)
+        if clause is not None:
+            return f"{sql[:statement_end]}\n{clause}"
+    return wrap_query(sql, dialect, limit=limit, offset=offset)
+
+
+def get_explain_query(sql: str, dialect: Optional[str]) -> Optional[str]:
+    """EXPLAIN statement returning the estimated row count of the query, None if the dialect doesn't have one"""
+    if dialect not in EXPLAIN_ROW_ESTIMATES:
+        return None
+    return EXPLAIN_ROW_ESTIMATES[dialect][0].format(sql=sql.strip().rstrip(';'))
+
+
+def parse_explain_row_estimate(plan: str, dialect: Optional[str]) -> Optional[int]:
+    """The estimated row count of the first, i.e. root, node of the EXPLAIN output"""
+    match = EXPLAIN_ROW_ESTIMATES[dialect][1].search(plan)
+    if match is None:
+        return None
+    return int(next(group for group in match.groups() if group is not None).replace(',', ''))
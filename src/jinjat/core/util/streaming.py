@@ -0,0 +1,90 @@
+import csv
+import datetime
+import decimal
+import io
+import json
+import uuid
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Sequence, TypeVar
+
+from starlette.requests import Request
+
+from jinjat.core.util.arrow import ARROW_FORMATS
+from jinjat.core.util.executor import BoundedExecutor
+
+T = TypeVar("T")
+
+FETCH_BATCH_SIZE = 1000
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+CSV_MEDIA_TYPE = 'text/csv'
+STREAM_FORMATS = {'ndjson': NDJSON_MEDIA_TYPE, 'csv': CSV_MEDIA_TYPE, **ARROW_FORMATS}
+
+
+def get_stream_format(request: Request) -> Optional[str]:
+    """Streaming format requested via `_format` query parameter or the `Accept` header"""
+    requested_format = request.query_params.get('_format')
+    if requested_format in STREAM_FORMATS:
+        return requested_format
+    accept = request.headers.get('accept', '')
+    for stream_format, media_type in STREAM_FORMATS.items():
+        if media_type in accept:
+            return stream_format
+    return None
+
+
+def iterate_row_batches(cursor: Any, batch_size: int = FETCH_BATCH_SIZE) -> Iterator[Sequence[Sequence[Any]]]:
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+async def iterate_in_executor(iterator: Iterator[T], close: Callable[[], Any],
+                              executor: BoundedExecutor) -> AsyncIterator[T]:
+    """Advances a blocking iterator in the executor one item at a time, `close` is called once it's exhausted
+    or the consumer stops early, e.g. when the client disconnects"""
+    sentinel = object()
+    try:
+        while True:
+            # the query is already running, fetching its rows is never rejected
+            item = await executor.run(next, iterator, sentinel, bounded=False)
+            if item is sentinel:
+                break
+            yield item
+    finally:
+        await executor.run(close, bounded=False)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, bytes):
+        return value.decode(errors='replace')
+    return str(value)
+
+
+def _encode_ndjson(column_names: List[str], rows: Sequence[Sequence[Any]]) -> bytes:
+    return ''.join(json.dumps(dict(zip(column_names, row)), default=_json_default) + '\n' for row in rows).encode()
+
+
+def _encode_csv(rows: Sequence[Sequence[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode()
+
+
+async def encode_rows(stream_format: str, column_names: List[str],
+                      batches: AsyncIterator[Sequence[Sequence[Any]]]) -> AsyncIterator[bytes]:
+    """Encodes batches of rows as they are fetched so that only a single batch is kept in memory"""
+    if stream_format == 'csv':
+        yield _encode_csv([column_names])
+    async for rows in batches:
+        if stream_format == 'csv':
+            yield _encode_csv(rows)
+        else:
+            yield _encode_ndjson(column_names, rows)
@@ -0,0 +1,203 @@
+import collections
+import contextvars
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from jinjat.core.log_controller import LOG_PATH
+from jinjat.core.util.jsonl import JsonlSink
+
+T = TypeVar("T")
+
+TRACEPARENT_HEADER = "traceparent"
+# sent back so that the clients can look up the trace of their request
+TRACERESPONSE_HEADER = "traceresponse"
+TRACES_FILE = "traces.jsonl"
+# W3C trace context: version-trace_id-parent_id-flags
+TRACEPARENT_REGEX = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+SAMPLED_FLAG = 0x01
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Trace id, parent span id and whether the parent is sampled, None if the header is missing or invalid"""
+    match = TRACEPARENT_REGEX.match(header.strip().lower()) if header else None
+    if match is None:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & SAMPLED_FLAG)
+
+
+class Span:
+    """A timed operation of a trace, the spans of a request share its trace id and form a tree through their parent
+    span ids. The span is exported once it ends."""
+
+    def __init__(self, tracer: 'Tracer', name: str, trace_id: str, parent_id: Optional[str],
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "unset"
+        self.error: Optional[str] = None
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{SAMPLED_FLAG:02x}"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.error = f"{type(error).__name__}: {error}"
+
+    def end(self) -> None:
+        if self.end_time is not None:
+            return
+        self.end_time = time.time_ns()
+        if self.status == "unset":
+            self.status = "ok"
+        self.tracer.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            # nanoseconds since the epoch
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            # milliseconds
+            "duration": round((self.end_time - self.start_time) / 1e6, 3) if self.end_time is not None else None,
+            "attributes": self.attributes,
+            "status": self.status,
+            "error": self.error,
+        }
+
+
+class InMemorySpanExporter:
+    """Keeps the last `max_spans` finished spans"""
+
+    def __init__(self, max_spans: int):
+        self._lock = threading.Lock()
+        self._spans: Deque[dict] = collections.deque(maxlen=max_spans)
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span.to_dict())
+
+    def spans(self, trace_id: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            return [span for span in self._spans if trace_id is None or span["trace_id"] == trace_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._spans.clear()
+
+    def close(self) -> None:
+        pass
+
+
+class FileSpanExporter(InMemorySpanExporter):
+    """Appends the finished spans to a rotating JSON lines file as well as keeping the last `max_spans`"""
+
+    def __init__(self, max_spans: int, sink: JsonlSink):
+        super().__init__(max_spans)
+        self.sink = sink
+
+    def export(self, span: Span) -> None:
+        super().export(span)
+        self.sink.write(span.to_dict())
+
+    def close(self) -> None:
+        self.sink.close()
+
+
+class Tracer:
+    def __init__(self, exporter: InMemorySpanExporter):
+        self.exporter = exporter
+
+    def start_span(self, name: str, traceparent: Optional[str] = None,
+                   attributes: Optional[Dict[str, Any]] = None) -> Optional[Span]:
+        """Starts the root span of a request, continuing the trace of `traceparent` if it's valid. Returns None if
+        the caller didn't sample the trace."""
+        parent = parse_traceparent(traceparent)
+        if parent is None:
+            return Span(self, name, secrets.token_hex(16), None, attributes)
+        trace_id, parent_id, sampled = parent
+        return Span(self, name, trace_id, parent_id, attributes) if sampled else None
+
+    def export(self, span: Span) -> None:
+        self.exporter.export(span)
+
+    def close(self) -> None:
+        self.exporter.close()
+
+    @staticmethod
+    def create(exporter: str, max_spans: int) -> 'Tracer':
+        if exporter == 'file':
+            return Tracer(FileSpanExporter(max_spans, JsonlSink(LOG_PATH / TRACES_FILE)))
+        return Tracer(InMemorySpanExporter(max_spans))
+
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("jinjat_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def activate_span(span: Span) -> Iterator[Span]:
+    """Makes the span the parent of the spans started in this context"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def use_span(span: Span) -> Iterator[Span]:
+    """Activates the span and ends it along with the block"""
+    with activate_span(span):
+        try:
+            yield span
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            span.end()
+
+
+@contextmanager
+def trace_span(name: str, attributes: Optional[Dict[str, Any]] = None) -> Iterator[Optional[Span]]:
+    """Traces the block as a child span of the current span, if the request is traced"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    with use_span(Span(parent.tracer, name, parent.trace_id, parent.span_id, attributes)) as span:
+        yield span
+
+
+async def end_after_stream(content: AsyncIterator[T], span: Span) -> AsyncIterator[T]:
+    """Ends the span once the whole response is streamed"""
+    try:
+        async for chunk in content:
+            yield chunk
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        span.end()
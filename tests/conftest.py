@@ -1,16 +1,29 @@
+import os
+import shutil
+
 import pytest
+from starlette.testclient import TestClient
 
 import jinjat.core.server
+from jinjat.core.dbt.dbt_project import DbtProject, DbtTarget
+
+FIXTURE_PROJECT_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "duckdb_project")
+
+
+@pytest.fixture(scope="session")
+def project_dir(tmp_path_factory) -> str:
+    """A copy of the DuckDB fixture project, dbt writes its artifacts into the project directory"""
+    project_dir = tmp_path_factory.mktemp("dbt") / "duckdb_project"
+    shutil.copytree(FIXTURE_PROJECT_DIR, project_dir)
+    return str(project_dir)
+
+
+@pytest.fixture(scope="session")
+def client(project_dir) -> TestClient:
+    app = jinjat.core.server.get_multi_tenant_app(DbtTarget(project_dir=project_dir, profiles_dir=project_dir))
+    return TestClient(app)
 
 
-@pytest.fixture(scope="session", autouse=True)
-def register_dbt_project():
-    for name_override, project_dir in [
-        ("dbt_project", "tests/sqlfluff_templater/fixtures/dbt/dbt_project")
-    ]:
-        jinjat.core.server.app.state.dbt_project_container.add_project(
-            name_override=name_override,
-            project_dir=project_dir,
-            profiles_dir="tests/sqlfluff_templater/fixtures/dbt/profiles_yml",
-            target="dev",
-        )
+@pytest.fixture(scope="session")
+def dbt_project(client) -> DbtProject:
+    return jinjat.core.server.app.state.dbt_project_container.get_default_project()
@@ -0,0 +1 @@
+select 1 as id, {{ jinjat_request.query | length }} as params
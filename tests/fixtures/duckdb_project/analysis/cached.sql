@@ -0,0 +1 @@
+select random() as value, {{ jinjat_request.query.get('n', 0) }} as n
@@ -0,0 +1 @@
+select id * 2 as doubled from {{ ref('ephemeral_numbers') }} order by id
@@ -0,0 +1 @@
+select range as id from range(1000) where range > 10
@@ -0,0 +1 @@
+select '{{ jinjat_request.body.name }}' as name, {{ jinjat_request.body.times }} as times, {{ jinjat_request.body.tags | length }} as tags
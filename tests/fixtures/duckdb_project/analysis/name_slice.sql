@@ -0,0 +1 @@
+select range as id, 'name_' || range::varchar as name from range(50)
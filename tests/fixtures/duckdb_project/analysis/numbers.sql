@@ -0,0 +1 @@
+select range as id, 'name_' || range::varchar as name from range({{ jinjat_request.query.get('n', 10) }})
@@ -0,0 +1 @@
+select range % 3 as grp, range as id from range(10)
@@ -0,0 +1,3 @@
+select * from (values (1, 'alice', true), (2, 'b_o%b', false), (3, 'carol', true), (4, 'bob', false))
+    as people(id, name, active)
+where id <= {{ jinjat_request.query.get('max_id', 100) }}
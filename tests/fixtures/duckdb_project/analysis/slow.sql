@@ -0,0 +1 @@
+select sum(a.range * b.range) as total from range({{ jinjat_request.query.n }}) a cross join range({{ jinjat_request.query.n }}) b
@@ -0,0 +1 @@
+select sum(a.range * b.range) as total from range(200000) a cross join range(200000) b
@@ -0,0 +1,2 @@
+{% macro limit_query(sql, limit) %}select * from ({{ sql }}) as _jinjat_limit limit {{ limit }}{% endmacro %}
+{% macro get_row_count_query(sql) %}select count(*) from ({{ sql }}) as _jinjat_count{% endmacro %}
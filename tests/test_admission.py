@@ -0,0 +1,114 @@
+import asyncio
+
+import httpx
+import pytest
+
+from jinjat.core.util.admission import Admission, AdmissionLimiter
+from jinjat.core.util.api import JinjatErrorContainer
+
+
+def test_requests_over_the_limit_are_rejected():
+    async def run():
+        limiter = AdmissionLimiter("test", 1)
+        assert await limiter.acquire(0)
+        assert not await limiter.acquire(0)
+        assert not await limiter.acquire(0.01)
+        assert limiter.stats() == {"max_in_flight": 1, "in_flight": 1, "waiting": 0, "rejected": 2}
+
+    asyncio.run(run())
+
+
+def test_released_slot_is_handed_over_to_the_first_waiter():
+    async def run():
+        limiter = AdmissionLimiter("test", 1)
+        await limiter.acquire(None)
+        first = asyncio.ensure_future(limiter.acquire(None))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(limiter.acquire(None))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 2
+
+        limiter.release()
+        assert await first
+        assert not second.done()
+        assert limiter.in_flight == 1
+
+        limiter.release()
+        assert await second
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_line():
+    async def run():
+        limiter = AdmissionLimiter("test", 1)
+        await limiter.acquire(None)
+        waiter = asyncio.ensure_future(limiter.acquire(None))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.waiting == 0
+
+        limiter.release()
+        assert limiter.in_flight == 0
+        assert await limiter.acquire(0)
+
+    asyncio.run(run())
+
+
+def test_slot_handed_over_to_a_cancelled_waiter_is_not_lost():
+    async def run():
+        limiter = AdmissionLimiter("test", 1)
+        await limiter.acquire(None)
+        waiter = asyncio.ensure_future(limiter.acquire(None))
+        next_waiter = asyncio.ensure_future(limiter.acquire(None))
+        await asyncio.sleep(0)
+
+        # the slot is handed over before the cancellation reaches the waiter
+        limiter.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert await asyncio.wait_for(next_waiter, 1)
+        assert limiter.in_flight == 1
+        limiter.release()
+        assert limiter.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_admission_releases_acquired_slots_when_rejected():
+    async def run():
+        analysis = AdmissionLimiter("analysis", 2)
+        project = AdmissionLimiter("project", 1)
+        admission = Admission([analysis, project], max_queue_wait=0, retry_after=None)
+
+        async with admission.admit():
+            with pytest.raises(JinjatErrorContainer) as error:
+                async with admission.admit():
+                    pass
+            assert error.value.status_code == 503
+            assert error.value.headers == {"Retry-After": "1"}
+            assert analysis.in_flight == 1
+
+        assert analysis.in_flight == 0 and project.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_analysis_requests_over_its_limit_are_rejected(client, dbt_project):
+    async def run():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(
+                async_client.get("/jinjat_test/1.0/admitted", params={"n": 5000}),
+                async_client.get("/jinjat_test/1.0/admitted", params={"n": 5001}))
+
+    responses = asyncio.run(run())
+    assert sorted(response.status_code for response in responses) == [200, 503]
+    rejected = next(response for response in responses if response.status_code == 503)
+    assert rejected.headers["Retry-After"] == "2"
+    assert dbt_project.admission_limiter.stats()["in_flight"] == 0
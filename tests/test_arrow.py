@@ -0,0 +1,50 @@
+import io
+
+import pytest
+
+pyarrow = pytest.importorskip("pyarrow")
+import pyarrow.parquet  # noqa: E402
+
+from jinjat.core.util.arrow import iterate_record_batches  # noqa: E402
+
+
+class RowCursor:
+    """A DB-API cursor without native Arrow support"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchmany(self, size):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+
+def test_rows_are_converted_to_record_batches():
+    batches = list(iterate_record_batches(RowCursor([(1, "a"), (2, None), (3, "c")]), ["id", "name"], 2))
+    assert [batch.num_rows for batch in batches] == [2, 1]
+    assert pyarrow.Table.from_batches(batches).to_pydict() == {"id": [1, 2, 3], "name": ["a", None, "c"]}
+
+
+def test_analysis_is_streamed_as_arrow(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 2500},
+                          headers={"accept": "application/vnd.apache.arrow.stream"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pyarrow.ipc.open_stream(response.content).read_all()
+    assert table.column_names == ["id", "name"]
+    assert table.num_rows == 2500
+    assert table.column("name")[2499].as_py() == "name_2499"
+
+
+def test_empty_result_is_streamed_with_its_schema(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 0, "_format": "arrow"})
+    table = pyarrow.ipc.open_stream(response.content).read_all()
+    assert table.column_names == ["id", "name"]
+    assert table.num_rows == 0
+
+
+def test_analysis_is_streamed_as_parquet(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 3, "_format": "parquet"})
+    assert response.status_code == 200
+    table = pyarrow.parquet.read_table(io.BytesIO(response.content))
+    assert table.to_pydict() == {"id": [0, 1, 2], "name": ["name_0", "name_1", "name_2"]}
@@ -0,0 +1,52 @@
+import time
+
+from jinjat.core.util.cache import LRUCache
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+
+def test_entries_are_evicted_by_size():
+    cache = LRUCache(10, max_size=10)
+    cache.put("a", "a", 6)
+    cache.put("b", "b", 4)
+    assert cache.size == 10
+    cache.put("c", "c", 1)
+    assert cache.get("a") is None
+    assert cache.size == 5
+    # larger than the whole cache
+    cache.put("d", "d", 11)
+    assert cache.get("d") is None
+    cache.put("b", "b", 1)
+    assert cache.size == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = LRUCache(10, ttl=0.01)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_analysis_results_are_cached(client, dbt_project):
+    cache = dbt_project.result_caches["analysis.jinjat_test.cached"]
+    first = client.get("/jinjat_test/1.0/cached", params={"n": 1}).json()
+    assert client.get("/jinjat_test/1.0/cached", params={"n": 1}).json() == first
+    # the compiled SQL and the `vary_on` headers are part of the key
+    assert client.get("/jinjat_test/1.0/cached", params={"n": 2}).json() != first
+    assert client.get("/jinjat_test/1.0/cached", params={"n": 1}, headers={"x-tenant": "a"}).json() != first
+    assert cache.stats()["hits"] == 1
+
+    dbt_project.safe_parse_project(reinit=False)
+    assert len(cache) == 0
+    assert client.get("/jinjat_test/1.0/cached", params={"n": 1}).json() != first
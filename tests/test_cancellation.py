@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+from starlette.requests import Request
+
+from jinjat.core.util.cancellation import CancellationStats, run_cancellable, CLIENT_CLOSED_REQUEST
+
+
+def test_handler_is_cancelled_when_the_client_disconnects():
+    async def run():
+        messages = [{"type": "http.request", "body": b"", "more_body": False}, {"type": "http.disconnect"}]
+
+        async def receive():
+            await asyncio.sleep(0.05)
+            return messages.pop(0)
+
+        cancelled = []
+
+        async def handler():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        stats = CancellationStats()
+        request = Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""},
+                          receive)
+        response = await run_cancellable(request, handler, 5, stats)
+        assert response.status_code == CLIENT_CLOSED_REQUEST
+        assert cancelled == [1]
+        assert stats.stats()["disconnects"] == 1
+
+    asyncio.run(run())
+
+
+def test_query_is_cancelled_on_timeout(client, dbt_project):
+    timeouts = dbt_project.cancellations.timeouts
+    started_at = time.monotonic()
+    response = client.get("/jinjat_test/1.0/timeout")
+    assert response.status_code == 504
+    assert time.monotonic() - started_at < 5
+    assert dbt_project.cancellations.timeouts == timeouts + 1
+
+    # the statement is interrupted rather than left running on the connection
+    deadline = time.monotonic() + 5
+    while dbt_project.cancellations.cancelled_statements == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert dbt_project.cancellations.cancelled_statements > 0
+    assert client.get("/jinjat_test/1.0/numbers", params={"n": 1}).status_code == 200
+    assert client.get("/admin/health").json()["result"]["cancellations"]["timeouts"] > 0
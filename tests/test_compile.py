@@ -0,0 +1,21 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from jinjat.core.models import DbtQueryRequestContext
+
+
+def test_compile_sql_does_not_add_nodes_to_the_manifest(dbt_project):
+    nodes = set(dbt_project.dbt.nodes)
+    result = dbt_project.compile_sql("select * from {{ ref('ephemeral_numbers') }}")
+    assert "__dbt__cte__ephemeral_numbers" in result.compiled_sql
+    assert result.node.depends_on.nodes == ["model.jinjat_test.ephemeral_numbers"]
+    assert set(dbt_project.dbt.nodes) == nodes
+
+
+def test_compile_sql_is_safe_to_call_concurrently(dbt_project):
+    def compile_sql(number: int) -> str:
+        ctx = DbtQueryRequestContext(method="GET", body=None, query={"n": str(number)})
+        return dbt_project.compile_sql("select {{ jinjat_request.query.n }} as n", ctx).compiled_sql
+
+    with ThreadPoolExecutor(8) as executor:
+        compiled = list(executor.map(compile_sql, range(50)))
+    assert compiled == [f"select {number} as n" for number in range(50)]
@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+
+from jinjat.core.util.concurrency import SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    async def run():
+        single_flight = SingleFlight()
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return len(calls)
+
+        results = await asyncio.gather(single_flight.do("key", call), single_flight.do("key", call))
+        assert results == [1, 1]
+        assert single_flight.coalesced == 1
+        assert len(single_flight) == 0
+
+    asyncio.run(run())
+
+
+def test_failure_is_raised_to_all_callers():
+    async def run():
+        single_flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.01)
+            raise ValueError("failed")
+
+        results = await asyncio.gather(single_flight.do("key", call), single_flight.do("key", call),
+                                       return_exceptions=True)
+        assert [type(result) for result in results] == [ValueError, ValueError]
+
+    asyncio.run(run())
+
+
+def test_cancelled_caller_does_not_cancel_the_call_of_the_others():
+    async def run():
+        single_flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        cancelled = asyncio.ensure_future(single_flight.do("key", call))
+        waiting = asyncio.ensure_future(single_flight.do("key", call))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+
+        assert await waiting == "result"
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+
+    asyncio.run(run())
+
+
+def test_last_cancelled_caller_cancels_the_call_and_new_callers_start_over():
+    async def run():
+        single_flight = SingleFlight()
+        wound_down = asyncio.Event()
+        cancelled_calls = []
+
+        async def slow_to_cancel():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled_calls.append(1)
+                # e.g. waiting for the statement that is being cancelled
+                await wound_down.wait()
+                raise
+
+        async def call():
+            return "new result"
+
+        caller = asyncio.ensure_future(single_flight.do("key", slow_to_cancel))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.sleep(0.01)
+        assert cancelled_calls == [1]
+        assert len(single_flight) == 0
+
+        # the cancelled call is still winding down
+        assert await asyncio.wait_for(single_flight.do("key", call), 1) == "new result"
+        assert single_flight.coalesced == 0
+
+        wound_down.set()
+        await asyncio.sleep(0.01)
+        assert len(single_flight) == 0
+
+    asyncio.run(run())
+
+
+def test_identical_analysis_requests_are_coalesced(client, dbt_project):
+    async def run():
+        transport = httpx.ASGITransport(app=client.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            coalesced = dbt_project.inflight_queries.coalesced
+            responses = await asyncio.gather(*[async_client.get("/jinjat_test/1.0/slow", params={"n": 8000})
+                                               for _ in range(3)])
+            assert [response.status_code for response in responses] == [200] * 3
+            assert responses[0].json() == responses[1].json() == responses[2].json()
+            assert dbt_project.inflight_queries.coalesced - coalesced == 2
+
+    asyncio.run(run())
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+import pytest
+
+from jinjat.core.util.executor import BoundedExecutor, ExecutorQueueFull
+
+
+def test_jobs_over_the_queue_are_rejected():
+    async def run():
+        executor = BoundedExecutor("test", 1, max_queue=1)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(executor.run(lambda: "queued"))
+        await asyncio.sleep(0.01)
+        assert executor.stats()["active"] == 1 and executor.stats()["queued"] == 1
+
+        with pytest.raises(ExecutorQueueFull):
+            await executor.run(lambda: "rejected")
+        # part of a job that is already running
+        unbounded = asyncio.ensure_future(executor.run(lambda: "unbounded", bounded=False))
+
+        release.set()
+        assert await asyncio.gather(running, queued, unbounded) == [True, "queued", "unbounded"]
+        stats = executor.stats()
+        assert (stats["rejected"], stats["started"], stats["queued"], stats["active"]) == (1, 3, 0, 0)
+        assert stats["max_wait"] > 0
+        executor.shutdown()
+
+    asyncio.run(run())
+
+
+def test_cancelled_job_leaves_the_queue():
+    async def run():
+        executor = BoundedExecutor("test", 1, max_queue=1)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(executor.run(lambda: "queued"))
+        await asyncio.sleep(0.01)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        assert executor.stats()["queued"] == 0
+
+        release.set()
+        await running
+        executor.shutdown()
+
+    asyncio.run(run())
+
+
+def test_health_reports_the_executors(client):
+    client.get("/jinjat_test/1.0/numbers", params={"n": 1})
+    executors = client.get("/admin/health").json()["result"]["executors"]
+    assert executors["compile"]["started"] > 0
+    assert executors["query"]["started"] > 0
+    assert executors["query"]["max_workers"] == 10
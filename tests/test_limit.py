@@ -0,0 +1,53 @@
+import pytest
+
+from jinjat.core.util.sql import limit_query
+
+
+@pytest.mark.parametrize("sql, dialect, expected", [
+    ("select * from t", "duckdb", "select * from t\nLIMIT 10 OFFSET 5"),
+    ("select * from t; -- done", "duckdb", "select * from t\nLIMIT 10 OFFSET 5"),
+    ("select x::int from t qualify row_number() over (partition by y order by z) = 1", "snowflake",
+     "select x::int from t qualify row_number() over (partition by y order by z) = 1\nLIMIT 10 OFFSET 5"),
+    ("select `a-b` from `project.dataset.t`", "bigquery",
+     "select `a-b` from `project.dataset.t`\nLIMIT 10 OFFSET 5"),
+])
+def test_limit_is_appended_to_the_compiled_sql(sql, dialect, expected):
+    assert limit_query(sql, dialect, 10, 5) == expected
+
+
+@pytest.mark.parametrize("sql", ["select * from t limit 100", "select 1 union all select 2"])
+def test_limited_queries_and_set_operations_are_wrapped(sql):
+    assert limit_query(sql, "postgres", 10) == f"SELECT * FROM (\n{sql}\n) AS _jinjat_query LIMIT 10"
+
+
+@pytest.mark.parametrize("sql, dialect", [
+    ("select * from t", "tsql"),
+    ("select * from t", None),
+    ("select * from (", "duckdb"),
+    ("select 1; select 2", "duckdb"),
+])
+def test_macro_is_used_when_sqlglot_cant_limit_the_query(sql, dialect):
+    assert limit_query(sql, dialect, 10) is None
+
+
+def test_start_is_applied_as_offset(client, dbt_project):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 20, "_start": 5, "_end": 8})
+    assert [row["id"] for row in response.json()] == [5, 6, 7]
+    assert response.headers["x-total-count"] == "20"
+    hits = dbt_project.limited_sql_cache.hits
+    client.get("/jinjat_test/1.0/numbers", params={"n": 20, "_start": 5, "_end": 8})
+    assert dbt_project.limited_sql_cache.hits == hits + 1
+
+
+def test_default_limit_applies_to_json_responses(client):
+    assert len(client.get("/jinjat_test/1.0/numbers", params={"n": 600}).json()) == 500
+    assert len(client.get("/jinjat_test/1.0/numbers", params={"n": 600, "_limit": 550}).json()) == 550
+
+
+def test_exports_are_not_limited(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 600, "_format": "ndjson"})
+    assert len(response.text.splitlines()) == 600
+
+
+def test_negative_limit_is_rejected(client):
+    assert client.get("/jinjat_test/1.0/numbers", params={"_limit": -1}).status_code == 400
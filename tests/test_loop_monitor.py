@@ -0,0 +1,43 @@
+import asyncio
+import time
+
+from jinjat.core.util.loop_monitor import LoopStallMonitor
+
+
+def test_stall_is_recorded_with_the_blocking_call():
+    def block_the_loop():
+        time.sleep(0.3)
+
+    async def run():
+        monitor = LoopStallMonitor(threshold=0.1, interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        block_the_loop()
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        return monitor
+
+    monitor = asyncio.run(run())
+    stats = monitor.stats()
+    assert stats["stalls"] == 1
+    assert stats["max_lag"] >= 200
+    assert "block_the_loop" in stats["recent_stalls"][0]["stack"]
+
+
+def test_monitor_is_disabled_without_threshold():
+    async def run():
+        monitor = LoopStallMonitor(threshold=None)
+        monitor.start()
+        await asyncio.sleep(0.01)
+        return monitor
+
+    assert asyncio.run(run())._task is None
+
+
+def test_health_probes_the_adapter_on_a_pooled_connection(client, dbt_project):
+    started = dbt_project.query_executor.stats()["started"]
+    result = client.get("/admin/health").json()["result"]
+    assert result["adapter_ready"] is True
+    assert "stalls" in result["event_loop"]
+    assert dbt_project.query_executor.stats()["started"] == started + 1
+    assert dbt_project.connection_pool.stats()["in_use"] == 0
@@ -0,0 +1,38 @@
+from jinjat.core.util.metrics import Counter, Histogram
+
+
+def test_counter_text_format():
+    counter = Counter("jinjat_test_total", "Test counter", ["analysis"])
+    counter.inc(('say "hi"\n',))
+    counter.inc(('say "hi"\n',), 2)
+    assert counter.collect().render() == "# HELP jinjat_test_total Test counter\n" \
+                                         "# TYPE jinjat_test_total counter\n" \
+                                         'jinjat_test_total{analysis="say \\"hi\\"\\n"} 3'
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    histogram = Histogram("jinjat_test_seconds", "Test histogram", ["analysis"], buckets=(0.1, 1))
+    for value in [0.05, 0.1, 0.5, 2]:
+        histogram.observe(("a",), value)
+    assert histogram.collect().render().splitlines()[2:] == [
+        'jinjat_test_seconds_bucket{analysis="a",le="0.1"} 2',
+        'jinjat_test_seconds_bucket{analysis="a",le="1"} 3',
+        'jinjat_test_seconds_bucket{analysis="a",le="+Inf"} 4',
+        'jinjat_test_seconds_sum{analysis="a"} 2.65',
+        'jinjat_test_seconds_count{analysis="a"} 4',
+    ]
+
+
+def test_metrics_endpoint(client):
+    assert client.get("/jinjat_test/1.0/numbers", params={"n": 3}).status_code == 200
+    response = client.get("/admin/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    labels = 'package="jinjat_test",analysis="analysis.jinjat_test.numbers"'
+    assert any(line.startswith(f'jinjat_analysis_requests_total{{{labels},status="200"}} ') for line in lines)
+    assert any(line.startswith(f'jinjat_analysis_phase_duration_seconds_count{{{labels},phase="execute"}} ')
+               for line in lines)
+    for executor in ["compile", "query", "cancel"]:
+        assert f'jinjat_executor_workers{{project="jinjat_test",executor="{executor}"}}' in response.text
+    assert "# TYPE jinjat_cache_hit_ratio gauge" in lines
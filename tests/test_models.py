@@ -0,0 +1,49 @@
+import datetime
+import decimal
+import json
+
+import agate
+import pytest
+
+from jinjat.core.models import _convert_table_to_dict
+
+COLUMN_NAMES = ["id", "name", "score", "day", "at", "even", "payload"]
+COLUMN_TYPES = [agate.Number(), agate.Text(), agate.Number(), agate.Date(), agate.DateTime(), agate.Boolean(),
+                agate.Text()]
+
+
+def convert_cell_by_cell(table: agate.Table, json_columns):
+    return [{name: json.loads(column_type.jsonify(value)) if name in json_columns else column_type.jsonify(value)
+             for name, column_type, value in zip(table.column_names, table.column_types, row)}
+            for row in table.rows]
+
+
+@pytest.fixture
+def table() -> agate.Table:
+    day = datetime.date(2023, 1, 1)
+    rows = [(i, f"name {i}", decimal.Decimal(i) / 7, day + datetime.timedelta(days=i),
+             datetime.datetime(2023, 1, 1, 12, i), i % 2 == 0, '{"id": %d, "tags": ["a"]}' % i) for i in range(5)]
+    rows.append((None, None, None, None, None, None, None))
+    return agate.Table(rows, COLUMN_NAMES, COLUMN_TYPES)
+
+
+def test_columns_are_converted_like_the_cells(table):
+    assert _convert_table_to_dict(table, []) == convert_cell_by_cell(table, [])
+
+
+def test_json_columns_are_parsed(table):
+    rows = _convert_table_to_dict(table, ["payload"])
+    assert rows[1]["payload"] == {"id": 1, "tags": ["a"]}
+    assert rows[1]["day"] == "2023-01-02"
+    assert rows[1]["score"] == pytest.approx(1 / 7)
+    assert rows[-1]["payload"] is None
+
+
+def test_malformed_json_values_are_not_merged_across_cells():
+    table = agate.Table([("1,[2",), ("3]",)], ["payload"], [agate.Text()])
+    with pytest.raises(ValueError):
+        _convert_table_to_dict(table, ["payload"])
+
+
+def test_table_without_columns():
+    assert _convert_table_to_dict(agate.Table([(), ()], [], []), []) == [{}, {}]
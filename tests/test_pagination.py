@@ -0,0 +1,71 @@
+import datetime
+import decimal
+
+import pytest
+from jinjat.core.models import PaginationConfig
+from jinjat.core.util.api import JinjatErrorContainer
+from jinjat.core.util.pagination import KeysetPage, decode_cursor, encode_cursor, _to_literal
+from jinjat.core.util.pushdown import build_query
+from jinjat.core.util.sql import string_literal, wrap_query, ordered
+
+
+def test_cursor_round_trip():
+    values = [1, decimal.Decimal("1.5"), "it's", datetime.date(2023, 1, 2), datetime.datetime(2023, 1, 2, 3, 4),
+              True, None]
+    literals = [_to_literal(value, "duckdb").sql(dialect="duckdb")
+                for value in decode_cursor(encode_cursor(values), len(values))]
+    assert literals == ["1", "1.5", "'it''s'", "CAST('2023-01-02' AS DATE)",
+                        "CAST('2023-01-02T03:04:00' AS TIMESTAMP)", "TRUE", "NULL"]
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", encode_cursor([1]), encode_cursor([1, 2, 3])])
+def test_invalid_cursor_is_rejected(cursor):
+    with pytest.raises(JinjatErrorContainer):
+        decode_cursor(cursor, 2)
+
+
+def test_numeric_cursor_values_are_validated():
+    with pytest.raises(JinjatErrorContainer):
+        _to_literal(['n', '1; drop table users'], None)
+
+
+def test_backslashes_are_escaped_for_dialects_that_use_them():
+    assert string_literal("a\\b", "mysql").sql(dialect="mysql") == "'a\\\\b'"
+    assert string_literal("a\\b", "postgres").sql(dialect="postgres") == "'a\\b'"
+
+
+def test_seek_predicate_and_order():
+    page = KeysetPage(PaginationConfig(key=["grp", "id"], order="desc"), "postgres", encode_cursor([1, 4]))
+    assert build_query("select 1 -- comment", "postgres", 10, page) == \
+        "SELECT * FROM (\nselect 1 -- comment\n) AS _jinjat_query " \
+        "WHERE grp < 1 OR (grp = 1 AND id < 4) ORDER BY grp DESC, id DESC LIMIT 10"
+
+
+def test_limit_and_offset_are_rendered_in_the_dialect():
+    assert wrap_query("select 1", "tsql", order_by=[ordered("id", False, "tsql")], limit=10,
+                      offset=5).endswith("ORDER BY id OFFSET 5 ROWS FETCH FIRST 10 ROWS ONLY")
+
+
+def test_pages_follow_the_cursor(client):
+    rows = []
+    response = client.get("/jinjat_test/1.0/pairs", params={"_limit": 4})
+    while True:
+        assert response.status_code == 200
+        rows += response.json()
+        if "x-next-cursor" not in response.headers:
+            break
+        next_url = response.headers["link"].split(";")[0].strip("<>")
+        assert f"_cursor={response.headers['x-next-cursor']}" in next_url
+        response = client.get(next_url)
+    expected = sorted((id % 3, id) for id in range(10))
+    assert [(row["grp"], row["id"]) for row in rows] == expected
+
+
+def test_first_page_with_offset(client):
+    response = client.get("/jinjat_test/1.0/pairs", params={"_start": 2, "_end": 4})
+    assert [row["id"] for row in response.json()] == [6, 9]
+    assert response.headers["x-total-count"] == "10"
+
+
+def test_invalid_limit_is_rejected(client):
+    assert client.get("/jinjat_test/1.0/pairs", params={"_limit": "ten"}).status_code == 400
@@ -0,0 +1,189 @@
+import asyncio
+
+import pytest
+
+from jinjat.core.util.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self, number: int):
+        self.number = number
+        self.closed = False
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.opened = []
+
+    def open(self) -> FakeConnection:
+        connection = FakeConnection(len(self.opened))
+        self.opened.append(connection)
+        return connection
+
+    def close(self, connection: FakeConnection) -> None:
+        connection.closed = True
+
+
+def create_pool(database: FakeDatabase, **kwargs) -> ConnectionPool[FakeConnection]:
+    kwargs.setdefault("checkout_timeout", 1)
+    return ConnectionPool(database.open, database.close, **kwargs)
+
+
+def test_released_connection_is_reused():
+    database = FakeDatabase()
+    pool = create_pool(database, max_size=2)
+    connection = pool.acquire()
+    pool.release(connection)
+
+    assert pool.acquire() is connection
+    assert len(database.opened) == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_close_all_discards_checked_out_connections_on_release():
+    database = FakeDatabase()
+    pool = create_pool(database, max_size=2)
+    idle, in_use = pool.acquire(), pool.acquire()
+    pool.release(idle)
+
+    pool.close_all()
+    assert idle.closed and not in_use.closed
+    assert pool.stats()["size"] == 1
+
+    pool.release(in_use)
+    assert in_use.closed
+    assert pool.stats()["size"] == 0
+    assert pool.stats()["idle"] == 0
+    assert pool.acquire() not in (idle, in_use)
+    assert pool.stats()["size"] == 1
+
+
+def test_release_of_unknown_connection_keeps_size():
+    database = FakeDatabase()
+    pool = create_pool(database, max_size=1)
+    connection = pool.acquire()
+    pool.release(connection, discard=True)
+    # released twice
+    pool.release(connection)
+    pool.release(FakeConnection(-1))
+
+    assert pool.stats()["size"] == 0
+    pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.01)
+
+
+def test_configure_keeps_checked_out_connections_counted():
+    database = FakeDatabase()
+    pool = create_pool(database, max_size=1)
+    connection = pool.acquire()
+
+    pool.configure(max_size=2, checkout_timeout=1)
+    second = pool.acquire()
+    assert pool.stats()["size"] == 2
+    with pytest.raises(PoolTimeout):
+        pool.acquire(timeout=0.01)
+
+    # opened before the configuration
+    pool.release(connection)
+    assert connection.closed
+    pool.release(second)
+    assert not second.closed
+    assert pool.stats()["size"] == 1
+
+
+def test_prewarm_opens_min_size_connections():
+    database = FakeDatabase()
+    pool = create_pool(database, min_size=2, max_size=3)
+    pool.prewarm()
+    assert pool.stats()["idle"] == 2
+
+    pool.close_all()
+    pool.prewarm()
+    assert pool.stats()["size"] == 2
+    assert len(database.opened) == 4
+
+
+def test_release_wakes_up_waiting_checkout():
+    async def run():
+        database = FakeDatabase()
+        pool = create_pool(database, max_size=1)
+        connection = await pool.acquire_async()
+        waiting = asyncio.ensure_future(pool.acquire_async())
+        await asyncio.sleep(0.01)
+        assert pool.stats()["waiting"] == 1
+
+        pool.release(connection)
+        assert await asyncio.wait_for(waiting, 1) is connection
+        assert pool.stats()["waiting"] == 0
+
+    asyncio.run(run())
+
+
+def test_close_all_wakes_up_waiting_checkout_once_a_slot_is_free():
+    async def run():
+        database = FakeDatabase()
+        pool = create_pool(database, max_size=1)
+        connection = await pool.acquire_async()
+        waiting = asyncio.ensure_future(pool.acquire_async())
+        await asyncio.sleep(0.01)
+
+        pool.close_all()
+        await asyncio.sleep(0.01)
+        # the checked out connection still holds the only slot
+        assert not waiting.done()
+
+        pool.release(connection)
+        new_connection = await asyncio.wait_for(waiting, 1)
+        assert connection.closed and new_connection is not connection
+        assert pool.stats()["size"] == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_checkout_leaves_the_line():
+    async def run():
+        database = FakeDatabase()
+        pool = create_pool(database, max_size=1)
+        connection = await pool.acquire_async()
+        cancelled = asyncio.ensure_future(pool.acquire_async())
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert pool.stats()["waiting"] == 0
+
+        pool.release(connection)
+        assert pool.stats()["idle"] == 1
+
+    asyncio.run(run())
+
+
+def test_cancelled_checkout_passes_its_wake_up_on():
+    async def run():
+        database = FakeDatabase()
+        pool = create_pool(database, max_size=1)
+        connection = await pool.acquire_async()
+        first = asyncio.ensure_future(pool.acquire_async())
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(pool.acquire_async())
+        await asyncio.sleep(0.01)
+
+        # the first checkout is cancelled before the wake up for it sets its waiter
+        first.cancel()
+        pool.release(connection)
+        await asyncio.gather(first, return_exceptions=True)
+
+        assert await asyncio.wait_for(second, 0.5) is connection
+        assert pool.stats()["timeouts"] == 0
+
+    asyncio.run(run())
+
+
+def test_queries_borrow_pooled_connections(client, dbt_project):
+    for n in range(5):
+        assert client.get("/jinjat_test/1.0/numbers", params={"n": n + 1}).status_code == 200
+    assert client.get("/jinjat_test/1.0/numbers", params={"n": 3, "_format": "ndjson"}).status_code == 200
+    stats = client.get("/admin/health").json()["result"]["connection_pool"]
+    assert stats == dbt_project.connection_pool.stats()
+    assert stats["in_use"] == 0
+    assert 1 <= stats["size"] <= 10
@@ -0,0 +1,38 @@
+import re
+import time
+
+from jinjat.core.util.profiler import SamplingProfiler
+
+
+def busy_wait(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_profiler_samples_the_call_tree():
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy_wait(0.1)
+    profiler.stop()
+    profile = profiler.to_dict()
+    assert profile["samples"] > 0
+
+    def names(node):
+        yield node["name"]
+        for child in node["children"]:
+            yield from names(child)
+
+    assert any(name.startswith("busy_wait (test_profiling.py:") for thread in profile["threads"]
+               for name in names(thread))
+
+
+def test_server_timing_lists_the_phases(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 3})
+    phases = dict(re.findall(r"([\w-]+);dur=([\d.]+)", response.headers["server-timing"]))
+    assert {"compile", "execute", "convert", "serialize", "total"} <= phases.keys()
+    assert float(phases["total"]) >= float(phases["execute"])
+
+
+def test_profile_requires_profiling_to_be_enabled(client):
+    assert client.get("/jinjat_test/1.0/numbers", params={"n": 3, "_profile": ""}).status_code == 403
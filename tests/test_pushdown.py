@@ -0,0 +1,72 @@
+import pytest
+from starlette.requests import Request
+
+from jinjat.core.util.api import JinjatErrorContainer
+from jinjat.core.util.pushdown import QueryPushdown, build_query
+
+COLUMNS = {"id": "integer", "name": "varchar", "active": "boolean"}
+
+
+def make_request(query_string: str) -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [],
+                    "query_string": query_string.encode()})
+
+
+def pushdown_sql(query_string: str, dialect: str = "duckdb", template_params=frozenset()) -> str:
+    pushdown = QueryPushdown.from_request(make_request(query_string), COLUMNS, dialect, template_params)
+    return build_query("select * from people", dialect, None, pushdown=pushdown)
+
+
+def test_filters_are_typed_after_the_columns():
+    assert pushdown_sql("id_gte=2&active=yes&name=a&name=b") == \
+        "SELECT * FROM (\nselect * from people\n) AS _jinjat_query " \
+        "WHERE id >= 2 AND active = TRUE AND name IN ('a', 'b')"
+
+
+@pytest.mark.parametrize("query_string", ["id=1 or 1=1", "active=maybe", "_sort=password", "_fields=id,password",
+                                          "_sort=id&_order=up"])
+def test_invalid_pushdown_is_rejected(query_string):
+    with pytest.raises(JinjatErrorContainer):
+        pushdown_sql(query_string)
+
+
+@pytest.mark.parametrize("dialect, condition", [
+    ("duckdb", "name LIKE '%50\\%\\_a\\\\%' ESCAPE '\\'"),
+    ("mysql", "name LIKE '%50\\\\%\\\\_a\\\\\\\\%' ESCAPE '\\\\'"),
+    ("bigquery", "name LIKE '%50\\\\%\\\\_a\\\\\\\\%'"),
+])
+def test_like_wildcards_are_escaped(dialect, condition):
+    assert pushdown_sql("name_like=50%_a\\", dialect).endswith(f"WHERE {condition}")
+
+
+def test_template_params_are_not_filters():
+    assert pushdown_sql("id=1&name=x", template_params={"id"}).endswith("WHERE name = 'x'")
+
+
+def test_filters_are_rejected_when_the_template_reads_every_param():
+    with pytest.raises(JinjatErrorContainer):
+        pushdown_sql("id=1", template_params=None)
+    assert pushdown_sql("other=1&_sort=id", template_params=None).endswith("ORDER BY id")
+
+
+def test_pushdown_api(client):
+    response = client.get("/jinjat_test/1.0/people", params={"active": "false", "_sort": "id", "_order": "desc",
+                                                             "_fields": "name", "_end": 10})
+    assert response.status_code == 200
+    assert response.json() == [{"name": "bob"}, {"name": "b_o%b"}]
+    assert response.headers["x-total-count"] == "2"
+
+
+def test_like_matches_wildcards_literally(client):
+    assert client.get("/jinjat_test/1.0/people", params={"name_like": "_o%"}).json() == \
+        [{"id": 2, "name": "b_o%b", "active": False}]
+
+
+def test_template_inputs_stay_template_inputs(client):
+    response = client.get("/jinjat_test/1.0/people", params={"max_id": 2, "name_like": "o"})
+    assert [row["id"] for row in response.json()] == [2]
+
+
+def test_filter_on_analysis_reading_all_params_is_rejected(client):
+    assert client.get("/jinjat_test/1.0/any_params", params={"id": 1}).status_code == 400
+    assert client.get("/jinjat_test/1.0/any_params", params={"x": 1}).json() == [{"id": 1, "params": 1}]
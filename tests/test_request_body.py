@@ -0,0 +1,53 @@
+import pytest
+from jsonschema.exceptions import SchemaError
+
+from jinjat.core.schema.validator import get_request_body_validator, validate_request_body
+from jinjat.core.util.api import JinjatErrorCode
+
+
+def operation(schema: dict) -> dict:
+    return {"requestBody": {"content": {"application/json": {"schema": schema}}}}
+
+
+def test_validator_is_built_from_the_body_schema():
+    assert get_request_body_validator({}) is None
+    with pytest.raises(SchemaError):
+        get_request_body_validator(operation({"type": "unknown"}))
+
+
+def test_defaults_are_filled_with_a_copy():
+    validator = get_request_body_validator(operation({
+        "type": "object",
+        "properties": {"tags": {"type": "array", "default": []}, "nested": {"type": "object"}},
+    }))
+    first, second = {}, {"nested": "not an object"}
+    assert validate_request_body(validator, first) == []
+    first["tags"].append("a")
+
+    errors = validate_request_body(validator, second)
+    assert second["tags"] == []
+    assert [(error.code, error.message) for error in errors] == \
+           [(JinjatErrorCode.InvalidRequestBody, "nested: 'not an object' is not of type 'object'")]
+    assert validate_request_body(validator, ["not", "an", "object"])[0].message == \
+           "body: ['not', 'an', 'object'] is not of type 'object'"
+
+
+def test_body_defaults_are_passed_to_the_analysis(client):
+    response = client.post("/jinjat_test/1.0/greeting", json={"name": "jinjat"})
+    assert response.status_code == 200
+    assert response.json() == [{"name": "jinjat", "times": 1, "tags": 0}]
+
+    response = client.post("/jinjat_test/1.0/greeting", json={"name": "jinjat", "times": 3, "tags": ["a", "b"]})
+    assert response.json() == [{"name": "jinjat", "times": 3, "tags": 2}]
+
+
+def test_invalid_body_is_rejected(client):
+    response = client.post("/jinjat_test/1.0/greeting", json={"name": "x'; drop table", "times": 0})
+    assert response.status_code == 422
+    errors = response.json()["errors"]
+    assert [error["code"] for error in errors] == [JinjatErrorCode.InvalidRequestBody] * 2
+    assert errors[0]["message"].startswith("name: ")
+    assert errors[1]["message"].startswith("times: 0 is less than the minimum")
+
+    assert client.post("/jinjat_test/1.0/greeting", json={}).json()["errors"][0]["message"] == \
+           "body: 'name' is a required property"
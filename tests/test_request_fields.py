@@ -0,0 +1,62 @@
+import pytest
+from dbt.clients.jinja import get_environment
+
+from jinjat.core.dbt.request_fields import RequestFieldsAnalyzer, get_request_key
+from jinjat.core.models import DbtQueryRequestContext
+
+
+@pytest.fixture
+def analyzer(dbt_project) -> RequestFieldsAnalyzer:
+    return RequestFieldsAnalyzer(get_environment(), dbt_project.dbt)
+
+
+@pytest.mark.parametrize("source,fields", [
+    ("select 1", set()),
+    ("select {{ jinjat_request.query.n }}", {("query", "n")}),
+    ("select {{ jinjat_request.query.get('max', 10) }}", {("query", "max")}),
+    ("select {{ jinjat_request['params']['id'] }}, {{ jinjat_request.body.a }}",
+     {("params", "id"), ("body", "a")}),
+    ("select '{{ tojson(jinjat_request.query) }}'", {("query",)}),
+    ("{% for key in jinjat_request.query.keys() %}{{ key }}{% endfor %}", {("query",)}),
+    ("select * from {{ ref('ephemeral_numbers') }} limit {{ jinjat_request.query.n }}", {("query", "n")}),
+    ("select * from range({{ range(3) | length }})", set()),
+])
+def test_request_fields_read_by_the_template(analyzer, source, fields):
+    assert analyzer.find_request_fields(source) == frozenset(fields)
+
+
+@pytest.mark.parametrize("source", [
+    "{% set result = run_query('select 1') %}select 1",
+    "select '{{ adapter.quote('id') }}'",
+    "select '{{ modules.datetime.datetime.now() }}'",
+    "select '{{ lipsum(1) }}'",
+    "select {{ undefined_macro() }}",
+])
+def test_non_deterministic_templates_are_not_cacheable(analyzer, source):
+    assert analyzer.find_request_fields(source) is None
+
+
+def test_request_macros_are_analysed(analyzer):
+    # the fixture project's `limit_query` macro reads nothing from the request
+    assert analyzer.find_request_fields("{{ limit_query('select 1', jinjat_request.query.n) }}") \
+           == frozenset({("query", "n")})
+
+
+def test_request_key_only_depends_on_the_fields_read():
+    fields = frozenset({("query", "n")})
+    key = get_request_key(fields, DbtQueryRequestContext(method="GET", body=None, query={"n": "1", "other": "a"}))
+    assert key == get_request_key(fields, DbtQueryRequestContext(method="GET", body=None, query={"n": "1"}))
+    assert key != get_request_key(fields, DbtQueryRequestContext(method="GET", body=None, query={"n": "2"}))
+
+
+def test_rendered_sql_is_cached_by_the_fields_read(dbt_project):
+    template = dbt_project.get_template(dbt_project.dbt.nodes["analysis.jinjat_test.numbers"])
+    cache = dbt_project.compiled_sql_cache
+    first = template.render(DbtQueryRequestContext(method="GET", body=None, query={"n": "7"}))
+    hits = cache.hits
+    second = template.render(DbtQueryRequestContext(method="GET", body=None, query={"n": "7", "other": "1"}))
+    assert cache.hits == hits + 1
+    assert second.compiled_sql == first.compiled_sql
+
+    other = template.render(DbtQueryRequestContext(method="GET", body=None, query={"n": "8"}))
+    assert "range(8)" in other.compiled_sql
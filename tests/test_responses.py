@@ -0,0 +1,28 @@
+import datetime
+import decimal
+import enum
+import json
+import uuid
+
+from jinjat.core.util.api import ORJSONResponse
+
+
+class Color(enum.Enum):
+    RED = "red"
+
+
+def test_orjson_response_serializes_database_values():
+    content = {"day": datetime.date(2023, 1, 2), "at": datetime.datetime(2023, 1, 2, 3, 4, 5),
+               "id": uuid.UUID(int=1), "amount": decimal.Decimal("1.5"), "color": Color.RED,
+               "raw": b"bytes", 1: "non string key"}
+    body = json.loads(ORJSONResponse(content).body)
+    assert body == {"day": "2023-01-02", "at": "2023-01-02T03:04:05", "id": str(uuid.UUID(int=1)),
+                    "amount": 1.5, "color": "red", "raw": "bytes", "1": "non string key"}
+
+
+def test_analysis_responses_are_rendered_as_json(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 3})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == [{"id": 0.0, "name": "name_0"}, {"id": 1.0, "name": "name_1"},
+                               {"id": 2.0, "name": "name_2"}]
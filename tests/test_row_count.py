@@ -0,0 +1,48 @@
+import time
+
+from jinjat.core.util.cache import LRUCache
+from jinjat.core.util.sql import get_explain_query, parse_explain_row_estimate
+
+POSTGRES_PLAN = """Hash Join  (cost=1.09..2.19 rows=42 width=8)
+  ->  Seq Scan on orders  (cost=0.00..1.05 rows=5 width=4)"""
+
+
+def test_entry_ttl_overrides_the_cache_ttl():
+    cache = LRUCache(10, ttl=60)
+    cache.put("short", 1, ttl=0.01)
+    cache.put("long", 2)
+    time.sleep(0.02)
+    assert cache.get("short") is None
+    assert cache.get("long") == 2
+
+
+def test_row_estimate_of_the_root_of_the_plan():
+    assert parse_explain_row_estimate(POSTGRES_PLAN, "postgres") == 42
+    assert parse_explain_row_estimate("│  ~1,000 rows  │", "duckdb") == 1000
+    assert parse_explain_row_estimate("Seq Scan", "postgres") is None
+
+
+def test_dialects_without_estimates():
+    assert get_explain_query("select 1", "snowflake") is None
+    assert get_explain_query("select 1;", "postgres") == "EXPLAIN select 1"
+
+
+def test_total_count_is_cached(client, dbt_project):
+    hits = dbt_project.row_count_cache.hits
+    for _ in range(2):
+        response = client.get("/jinjat_test/1.0/numbers", params={"n": 42, "_start": 0, "_end": 4})
+        assert response.headers["x-total-count"] == "42"
+        assert "x-total-count-estimated" not in response.headers
+    assert dbt_project.row_count_cache.hits == hits + 1
+
+
+def test_page_size_is_the_count_when_the_result_fits_in_the_page(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 3, "_start": 0, "_end": 10})
+    assert response.headers["x-total-count"] == "3"
+
+
+def test_estimated_total_count(client):
+    response = client.get("/jinjat_test/1.0/estimated", params={"_start": 0, "_end": 5})
+    assert len(response.json()) == 5
+    assert response.headers["x-total-count-estimated"] == "true"
+    assert int(response.headers["x-total-count"]) > 0
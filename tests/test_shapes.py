@@ -0,0 +1,28 @@
+COLUMNS = [{"name": "id", "type": "Number"}, {"name": "name", "type": "Text"}]
+
+
+def test_columns_shape(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 2, "_shape": "columns"})
+    assert response.status_code == 200
+    assert response.json() == {"columns": COLUMNS, "data": {"id": [0.0, 1.0], "name": ["name_0", "name_1"]}}
+
+
+def test_rows_shape_from_accept_header(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 2},
+                          headers={"Accept": "application/json; shape=rows"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json; shape=rows"
+    assert response.json() == {"columns": COLUMNS, "rows": [[0.0, "name_0"], [1.0, "name_1"]]}
+
+
+def test_rows_shape_of_empty_result(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 0, "_shape": "rows"})
+    body = response.json()
+    # dbt infers the column types from the values
+    assert [column["name"] for column in body["columns"]] == ["id", "name"]
+    assert body["rows"] == []
+
+
+def test_unknown_shape_is_rejected(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 2, "_shape": "matrix"})
+    assert response.status_code == 400
@@ -0,0 +1,46 @@
+import json
+import time
+
+from jinjat.core.util.jsonl import JsonlSink
+from jinjat.core.util.metrics import RequestMetrics
+from jinjat.core.util.slow_queries import SlowQueryLog
+
+
+def request_metrics(analysis: str, duration: float) -> RequestMetrics:
+    metrics = RequestMetrics("package", analysis)
+    metrics.started_at = time.perf_counter() - duration
+    return metrics
+
+
+def test_slowest_requests_of_each_analysis_are_kept():
+    log = SlowQueryLog(2)
+    for duration in [1.5, 3, 0.5, 2, 1]:
+        log.record(request_metrics("a", duration), {}, 200, threshold=1)
+    log.record(request_metrics("b", 10), {}, 200, threshold=1)
+    log.record(request_metrics("c", 10), {}, 200, threshold=None)
+
+    assert [round(entry["duration"] / 1000) for entry in log.entries()] == [10, 3, 2]
+    assert [entry["analysis"] for entry in log.entries("a")] == ["a", "a"]
+    assert log.logged == 5
+
+
+def test_entries_are_appended_to_the_file(tmp_path):
+    path = tmp_path / "logs" / "slow_queries.jsonl"
+    log = SlowQueryLog(1, JsonlSink(path))
+    log.record(request_metrics("a", 2), {"path": "/a"}, 200, threshold=1)
+    log.record(request_metrics("a", 1), {"path": "/a"}, 504, threshold=1)
+    log.close()
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["status_code"] for line in lines] == [200, 504]
+    assert lines[0]["path"] == "/a"
+
+
+def test_slow_requests_are_listed(client):
+    assert client.get("/jinjat_test/1.0/ephemeral").status_code == 200
+    entries = client.get("/admin/slow-queries", params={"analysis": "analysis.jinjat_test.ephemeral"}).json()["result"]
+    entry = entries[0]
+    assert entry["project"] == "jinjat_test"
+    assert entry["path"] == "/jinjat_test/1.0/ephemeral"
+    assert "__dbt__cte__ephemeral_numbers" in entry["sql"]
+    assert entry["rows"] == 5
+    assert "execute" in entry["phases"]
@@ -0,0 +1,52 @@
+import asyncio
+import datetime
+import decimal
+import json
+
+
+from jinjat.core.util.streaming import encode_rows
+
+
+async def _batches(*batches):
+    for batch in batches:
+        yield batch
+
+
+def _encode(stream_format, column_names, *batches) -> bytes:
+    async def run():
+        return b''.join([chunk async for chunk in encode_rows(stream_format, column_names, _batches(*batches))])
+
+    return asyncio.run(run())
+
+
+def test_rows_are_encoded_as_ndjson():
+    content = _encode('ndjson', ['id', 'value'], [(1, decimal.Decimal('1.5'))], [(2, datetime.date(2020, 1, 1))])
+    assert content.decode().splitlines() == ['{"id": 1, "value": 1.5}', '{"id": 2, "value": "2020-01-01"}']
+
+
+def test_rows_are_encoded_as_csv_with_a_header():
+    content = _encode('csv', ['id', 'name'], [(1, 'a,b')], [])
+    assert content.decode().splitlines() == ['id,name', '1,"a,b"']
+
+
+def test_analysis_rows_are_streamed_as_ndjson(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 2500, "_format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 2500
+    assert rows[-1] == {"id": 2499, "name": "name_2499"}
+
+
+def test_analysis_rows_are_streamed_as_csv_with_the_accept_header(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 3, "_start": 0, "_end": 2},
+                          headers={"accept": "text/csv"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["x-total-count"] == "3"
+    assert response.text.splitlines() == ["id,name", "0,name_0", "1,name_1"]
+
+
+def test_query_errors_are_returned_before_streaming(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": "x", "_format": "ndjson"})
+    assert response.status_code == 400
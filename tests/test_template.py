@@ -0,0 +1,45 @@
+from jinjat.core.models import DbtQueryRequestContext
+
+NUMBERS = "analysis.jinjat_test.numbers"
+
+
+def request_context(**query) -> DbtQueryRequestContext:
+    return DbtQueryRequestContext(method="GET", body=None, query=query)
+
+
+def test_template_is_compiled_once_per_manifest_version(dbt_project):
+    template = dbt_project.get_template(dbt_project.dbt.nodes[NUMBERS])
+    assert dbt_project.get_template(dbt_project.dbt.nodes[NUMBERS]) is template
+    version, _, compiled = template.prepare()
+
+    template.render(request_context(n="3"))
+    assert template.prepare() == (version, template.node, compiled)
+
+    dbt_project._version += 1
+    new_version, _, recompiled = template.prepare()
+    assert new_version == version + 1
+    assert recompiled is not compiled
+
+
+def test_template_is_rendered_with_the_request(dbt_project):
+    template = dbt_project.get_template(dbt_project.dbt.nodes[NUMBERS])
+    assert "range(3)" in template.render(request_context(n="3")).compiled_sql
+    assert "range(10)" in template.render(request_context()).compiled_sql
+
+
+def test_ephemeral_dependencies_are_compiled_by_dbt(dbt_project):
+    template = dbt_project.get_template(dbt_project.dbt.nodes["analysis.jinjat_test.ephemeral"])
+    _, _, compiled = template.prepare()
+    assert compiled is None
+    assert "__dbt__cte__ephemeral_numbers" in template.render(request_context()).compiled_sql
+
+
+def test_analysis_api_renders_the_template(client):
+    response = client.get("/jinjat_test/1.0/numbers", params={"n": 3})
+    assert response.status_code == 200
+    assert response.json() == [{"id": 0, "name": "name_0"}, {"id": 1, "name": "name_1"},
+                               {"id": 2, "name": "name_2"}]
+
+    response = client.get("/jinjat_test/1.0/ephemeral")
+    assert response.status_code == 200
+    assert [row["doubled"] for row in response.json()] == [0, 2, 4, 6, 8]
@@ -0,0 +1,78 @@
+from jinjat.core.models import TracingConfig
+from jinjat.core.util.tracing import InMemorySpanExporter, Tracer, parse_traceparent, trace_span, use_span
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+def test_traceparent_is_parsed():
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (TRACE_ID, PARENT_ID, True)
+    assert parse_traceparent(f" 00-{TRACE_ID.upper()}-{PARENT_ID}-00 ") == (TRACE_ID, PARENT_ID, False)
+    assert parse_traceparent(None) is None
+    assert parse_traceparent(f"01-{TRACE_ID}-{PARENT_ID}-01") is None
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}") is None
+    assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+    assert parse_traceparent(f"00-{TRACE_ID}-{'0' * 16}-01") is None
+
+
+def test_trace_of_the_caller_is_continued_unless_unsampled():
+    tracer = Tracer(InMemorySpanExporter(10))
+    span = tracer.start_span("root", f"00-{TRACE_ID}-{PARENT_ID}-01")
+    assert (span.trace_id, span.parent_id) == (TRACE_ID, PARENT_ID)
+    assert tracer.start_span("root", f"00-{TRACE_ID}-{PARENT_ID}-00") is None
+
+    new_trace = tracer.start_span("root", "invalid")
+    assert new_trace.trace_id != TRACE_ID and new_trace.parent_id is None
+
+
+def test_spans_form_a_tree_and_are_exported_when_they_end():
+    exporter = InMemorySpanExporter(10)
+    root = Tracer(exporter).start_span("root")
+    with trace_span("untraced") as untraced:
+        assert untraced is None
+
+    try:
+        with use_span(root):
+            with trace_span("child", {"key": "value"}):
+                with trace_span("grandchild"):
+                    raise ValueError("failed")
+    except ValueError:
+        pass
+
+    grandchild, child, exported_root = exporter.spans(root.trace_id)
+    assert [grandchild["name"], child["name"], exported_root["name"]] == ["grandchild", "child", "root"]
+    assert grandchild["parent_span_id"] == child["span_id"]
+    assert child["parent_span_id"] == exported_root["span_id"]
+    assert child["attributes"] == {"key": "value"}
+    assert grandchild["status"] == "error" and grandchild["error"] == "ValueError: failed"
+
+
+def test_span_buffer_is_bounded():
+    tracer = Tracer(InMemorySpanExporter(2))
+    for name in ["a", "b", "c"]:
+        tracer.start_span(name).end()
+    assert [span["name"] for span in tracer.exporter.spans()] == ["b", "c"]
+
+
+def test_analysis_request_is_traced(client, dbt_project):
+    dbt_project.configure_tracing(TracingConfig(enabled=True))
+    try:
+        response = client.get("/jinjat_test/1.0/numbers", params={"n": 5},
+                              headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+        assert response.status_code == 200
+        assert response.headers["traceresponse"].startswith(f"00-{TRACE_ID}-")
+
+        spans = client.get("/admin/traces", params={"trace_id": TRACE_ID}).json()["result"]
+        root = next(span for span in spans if span["parent_span_id"] == PARENT_ID)
+        assert root["name"] == "GET /jinjat_test/1.0/numbers"
+        assert root["attributes"]["http.status_code"] == 200
+        assert response.headers["traceresponse"] == f"00-{TRACE_ID}-{root['span_id']}-01"
+
+        names = {span["name"] for span in spans}
+        assert {"request.context", "adapter.execute"} <= names
+        assert all(span["trace_id"] == TRACE_ID for span in spans)
+    finally:
+        dbt_project.configure_tracing(TracingConfig())
+
+    assert "traceresponse" not in client.get("/jinjat_test/1.0/numbers", params={"n": 5}).headers
+    assert client.get("/admin/traces").json()["result"] == []
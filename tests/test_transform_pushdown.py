@@ -0,0 +1,50 @@
+import jmespath
+import pytest
+
+from jinjat.core.util.pushdown import TransformPushdown
+
+COLUMNS = {"id": "integer", "name": "varchar"}
+ROWS = [{"id": i, "name": f"name_{i}"} for i in range(10)]
+
+
+@pytest.mark.parametrize("expression, offset, limit, columns", [
+    ("[0]", 0, 1, None),
+    ("[3].name", 3, 1, ["name"]),
+    ("[2:5]", 2, 3, None),
+    ("[2:]", 2, None, None),
+    ("[1:9:3].id", 1, 8, ["id"]),
+    ("[*].{n: name}", 0, None, ["name"]),
+    ("[*].[id, name]", 0, None, ["id", "name"]),
+])
+def test_pushed_down_transform_matches_jmespath(expression, offset, limit, columns):
+    pushdown = TransformPushdown.from_expression(expression, COLUMNS)
+    assert (pushdown.offset, pushdown.limit, pushdown.columns) == (offset, limit, columns)
+    stop = offset + limit if limit is not None else None
+    assert pushdown.transform(ROWS[offset:stop]) == jmespath.search(expression, ROWS)
+
+
+@pytest.mark.parametrize("expression", [None, "[-1]", "[:-2]", "[::-1]", "length(@)", "[?id > `1`]", "[*]"])
+def test_transforms_that_need_the_whole_result(expression):
+    assert TransformPushdown.from_expression(expression, COLUMNS) is None
+
+
+def test_unknown_fields_are_not_pushed_down():
+    assert TransformPushdown.from_expression("[*].other", COLUMNS) is None
+    assert TransformPushdown.from_expression("[*].other", {}) is None
+
+
+def test_transform_selects_from_the_requested_rows():
+    pushdown = TransformPushdown.from_expression("[2:5]", COLUMNS)
+    assert pushdown.apply_limit(None, None) == (3, 2)
+    assert pushdown.apply_limit(4, 10) == (2, 12)
+    assert pushdown.apply_limit(1, None) == (0, 2)
+
+
+def test_index_transform_api(client):
+    assert client.get("/jinjat_test/1.0/fourth_id").json() == 3
+
+
+def test_slice_transform_api(client):
+    assert client.get("/jinjat_test/1.0/name_slice").json() == ["name_2", "name_4", "name_6"]
+    assert client.get("/jinjat_test/1.0/name_slice", params={"_start": 10}).json() == \
+        ["name_12", "name_14", "name_16"]